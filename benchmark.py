@@ -0,0 +1,531 @@
+# benchmark.py
+# Saqlash, statistika, admin route'lari va bot handlerlari uchun benchmarklar.
+#
+# Ishlatish:
+#   python benchmark.py --output bench-v1.json                   # ~9500 MFY
+#   python benchmark.py --mfy 2000 --repeat 5 --output quick.json
+#   python benchmark.py --output bench-v2.json --compare bench-v1.json
+#
+# Natija JSON hisobot: har bir o'lchov uchun min/median/mean/p95/max (ms), model guruhi
+# uchun esa xotira hajmi (memory_bytes).
+# --compare bilan median bo'yicha regressiyalar ko'rsatiladi (chegaradan oshsa exit code 1).
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+import generate_data
+
+# Repoda shablonlar bo'lmasa (templates/ deploy paytida qo'yiladi), sahifalar
+# shu oddiy shablon bilan render qilinadi - natijada "template_fallback" belgilanadi.
+FALLBACK_TEMPLATE = (
+    "{{ texts|length }} {{ data|length }} {{ stats }}"
+    "{% for row in (mfylar or tumanlar or xodimlar or activities or []) %}{{ row }}{% endfor %}"
+)
+TEMPLATE_NAMES = ['login.html', 'admin_dashboard.html', 'viloyatlar.html', 'tumanlar.html', 'mfylar.html',
+                  'lavozimlar.html', 'sozlamalar.html', 'faoliyat.html', 'xodimlar.html', 'hisobotlar.html', '404.html']
+
+
+class Bench:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+        self.memory = {}
+
+    def run(self, name, fn, repeat=None, warmup=1):
+        """fn(i) ni repeat marta chaqirib vaqtini o'lchaydi."""
+        repeat = repeat or self.repeat
+        for i in range(warmup):
+            fn(-1 - i)
+        timings = []
+        for i in range(repeat):
+            started = time.perf_counter()
+            fn(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.results[name] = {
+            'n': len(timings),
+            'min_ms': round(timings[0], 4),
+            'median_ms': round(statistics.median(timings), 4),
+            'mean_ms': round(statistics.fmean(timings), 4),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+            'max_ms': round(timings[-1], 4),
+        }
+        print(f"  {name:<40} median {self.results[name]['median_ms']:>10.3f} ms", file=sys.stderr)
+
+
+def _quiet():
+    # bot_with_admin har bir load/save da print qiladi - o'lchovga shovqin qo'shmasin
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _first_path(data):
+    for v, region in data.items():
+        for t, district in region['tumanlar'].items():
+            for m in district['mfylar']:
+                return v, t, m
+    raise SystemExit("Ma'lumotlar bo'sh")
+
+
+def bench_storage(b, bot, data):
+    v = next(iter(data))
+
+    def cold_load(i):
+        bot.STORE.invalidate()
+        regions = bot.load_data()
+        for name in regions:
+            regions[name]
+
+    def cold_load_one(i):
+        bot.STORE.invalidate()
+        bot.load_data()[v]
+
+    def cold_load_json(i):
+        # Binar nusxalarsiz: har bir shard JSON dan parse qilinadi
+        binary, bot.STORE.binary = bot.STORE.binary, None
+        try:
+            cold_load(i)
+        finally:
+            bot.STORE.binary = binary
+
+    b.run('storage.load_data', lambda i: bot.load_data())
+    b.run('storage.load_data (cold)', cold_load)
+    b.run('storage.load_data (cold, JSON)', cold_load_json)
+    b.run('storage.load_data (cold, one region)', cold_load_one)
+    loaded = bot.load_data()
+    b.run('stats.calculate_stats', lambda i: bot.calculate_stats(loaded))
+    b.run('reports.build_report', lambda i: bot.build_report(loaded))
+    b.run('reports.build_report (region vacancies)', lambda i: bot.build_report(loaded, v, lavozim='mfy_raisi'))
+    b.run('storage.save_data', lambda i: bot.save_data(loaded))
+    b.run('storage.save_data (one region)', lambda i: bot.save_data(loaded, v))
+
+
+def _heap_size(build):
+    """build() natijasi egallagan xotira (tracemalloc bo'yicha, baytlarda)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_model(b, bot, data):
+    # Oddiy dict daraxti va __slots__ li model: xotira, qurish va atributga kirish narxi
+    text = json.dumps(data, ensure_ascii=False)
+    typed = bot.regions_from_json(json.loads(text))
+    # Ikkalasi ham JSON matnidan quriladi - satrlar ham hisobga kiradi
+    dict_bytes = _heap_size(lambda: json.loads(text))
+    typed_bytes = _heap_size(lambda: bot.regions_from_json(json.loads(text)))
+    raw = json.loads(text)
+    b.memory['model.dict_tree'] = dict_bytes
+    # Eski format (har bir MFYda oltita lavozim, bo'shlari ham) bilan solishtirish
+    legacy = generate_data.generate(sum(len(d['mfylar']) for r in data.values() for d in r['tumanlar'].values()),
+                                    placeholders=True)
+    legacy_text = json.dumps(legacy, ensure_ascii=False)
+    b.memory['model.dict_tree (placeholders)'] = _heap_size(lambda: json.loads(legacy_text))
+    b.memory['model.json_chars (placeholders)'] = len(legacy_text)
+    b.memory['model.json_chars'] = len(text)
+    b.memory['model.typed_tree'] = typed_bytes
+    print(f"  {'model memory dict / typed':<40} {dict_bytes / 2 ** 20:>8.2f} / {typed_bytes / 2 ** 20:.2f} MiB",
+          file=sys.stderr)
+
+    def dict_access(i):
+        n = 0
+        for region in raw.values():
+            for district in region['tumanlar'].values():
+                for mfy in district['mfylar'].values():
+                    for xodim in mfy['xodimlar'].values():
+                        if xodim['ism'] and xodim['holat'] == 'faol':
+                            n += len(xodim['telefon'])
+        return n
+
+    def typed_access(i):
+        n = 0
+        for region in typed.values():
+            for district in region.tumanlar.values():
+                for mfy in district.mfylar.values():
+                    for xodim in mfy.xodimlar.values():
+                        if xodim.ism and xodim.holat is bot.Holat.FAOL:
+                            n += len(xodim.telefon)
+        return n
+
+    if dict_access(0) != typed_access(0):
+        raise RuntimeError("dict va model natijalari farq qiladi")
+    if bot.regions_to_json(typed) != raw:
+        raise RuntimeError("regions_to_json ma'lumotni o'zgartirdi")
+    b.run('model.access dict', dict_access)
+    b.run('model.access typed', typed_access)
+    b.run('model.regions_from_json', lambda i: bot.regions_from_json(raw))
+    b.run('model.regions_to_json', lambda i: bot.regions_to_json(typed))
+
+
+# Ustunli jadvalgacha bo'lgan sikllar (solishtirish uchun)
+def _loop_totals(data):
+    districts = neighborhoods = staff = 0
+    for region in list(data.values()):
+        districts += len(region.tumanlar)
+        for district in list(region.tumanlar.values()):
+            neighborhoods += len(district.mfylar)
+            for neighborhood in list(district.mfylar.values()):
+                for xodim in list(neighborhood.xodimlar.values()):
+                    if xodim.ism and xodim.ism.strip():
+                        staff += 1
+    return len(data), districts, neighborhoods, staff
+
+
+def _loop_position_counts(data):
+    counts = {}
+    for region in list(data.values()):
+        for district in list(region.tumanlar.values()):
+            for mfy in list(district.mfylar.values()):
+                for lavozim, xodim in mfy.lavozimlar().items():
+                    counts.setdefault(lavozim, 0)
+                    if xodim.ism and xodim.ism.strip():
+                        counts[lavozim] += 1
+    return counts
+
+
+def _loop_vacancies(data, lavozim):
+    return [(v, t, m) for v, region in list(data.items())
+            for t, district in list(region.tumanlar.items())
+            for m, mfy in list(district.mfylar.items())
+            if not (mfy.xodimlar.get(lavozim) and (mfy.xodimlar[lavozim].ism or '').strip())]
+
+
+def _built_table(bot, loaded):
+    table = bot.StaffTable()
+    table.totals(loaded)
+    return table
+
+
+def bench_columns(b, bot, data):
+    # 9500 MFY x 6 lavozim ~ 57k qator: sikllar va ustunli jadval (NumPy yoki array) solishtiriladi
+    loaded = bot.load_data()
+    table = bot.STAFF_TABLE
+    assert table.totals(loaded) == dict(zip(
+        ('total_regions', 'total_districts', 'total_neighborhoods', 'total_staff'), _loop_totals(loaded)))
+    assert table.position_counts(loaded) == _loop_position_counts(loaded)
+    assert len(table.select(loaded, lavozim='mfy_raisi', filled=False)) == len(_loop_vacancies(loaded, 'mfy_raisi'))
+    b.memory['columns.rows'] = table.rows()
+    b.memory['columns.table'] = _heap_size(lambda: _built_table(bot, loaded))
+
+    b.run('columns.build', lambda i: _built_table(bot, loaded))
+    b.run('columns.totals (loop)', lambda i: _loop_totals(loaded))
+    b.run('columns.totals', lambda i: table.totals(loaded))
+    b.run('columns.position_counts (loop)', lambda i: _loop_position_counts(loaded))
+    b.run('columns.position_counts', lambda i: table.position_counts(loaded))
+    b.run('columns.vacancies (loop)', lambda i: _loop_vacancies(loaded, 'mfy_raisi'))
+    b.run('columns.vacancies', lambda i: table.select(loaded, lavozim='mfy_raisi', filled=False))
+    b.run('columns.nofaol staff', lambda i: table.select(loaded, holat='nofaol'))
+
+
+def _scan_nearest(bot, points, lat, lon, limit):
+    return sorted((bot.masofa_km(lat, lon, p_lat, p_lon), v, t, m) for p_lat, p_lon, v, t, m in points)[:limit]
+
+
+def _geo_queries(n, seed):
+    rng = random.Random(seed)
+    centers = list(generate_data.CENTERS.values())
+    return [(rng.gauss(lat, 0.3), rng.gauss(lon, 0.3)) for lat, lon in (rng.choice(centers) for _ in range(n))]
+
+
+def bench_geo(b, bot, data, seed):
+    # Joylashuvi bor MFYlar (~90%) alohida generatsiya qilinadi - asosiy ma'lumotlar o'zgarmaydi
+    mfy_total = sum(len(d['mfylar']) for r in data.values() for d in r['tumanlar'].values())
+    regions = bot.regions_from_json(generate_data.generate(mfy_total, seed, coord_rate=0.9))
+    index = bot.MfyLocationIndex()
+    index.sync(regions)
+    points = [entry for cell in index.cells.values() for entry in cell]
+    queries = _geo_queries(1000, seed)
+    for lat, lon in queries[:50]:
+        expected = [row for row in _scan_nearest(bot, points, lat, lon, 3) if row[0] <= bot.NEAREST_MAX_KM]
+        if index.nearest(regions, lat, lon, 3) != expected:
+            raise RuntimeError(f"nearest({lat}, {lon}) skan natijasidan farq qiladi")
+    b.memory['geo.points'] = index.points
+
+    def build(i):
+        fresh = bot.MfyLocationIndex()
+        fresh.sync(regions)
+
+    b.run('geo.build', build)
+    b.run('geo.nearest x100 (scan)', lambda i: [_scan_nearest(bot, points, lat, lon, 3) for lat, lon in queries[:100]])
+    b.run('geo.nearest x1000', lambda i: [index.nearest(regions, lat, lon, 3) for lat, lon in queries])
+
+
+def bench_codec(b, bot, data):
+    # Har bir o'rnatilgan kodek: data.json (ixcham / indent=2) yozish va o'qish
+    raw = bot.regions_to_json(bot.load_data())
+    for name in bot.JSON_CODECS:
+        try:
+            codec = bot.make_json_codec(name)
+        except ImportError:
+            print(f"  codec.{name:<34} o'rnatilmagan", file=sys.stderr)
+            continue
+        compact = codec.dumps(raw)
+        pretty = codec.dumps(raw, pretty=True)
+        if codec.loads(compact) != raw:
+            raise RuntimeError(f"{name}: loads(dumps(x)) != x")
+        b.memory[f'codec.{name}.compact_bytes'] = len(compact)
+        b.memory[f'codec.{name}.pretty_bytes'] = len(pretty)
+        b.run(f'codec.{name}.dumps', lambda i, codec=codec: codec.dumps(raw))
+        b.run(f'codec.{name}.dumps pretty', lambda i, codec=codec: codec.dumps(raw, pretty=True))
+        b.run(f'codec.{name}.loads', lambda i, codec=codec, payload=compact: codec.loads(payload))
+
+
+def _client(bot):
+    from jinja2 import ChoiceLoader, DictLoader
+
+    fallback = False
+    for name in TEMPLATE_NAMES:
+        if not os.path.exists(os.path.join(REPO_DIR, 'templates', name)):
+            fallback = True
+    bot.app.jinja_loader = ChoiceLoader([
+        bot.app.jinja_loader,
+        DictLoader({name: FALLBACK_TEMPLATE for name in TEMPLATE_NAMES})
+    ])
+    bot.app.jinja_env.loader = bot.app.jinja_loader
+    client = bot.app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+        sess['username'] = 'benchmark'
+        sess['role'] = 'super_admin'
+        sess['language'] = 'uz'
+    return client, fallback
+
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.path}: HTTP {response.status_code}")
+    if response.is_json and isinstance(response.json, dict) and response.json.get('success') is False:
+        raise RuntimeError(f"{response.request.path}: {response.json.get('message')}")
+    return response
+
+
+def bench_routes(b, client, data):
+    v, t, m = _first_path(data)
+    query = {'viloyat': v, 'tuman': t, 'mahalla': m}
+    pages = ['/admin', '/admin/viloyatlar', '/admin/tumanlar', '/admin/mfylar', '/admin/lavozimlar',
+             '/admin/sozlamalar', '/admin/faoliyat', '/admin/hisobotlar']
+    for path in pages:
+        b.run(f"route.GET {path}", lambda i, path=path: _check(client.get(path)))
+    b.run('route.GET /admin/xodimlar', lambda i: _check(client.get('/admin/xodimlar', query_string=query)))
+    b.run('route.GET /admin/get_tumanlar', lambda i: _check(client.get('/admin/get_tumanlar', query_string=query)))
+    b.run('route.GET /admin/get_mahallalar', lambda i: _check(client.get('/admin/get_mahallalar', query_string=query)))
+    b.run('route.GET /admin/get_xodimlar', lambda i: _check(client.get('/admin/get_xodimlar', query_string=query)))
+    b.run('route.GET /admin/get_hisobot', lambda i: _check(client.get(
+        '/admin/get_hisobot', query_string={'viloyat': v, 'lavozim': 'mfy_raisi'})))
+    metrics_headers = {'Authorization': f"Bearer {os.environ['METRICS_TOKEN']}"}
+    b.run('route.GET /metrics', lambda i: _check(client.get('/metrics', headers=metrics_headers)))
+
+    # Siqish: birinchi so'rov siqadi, keyingilari (tana o'zgarmagan) keshdan oladi
+    gzip_headers = {'Accept-Encoding': 'gzip'}
+    for path in ('/admin/mfylar', '/admin/lavozimlar'):
+        plain = _check(client.get(path)).get_data()
+        packed = _check(client.get(path, headers=gzip_headers))
+        b.memory[f'route.{path}.bytes'] = len(plain)
+        b.memory[f'route.{path}.gzip_bytes'] = len(packed.get_data())
+        b.run(f"route.GET {path} (gzip)", lambda i, path=path: _check(client.get(path, headers=gzip_headers)))
+
+    # O'zgartiruvchi route'lar juft-juft: qo'shilgan yozuvlar oxirida o'chiriladi
+    def post(path, payload):
+        return _check(client.post(path, json=payload))
+
+    steps = [
+        ('add_viloyat', lambda i: {'viloyat_nomi': f'Bench viloyat {i}'}),
+        ('update_viloyat', lambda i: {'old_viloyat_nomi': f'Bench viloyat {i}', 'new_viloyat_nomi': f'Bench viloyat {i}r',
+                                      'viloyat_turi': 'viloyat'}),
+        ('add_tuman', lambda i: {'viloyat_nomi': v, 'tuman_nomi': f'Bench tuman {i}'}),
+        ('update_tuman', lambda i: {'old_viloyat_nomi': v, 'old_tuman_nomi': f'Bench tuman {i}', 'viloyat_nomi': v,
+                                    'new_tuman_nomi': f'Bench tuman {i}r', 'tuman_turi': 'tuman'}),
+        ('add_mahalla', lambda i: {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': f'Bench MFY {i}'}),
+        ('update_mahalla', lambda i: {'old_viloyat_nomi': v, 'old_tuman_nomi': t, 'old_mahalla_nomi': f'Bench MFY {i}',
+                                      'viloyat_nomi': v, 'tuman_nomi': t, 'new_mahalla_nomi': f'Bench MFY {i}r'}),
+        ('toggle_mahalla_status', lambda i: {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': f'Bench MFY {i}r',
+                                             'new_status': 'nofaol'}),
+        ('add_xodim', lambda i: {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': f'Bench MFY {i}r',
+                                 'lavozim': 'mfy_raisi', 'ism': 'Bench Xodim', 'telefon': f'+99890{i:07d}'}),
+        ('update_xodim', lambda i: {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': f'Bench MFY {i}r',
+                                    'lavozim_old': 'mfy_raisi', 'lavozim': 'mfy_raisi', 'ism': 'Bench Xodim 2',
+                                    'telefon': f'+99891{i:07d}', 'holat': 'faol'}),
+        ('delete_xodim', lambda i: {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': f'Bench MFY {i}r',
+                                    'lavozim': 'mfy_raisi'}),
+        ('delete_mahalla', lambda i: {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': f'Bench MFY {i}r'}),
+        ('delete_tuman', lambda i: {'viloyat_nomi': v, 'tuman_nomi': f'Bench tuman {i}r'}),
+        ('delete_viloyat', lambda i: {'viloyat_nomi': f'Bench viloyat {i}r'}),
+    ]
+    for endpoint, payload in steps:
+        b.run(f"route.POST /admin/{endpoint}",
+              lambda i, endpoint=endpoint, payload=payload: post(f'/admin/{endpoint}', payload(i)), warmup=0)
+
+
+class _FakeQuery:
+    def __init__(self, data, message_id):
+        self.data = data
+        self.message = SimpleNamespace(chat_id=1, message_id=message_id)
+        self.inline_message_id = None
+        self.from_user = SimpleNamespace(id=message_id, first_name='Bench')
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, *args, **kwargs):
+        return True
+
+
+class _FakeMessage:
+    chat_id = 1
+    message_id = 1
+
+    async def reply_text(self, *args, **kwargs):
+        return self
+
+
+def bench_bot(b, bot, data):
+    v, t, m = _first_path(data)
+    loop = asyncio.new_event_loop()
+    counter = iter(range(10 ** 9))
+
+    def callback(payload):
+        # Har safar yangi message_id - render keshi o'lchovni qisqartirmasin
+        update = SimpleNamespace(callback_query=_FakeQuery(payload, next(counter)), effective_user=None)
+        loop.run_until_complete(bot.button_handler(update, None))
+
+    def command(handler):
+        update = SimpleNamespace(message=_FakeMessage(), callback_query=None,
+                                 effective_user=SimpleNamespace(id=1, first_name='Bench'))
+        loop.run_until_complete(handler(update, None))
+
+    b.run('bot.VIL', lambda i: callback(f'VIL|{v}'))
+    b.run('bot.TUM', lambda i: callback(f'TUM|{v}|{t}'))
+    b.run('bot.MAH', lambda i: callback(f'MAH|{v}|{t}|{m}'))
+    b.run('bot.BACK', lambda i: callback('BACK|HOME'))
+    b.run('bot./start', lambda i: command(bot.start))
+    b.run('bot./stats', lambda i: command(bot.stats_command))
+    loop.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline, threshold):
+    regressions = []
+    print(f"\n{'olchov':<40} {'oldin':>10} {'hozir':>10} {'farq':>8}")
+    for name, result in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] else 1.0
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = ' ⚠️'
+            regressions.append(name)
+        print(f"{name:<40} {old['median_ms']:>10.3f} {result['median_ms']:>10.3f} {(ratio - 1) * 100:>+7.1f}%{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Mahalla benchmarklari")
+    parser.add_argument('--mfy', type=int, default=9500, help="sun'iy ma'lumotlardagi MFYlar soni")
+    parser.add_argument('--users', type=int, default=50000, help="obunachilar soni")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help="JSON hisobot fayli")
+    parser.add_argument('--compare', help="oldingi JSON hisobot bilan solishtirish")
+    parser.add_argument('--threshold', type=float, default=0.15, help="regressiya chegarasi (0.15 = 15%%)")
+    parser.add_argument('--only', help="faqat shu prefiksli o'lchovlar guruhi (storage, route, bot ...)")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = tempfile.mkdtemp(prefix='smartmahalla-bench-')
+    os.chdir(workdir)
+    data = generate_data.generate(args.mfy, args.seed)
+    with open('data.json', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open('subscribers.json', 'w', encoding='utf-8') as f:
+        json.dump(generate_data.generate_subscribers(data, args.users, args.seed), f)
+    print(f"📁 {workdir}: {generate_data.summary(data)}", file=sys.stderr)
+
+    # /metrics faqat token bilan ochiladi
+    os.environ.setdefault('METRICS_TOKEN', 'benchmark')
+    with _quiet():
+        import bot_with_admin as bot
+    import logging
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    b = Bench(args.repeat)
+    groups = {
+        'storage': lambda: bench_storage(b, bot, data),
+        'model': lambda: bench_model(b, bot, data),
+        'codec': lambda: bench_codec(b, bot, data),
+        'columns': lambda: bench_columns(b, bot, data),
+        'geo': lambda: bench_geo(b, bot, data, args.seed),
+        'route': lambda: bench_routes(b, client, data),
+        'bot': lambda: bench_bot(b, bot, data),
+    }
+    client, fallback = _client(bot)
+    with _quiet():
+        for group, fn in groups.items():
+            if args.only and not group.startswith(args.only):
+                continue
+            print(f"⏱️  {group}", file=sys.stderr)
+            fn()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dataset': dict(generate_data.summary(data), users=args.users, seed=args.seed),
+            'repeat': args.repeat,
+            'template_fallback': fallback,
+            'json_codec': bot.JSON_CODEC.name,
+            'columns_backend': bot.STAFF_TABLE.kernels.name,
+        },
+        'results': b.results,
+        'memory_bytes': b.memory
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Hisobot: {output}", file=sys.stderr)
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} ta regressiya: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,92 @@
 # bot_with_admin.py
+from __future__ import annotations
+import time
+STARTUP_STARTED = time.perf_counter()
 import logging
 import json
 import os
 import sys
 import subprocess
-import time
+import shutil
 import signal
 import atexit
 import asyncio
 import threading
 import secrets
+import socket
+import struct
+import mmap
 from datetime import datetime, timedelta
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import Flask, render_template as flask_render_template, request, jsonify, session, redirect, url_for, send_file, g
+from flask.json.provider import DefaultJSONProvider
 from functools import wraps
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping, MutableMapping
+from enum import Enum
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import parse_cookie
+from itsdangerous import BadSignature
 import csv
 import io
+import cProfile
+import itertools
+import contextvars
+import math
+import bisect
+import heapq
+import re
+import base64
+import hashlib
+import hmac
+import gzip
+import urllib.parse
+import weakref
+import marshal
+from array import array
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+def import_telegram():
+    """telegram paketi (httpx bilan ~0.3 s) faqat bot yoki xabarnoma yuborish kerak bo'lganda yuklanadi:
+    RUN_MODE=admin/web jarayonlari uni birinchi xabarnomagacha import qilmaydi."""
+    global Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update, BadRequest, Forbidden, NetworkError, RetryAfter
+    global TelegramError
+    global HTTPXRequest, ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, filters
+    from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+    from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+    from telegram.request import HTTPXRequest
+    from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, filters
+
+class StartupTimer:
+    """Ishga tushish bosqichlari: mark(nom) oldingi belgidan beri o'tgan vaqtni yozadi, report() - bitta qator log."""
+
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+        self.notes = {}
+        self.reported = False
+
+    def mark(self, name, note=None):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+        if note:
+            self.notes[name] = note
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        parts = [f"{name} {elapsed * 1000:.0f} ms" + (f" ({self.notes[name]})" if name in self.notes else '')
+                 for name, elapsed in self.phases]
+        print(f"⏱️ Ishga tushish {(self.last - self.started) * 1000:.0f} ms: {', '.join(parts)}")
+
+STARTUP = StartupTimer(STARTUP_STARTED)
+STARTUP.mark('importlar')
 
 # Logger sozlamalari
 logging.basicConfig(
@@ -28,9 +97,129 @@ logger = logging.getLogger(__name__)
 
 # Ma'lumotlar bazasi fayllari
 DATA_FILE = "data.json"
+# Viloyatlar bo'yicha shardlar (data.json birinchi ishga tushishda shu yerga ko'chiriladi)
+DATA_DIR = os.environ.get('DATA_DIR', "data")
+DATA_MEMORY_MB = float(os.environ.get('DATA_MEMORY_MB', 256))
+# Shardlarning binar (marshal) nusxalari: data/cache/ - JSON xeshi mos kelsa parse qilinmaydi (DATA_BINARY_CACHE=0 - o'chirish)
+DATA_BINARY_CACHE = os.environ.get('DATA_BINARY_CACHE', '1') == '1'
+# Viloyat yozish qulflari: nomlar xesh bo'yicha shuncha qulfga (data/locks/stripe-N.lock) taqsimlanadi
+REGION_LOCK_STRIPES = max(int(os.environ.get('REGION_LOCK_STRIPES', 64)), 1)
 ADMINS_FILE = "admins.json"
 SETTINGS_FILE = "settings.json"
 ACTIVITY_FILE = "activity.json"
+SUBSCRIBERS_FILE = "subscribers.json"
+BROADCASTS_FILE = "broadcasts.json"
+BROADCAST_LOG_FILE = "broadcasts.log"
+
+# Telegram sozlamalari
+BOT_TOKEN = os.environ.get('BOT_TOKEN', "7953323094:AAE81rkkc8oAb5tp8W2dTCLJy55NRxlm_rs")
+# Mahalliy sinov uchun: TELEGRAM_API_URL=http://localhost:8081/bot (fake_telegram_api.py)
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', "https://api.telegram.org/bot")
+
+# Ishga tushirish rejimi: all - admin panel va bot bitta jarayonda (odatiy),
+# supervisor - admin panel va bot(lar) alohida jarayonlarda, admin/bot - supervisor ishga tushiradigan jarayonlar,
+# async - admin panel va bot bitta event loopda (bitta thread).
+# BOT_TOKENS=token1,token2 - har bir token uchun alohida bot jarayoni (bitta tokenni faqat bitta jarayon poll qila oladi)
+RUN_MODE = os.environ.get('RUN_MODE', 'all')
+BOT_TOKENS = [t.strip() for t in os.environ.get('BOT_TOKENS', '').split(',') if t.strip()] or [BOT_TOKEN]
+BOT_WORKER = int(os.environ.get('BOT_WORKER', 0))
+if RUN_MODE not in ('admin', 'web', 'supervisor'):
+    import_telegram()
+    STARTUP.mark('telegram')
+# Jarayonlararo xabarlar (UDP, 127.0.0.1): admin - IPC_PORT, i-bot - IPC_PORT + 1 + i.
+# Har bir datagramma HMAC bilan imzolanadi: kalit IPC_SECRET yoki DATA_DIR/ipc.key (0600, birinchi jarayon yaratadi)
+IPC_PORT = int(os.environ.get('IPC_PORT', 47200))
+IPC_SECRET = os.environ.get('IPC_SECRET', '')
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(DATA_DIR, 'snapshots'))
+SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', 3))
+# Xabar yo'qolsa ham bot CURRENT faylini shu oraliqda tekshiradi
+SNAPSHOT_POLL_INTERVAL = float(os.environ.get('SNAPSHOT_POLL_INTERVAL', 5))
+
+# Fayl kuzatuvchisi: manifest/shardlar, data.json, admins/settings/activity boshqa jarayon yoki operator
+# tomonidan o'zgartirilsa keshlar bir marta yangilanadi, har so'rovda fayllar stat qilinmaydi.
+# WATCH_BACKEND: auto - Linuxda inotify, aks holda WATCH_POLL_INTERVAL oralig'ida stat; WATCH_FILES=0 - o'chirish
+WATCH_FILES = os.environ.get('WATCH_FILES', '1') == '1'
+WATCH_BACKEND = os.environ.get('WATCH_BACKEND', 'auto')
+WATCH_DEBOUNCE = float(os.environ.get('WATCH_DEBOUNCE', 0.05))
+WATCH_POLL_INTERVAL = float(os.environ.get('WATCH_POLL_INTERVAL', 1.0))
+
+# Admin panel HTTP serveri: auto - gunicorn (bo'lsa), keyin waitress, oxirida Flask/werkzeug dev serveri.
+# Gunicorn: WEB_WORKERS jarayon x WEB_THREADS thread, SIGHUP - workerlarni navbat bilan qayta ishga tushirish.
+WEB_SERVER = os.environ.get('WEB_SERVER', 'auto')
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 0)) or min(2 * (os.cpu_count() or 1) + 1, 8)
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 4))
+WEB_KEEPALIVE = int(os.environ.get('WEB_KEEPALIVE', 5))
+WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 30))
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+WEB_MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+# asyncio serveri (RUN_MODE=async, SSE) qabul qiladigan so'rov tanasining chegarasi - kattasiga 413
+WEB_MAX_BODY = int(float(os.environ.get('WEB_MAX_BODY_MB', 16)) * 1024 * 1024)
+
+# Javoblarni siqish: HTML/JSON/matn javoblari COMPRESS_MIN_SIZE baytdan katta bo'lsa, brauzer qabul qilsa -
+# brotli (paket o'rnatilgan bo'lsa) yoki gzip. Siqilgan tanalar tana xeshi bo'yicha COMPRESS_CACHE_MB
+# hajmdagi keshda saqlanadi - o'zgarmagan sahifa har so'rovda qayta siqilmaydi. COMPRESSION=0 - o'chirish
+COMPRESSION = os.environ.get('COMPRESSION', '1') == '1'
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+COMPRESS_CACHE_MB = float(os.environ.get('COMPRESS_CACHE_MB', 32))
+
+# Admin panel uchun jonli yangilanishlar (Server-Sent Events): statistika o'zgarishlari va yangi faoliyat.
+# Ulanishlar bitta threaddagi asyncio serverida (ulanishga thread ajratilmaydi), LIVE_PORT da (0 - PORT + 1);
+# RUN_MODE=async da asosiy serverning o'zida. LIVE_EVENTS=0 - o'chirish
+LIVE_EVENTS = os.environ.get('LIVE_EVENTS', '1') == '1'
+LIVE_PORT = int(os.environ.get('LIVE_PORT', 0))
+LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT', 15))
+LIVE_DEBOUNCE = float(os.environ.get('LIVE_DEBOUNCE', 0.25))
+
+# Sog'liq tekshiruvi: /healthz (jarayon va undagi bot tirikmi) va /readyz (so'rovlarga tayyormi).
+# Botni ishlatayotgan jarayon holatini HEALTH_DIR ga HEALTH_INTERVAL da yozib turadi - HTTP so'rovlarga boshqa
+# jarayon (gunicorn worker, RUN_MODE=admin) xizmat qilsa ham bot holati ko'rinadi. Oxirgi muvaffaqiyatli
+# getUpdates BOT_POLL_STALE soniyadan eski yoki event loop kechikishi HEALTH_MAX_LOOP_LAG dan katta - bot tirik emas
+HEALTH_DIR = os.environ.get('HEALTH_DIR', os.path.join(DATA_DIR, 'health'))
+HEALTH_INTERVAL = float(os.environ.get('HEALTH_INTERVAL', 5))
+BOT_POLL_STALE = float(os.environ.get('BOT_POLL_STALE', 60))
+HEALTH_MAX_LOOP_LAG = float(os.environ.get('HEALTH_MAX_LOOP_LAG', 2.0))
+
+# Bot ekranlari keshi (takroriy edit_message_text chaqiruvlarini o'tkazib yuborish)
+RENDER_CACHE_SIZE = int(os.environ.get('RENDER_CACHE_SIZE', 10000))
+RENDER_CACHE_TTL = float(os.environ.get('RENDER_CACHE_TTL', 3600))
+
+# Xabarnoma limitlari (Telegram: ~30 xabar/soniya umumiy, 1 xabar/soniya bitta chatga)
+BROADCAST_GLOBAL_RATE = float(os.environ.get('BROADCAST_GLOBAL_RATE', 25))
+BROADCAST_CHAT_INTERVAL = float(os.environ.get('BROADCAST_CHAT_INTERVAL', 1.0))
+BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', 8))
+BROADCAST_MAX_RETRIES = int(os.environ.get('BROADCAST_MAX_RETRIES', 5))
+# Xabarnoma butunlay yiqilsa (kutilmagan xato) shuncha marta qayta boshlanadi, keyin 'xato' holatida qoladi
+BROADCAST_JOB_RETRIES = int(os.environ.get('BROADCAST_JOB_RETRIES', 5))
+# broadcasts.json da saqlanadigan tugagan xabarnomalar (eng yangilari)
+BROADCASTS_KEEP = int(os.environ.get('BROADCASTS_KEEP', 100))
+
+# Xodimlar jadvalining ustunli ko'rinishi (guruhlab sanash, filtrlar): auto - NumPy o'rnatilgan bo'lsa
+# u, aks holda array modulidagi ustunlar ustida sof Python (numpy | array)
+COLUMNS_BACKEND = os.environ.get('COLUMNS_BACKEND', 'auto')
+
+# Eng yaqin MFY (botga yuborilgan joylashuv bo'yicha): koordinatali MFYlar GEO_CELL_DEG gradusli kataklarga
+# bo'lingan xotiradagi indeksda; NEAREST_MAX_KM dan uzoqdagilari ko'rsatilmaydi
+GEO_CELL_DEG = float(os.environ.get('GEO_CELL_DEG', 0.05))
+NEAREST_MAX_KM = float(os.environ.get('NEAREST_MAX_KM', 50))
+NEAREST_LIMIT = int(os.environ.get('NEAREST_LIMIT', 3))
+
+# O'zgarishlar lentasi (shahar portali, call-markaz, replikalar): har bir qo'shish/tahrirlash/o'chirish tartib
+# raqamli hodisa bo'lib CHANGES_FILE ga yoziladi. /api/changes?since=N - N dan keyingi hodisalar (yangisi
+# bo'lmasa CHANGES_MAX_WAIT soniyagacha kutadi), /api/changes/snapshot - to'liq holat va uning raqami.
+# Oxirgi CHANGES_KEEP ta hodisa saqlanadi; CHANGES_TOKEN - sessiyasiz kirish (Authorization: Bearer)
+CHANGES_FILE = os.environ.get('CHANGES_FILE', os.path.join(DATA_DIR, 'changes.log'))
+CHANGES_KEEP = int(os.environ.get('CHANGES_KEEP', 20000))
+CHANGES_MAX_WAIT = float(os.environ.get('CHANGES_MAX_WAIT', 25))
+CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', 0.5))
+CHANGES_MAX_WAITERS = int(os.environ.get('CHANGES_MAX_WAITERS', 16))
+CHANGES_TOKEN = os.environ.get('CHANGES_TOKEN', '')
+
+# Profillash
+PROFILING = os.environ.get('PROFILING', '0') == '1'
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 500))
+PROFILE_SAMPLE_N = int(os.environ.get('PROFILE_SAMPLE_N', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
 
 # Standart sozlamalar
 DEFAULT_SETTINGS = {
@@ -42,38 +231,1685 @@ DEFAULT_SETTINGS = {
     "system_name": "Smart Mahallah"
 }
 
+# Monitoring (Prometheus formatidagi /metrics)
+# METRICS_TOKEN o'rnatilmagan bo'lsa /metrics yopiq (404); so'rovchi Authorization: Bearer yuboradi
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Hisoblagichlar qulfsiz yangilanadi: GIL ostida bitta yo'qolgan inkrement
+# monitoring uchun ahamiyatsiz, qulf esa har bir so'rovga qo'shimcha xarajat.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        # Oxirgi katak +Inf uchun
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+
+class Metrics:
+    def __init__(self):
+        self.help = {}
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def histogram(self, name, labels):
+        key = (name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms.setdefault(key, Histogram())
+        return hist
+
+    def observe(self, name, value, labels=()):
+        self.histogram(name, labels).observe(value)
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def collect(self, name, kind, text, fn):
+        """Qiymati /metrics so'ralganda hisoblanadigan metrika."""
+        self.describe(name, kind, text)
+        self.gauges[name] = fn
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines = []
+        by_name = {}
+        for (name, labels), hist in list(self.histograms.items()):
+            by_name.setdefault(name, []).append((labels, hist))
+        for name, series in sorted(by_name.items()):
+            kind, text = self.help.get(name, ('histogram', name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                cumulative = 0
+                counts = list(hist.counts)
+                for bound, count in zip(LATENCY_BUCKETS, counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                cumulative += counts[-1]
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels)} {hist.sum:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+        by_name = {}
+        for (name, labels), value in list(self.counters.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        for name, series in sorted(by_name.items()):
+            kind, text = self.help.get(name, ('counter', name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                lines.append(f"{name}{self._labels(labels)} {value}")
+        for name, fn in sorted(self.gauges.items()):
+            try:
+                values = fn()
+            except Exception:
+                continue
+            if not isinstance(values, list):
+                values = [((), values)]
+            kind, text = self.help[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                lines.append(f"{name}{self._labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+METRICS.describe('smartmahalla_http_request_duration_seconds', 'histogram', "Admin panel so'rovlari davomiyligi")
+METRICS.describe('smartmahalla_http_responses_total', 'counter', "Admin panel javoblari (status bo'yicha)")
+METRICS.describe('smartmahalla_http_errors_total', 'counter', "Admin panel xatolari (4xx/5xx va istisnolar)")
+METRICS.describe('smartmahalla_bot_handler_duration_seconds', 'histogram', "Bot handlerlari davomiyligi")
+METRICS.describe('smartmahalla_bot_handler_errors_total', 'counter', "Bot handlerlaridagi istisnolar")
+METRICS.describe('smartmahalla_storage_duration_seconds', 'histogram', "load_data/save_data davomiyligi")
+METRICS.describe('smartmahalla_storage_bytes_total', 'counter', "O'qilgan/yozilgan baytlar")
+METRICS.describe('smartmahalla_storage_errors_total', 'counter', "Saqlash/yuklash xatolari")
+METRICS.describe('smartmahalla_snapshot_publish_seconds', 'histogram', "Snapshot yozish davomiyligi")
+METRICS.describe('smartmahalla_region_lock_wait_seconds', 'histogram', "Viloyat yozish qulfini kutish vaqti")
+METRICS.describe('smartmahalla_version_conflicts_total', 'counter', "Eskirgan versiya bilan kelgan tahrirlar (409)")
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+# Profillash (ixtiyoriy): sekin so'rovlar jurnali va cProfile namunalari
+# PROFILING=1 - yoqish, PROFILE_SLOW_MS - sekin deb hisoblash chegarasi,
+# PROFILE_SAMPLE_N - har N-so'rovdan bittasini cProfile bilan yozish (0 - o'chiq)
+_PROFILE_SECTIONS = contextvars.ContextVar('profile_sections', default=None)
+
+def profiled(name):
+    """Funksiya vaqtini joriy so'rov profiliga qo'shadi (profillash o'chiq bo'lsa - deyarli bepul)."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            sections = _PROFILE_SECTIONS.get()
+            if sections is None:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                sections[name] = sections.get(name, 0.0) + time.perf_counter() - started
+        return wrapper
+    return decorator
+
+class RequestProfiler:
+    def __init__(self, slow_ms, sample_n, directory):
+        self.slow = slow_ms / 1000.0
+        self.sample_n = sample_n
+        self.directory = directory
+        self.counter = itertools.count(1)
+
+    def begin(self):
+        token = _PROFILE_SECTIONS.set({})
+        profiler = None
+        if self.sample_n and next(self.counter) % self.sample_n == 0:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Boshqa profiler allaqachon ishlayapti
+                profiler = None
+        return token, profiler, time.perf_counter()
+
+    def end(self, state, kind, name):
+        token, profiler, started = state
+        elapsed = time.perf_counter() - started
+        sections = _PROFILE_SECTIONS.get() or {}
+        _PROFILE_SECTIONS.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                safe_name = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in name)
+                path = os.path.join(self.directory, f"{datetime.now():%Y%m%d-%H%M%S-%f}_{kind}_{safe_name}.prof")
+                profiler.dump_stats(path)
+            except Exception as e:
+                print(f"❌ Profilni saqlashda xato: {e}")
+        if elapsed >= self.slow:
+            other = elapsed - sum(sections.values())
+            breakdown = ', '.join(f"{key}={value * 1000:.1f}ms" for key, value in sections.items())
+            breakdown = f"{breakdown}, boshqa={other * 1000:.1f}ms" if breakdown else f"boshqa={other * 1000:.1f}ms"
+            logger.warning(f"🐢 Sekin so'rov: {kind} {name} {elapsed * 1000:.1f}ms ({breakdown})")
+        return elapsed
+
+PROFILER = RequestProfiler(PROFILE_SLOW_MS, PROFILE_SAMPLE_N, PROFILE_DIR) if PROFILING else None
+
+def render_template(template_name_or_list, **context):
+    if _PROFILE_SECTIONS.get() is None:
+        return flask_render_template(template_name_or_list, **context)
+    return profiled('render_template')(flask_render_template)(template_name_or_list, **context)
+
+# JSON kodek: orjson yoki msgspec o'rnatilgan bo'lsa o'shasi, bo'lmasa standart json.
+# JSON_CODEC=json|orjson|msgspec - majburan tanlash, PRETTY_JSON=1 - fayllarni indent bilan yozish
+# (odatda fayllar ixcham yoziladi - ularni faqat dastur o'qiydi).
+PRETTY_JSON = os.environ.get('PRETTY_JSON', '0') == '1'
+
+class StdlibJSONCodec:
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj, pretty=False, sort_keys=False, default=None):
+        if pretty:
+            text = json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys, default=default)
+        else:
+            text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys, default=default)
+        return text.encode('utf-8')
+
+class OrjsonCodec:
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def loads(self, data):
+        return self.orjson.loads(data)
+
+    def dumps(self, obj, pretty=False, sort_keys=False, default=None):
+        option = 0
+        if pretty:
+            option |= self.orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= self.orjson.OPT_SORT_KEYS
+        return self.orjson.dumps(obj, default=default, option=option)
+
+class MsgspecCodec:
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self.msgspec = msgspec
+        self.decoder = msgspec.json.Decoder()
+
+    def loads(self, data):
+        return self.decoder.decode(data)
+
+    def dumps(self, obj, pretty=False, sort_keys=False, default=None):
+        payload = self.msgspec.json.Encoder(enc_hook=default, order='sorted' if sort_keys else None).encode(obj)
+        return self.msgspec.json.format(payload, indent=2) if pretty else payload
+
+JSON_CODECS = {'orjson': OrjsonCodec, 'msgspec': MsgspecCodec, 'json': StdlibJSONCodec}
+
+def make_json_codec(name=None):
+    """name berilsa o'sha kodek, aks holda o'rnatilganlarning eng tezi."""
+    if name:
+        return JSON_CODECS[name]()
+    for codec_class in JSON_CODECS.values():
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+    return StdlibJSONCodec()
+
+JSON_CODEC = make_json_codec(os.environ.get('JSON_CODEC') or None)
+
+def read_json(path):
+    with open(path, 'rb') as f:
+        return JSON_CODEC.loads(f.read())
+
+def write_json(path, obj, pretty=None, default=None):
+    """Atomik yozish (vaqtinchalik fayl + os.replace). Yozilgan baytlar sonini qaytaradi."""
+    payload = JSON_CODEC.dumps(obj, pretty=PRETTY_JSON if pretty is None else pretty, default=default)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    if FILE_WATCHER is not None:
+        # O'zimiz yozgan fayl kuzatuvchiga "tashqi o'zgarish" bo'lib qaytmasin
+        FILE_WATCHER.expect(path)
+    return len(payload)
+
+# Oxirgi saqlash xatosi (shu jarayonda) - /readyz da ko'rsatiladi
+LAST_SAVE_ERROR = None
+
+def record_save_error(op, error):
+    global LAST_SAVE_ERROR
+    LAST_SAVE_ERROR = {'op': op, 'error': f"{type(error).__name__}: {error}", 'time': time.time()}
+
+# Ma'lumotlar modeli
+# Ierarxiya (viloyat -> tuman -> MFY -> xodim) xotirada __slots__ li obyektlar bo'lib turadi:
+# lavozim nomlari intern qilinadi, holat/type qiymatlari Enum a'zolari (bitta nusxa).
+# from_json()/to_json() data.json formatini o'zgartirmaydi: JSON da bo'lmagan maydon
+# MISSING bo'lib qoladi va yozilmaydi, noma'lum kalitlar esa extra da saqlanadi.
+class _Missing:
+    """JSON da yo'q maydon."""
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __str__(self):
+        return ''
+
+    def __repr__(self):
+        return 'MISSING'
+
+MISSING = _Missing()
+
+class Holat(str, Enum):
+    FAOL = 'faol'
+    NOFAOL = 'nofaol'
+
+    def __str__(self):
+        return self.value
+
+class HududTuri(str, Enum):
+    VILOYAT = 'viloyat'
+    RESPUBLIKA = 'respublika'
+    SHAHAR = 'shahar'
+    TUMAN = 'tuman'
+
+    def __str__(self):
+        return self.value
+
+_HOLATLAR = {h.value: h for h in Holat}
+_HUDUD_TURLARI = {t.value: t for t in HududTuri}
+
+def _kodlash(codes, value):
+    # Ma'lum qiymat -> Enum a'zosi; noma'lumi o'zgarishsiz (satr bo'lsa intern qilib) qoladi
+    if type(value) is str or isinstance(value, Enum):
+        member = codes.get(value)
+        if member is not None:
+            return member
+        return sys.intern(value) if type(value) is str else value
+    return value
+
+def holat_kodi(value):
+    return _kodlash(_HOLATLAR, value)
+
+def hudud_turi(value):
+    return _kodlash(_HUDUD_TURLARI, value)
+
+def _json_qiymat(value):
+    return value.value if isinstance(value, Enum) else value
+
+def _versiya(raw):
+    # Yozuv versiyasi (optimistik qulf); eski fayllarda yo'q - 0
+    value = raw.get('versiya', 0)
+    return value if type(value) is int and value > 0 else 0
+
+# Har bir MFYdagi standart lavozimlar (umumiy sxema). Bo'sh lavozimlar saqlanmaydi -
+# ular shu sxemadan kelib chiqadi (Neighborhood.lavozimlar()).
+LAVOZIMLAR = tuple(sys.intern(name) for name in (
+    "hokim", "2-sektor_rahbari", "mfy_raisi", "iib_inspektori", "hokim_yordamchisi", "yoshlar_yetakchisi"))
+_LAVOZIMLAR_SET = frozenset(LAVOZIMLAR)
+
+class _Entity:
+    __slots__ = ()
+    FIELDS = ()
+
+    # Shablonlar (Jinja) va dict kutadigan kod uchun: x.get('ism'), x['holat'], 'ism' in x
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+        else:
+            value = (self.extra or {}).get(key, MISSING)
+        return default if value is MISSING else value
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    @staticmethod
+    def _extra(raw, fields):
+        if len(raw) <= len(fields) and all(key in fields for key in raw):
+            return None
+        return {sys.intern(key): value for key, value in raw.items() if key not in fields}
+
+    def _dump(self, out):
+        if self.versiya:
+            out['versiya'] = self.versiya
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+class StaffMember(_Entity):
+    __slots__ = ('ism', 'telefon', 'email', 'holat', 'extra', 'versiya')
+    FIELDS = frozenset(('ism', 'telefon', 'email', 'holat', 'versiya'))
+
+    def __init__(self, ism='', telefon='', email='', holat=Holat.FAOL, extra=None, versiya=0):
+        self.ism = ism
+        self.telefon = telefon
+        self.email = email
+        self.holat = holat_kodi(holat)
+        self.extra = extra
+        self.versiya = versiya
+
+    @classmethod
+    def from_json(cls, raw):
+        get = raw.get
+        return cls(get('ism', MISSING), get('telefon', MISSING), get('email', MISSING),
+                   get('holat', MISSING), cls._extra(raw, cls.FIELDS), _versiya(raw))
+
+    def is_empty(self):
+        # add_mahalla yozadigan {"ism": "", "telefon": "", "email": "", "holat": "faol"} ko'rinishi
+        return (not self.ism and not self.telefon and not self.email and not self.extra
+                and (self.holat is Holat.FAOL or self.holat is MISSING))
+
+    def filled(self):
+        # Lavozim band: ismi bor (bo'shliqlardan iborat ism band hisoblanmaydi). Hisobotlar, jadval
+        # va statistika shu bitta qoidadan foydalanadi
+        return isinstance(self.ism, str) and bool(self.ism.strip())
+
+    def to_json(self):
+        out = {}
+        if self.ism is not MISSING:
+            out['ism'] = self.ism
+        if self.telefon is not MISSING:
+            out['telefon'] = self.telefon
+        if self.email is not MISSING:
+            out['email'] = self.email
+        if self.holat is not MISSING:
+            out['holat'] = _json_qiymat(self.holat)
+        return self._dump(out)
+
+    # O'zgarishlar lentasi uchun yozuvning o'z maydonlari (xodimda ichki ro'yxat yo'q)
+    fields_json = to_json
+
+class Xodimlar(dict):
+    """{lavozim: StaffMember} - faqat to'ldirilgan lavozimlar. Sxemadagi bo'sh lavozim
+    so'ralganda umumiy BOSH_XODIM qaytadi (xodimlar['hokim'] doim ishlaydi)."""
+    __slots__ = ()
+
+    def __missing__(self, lavozim):
+        if lavozim in _LAVOZIMLAR_SET:
+            return BOSH_XODIM
+        raise KeyError(lavozim)
+
+class Neighborhood(_Entity):
+    """MFY. xodimlar: Xodimlar (siyrak), to'liq ko'rinish - lavozimlar().
+    joylashuv: (kenglik, uzunlik) yoki MISSING; JSON da {"lat": ..., "lon": ...}.
+    versiya: MFYning o'z maydonlari (nomi, holati, joylashuvi) har o'zgarganda oshadi; xodimlarning
+    versiyasi alohida."""
+    __slots__ = ('xodimlar', 'yaratilgan_vaqt', 'holat', 'joylashuv', 'extra', 'versiya')
+    FIELDS = frozenset(('xodimlar', 'yaratilgan_vaqt', 'holat', 'joylashuv', 'versiya'))
+
+    def __init__(self, xodimlar=None, yaratilgan_vaqt=MISSING, holat=Holat.FAOL, extra=None, joylashuv=MISSING,
+                 versiya=0):
+        self.xodimlar = Xodimlar(xodimlar) if xodimlar is not None else Xodimlar()
+        self.yaratilgan_vaqt = yaratilgan_vaqt
+        self.holat = holat_kodi(holat)
+        self.joylashuv = joylashuv
+        self.extra = extra
+        self.versiya = versiya
+
+    @classmethod
+    def new(cls):
+        return cls(None, datetime.now().isoformat(), Holat.FAOL, versiya=1)
+
+    @classmethod
+    def from_json(cls, raw):
+        staff = StaffMember.from_json
+        xodimlar = Xodimlar()
+        for lavozim, xodim in raw.get('xodimlar', {}).items():
+            xodim = staff(xodim)
+            # Eski fayllardagi bo'sh o'rinbosarlar tashlab yuboriladi
+            if lavozim in _LAVOZIMLAR_SET and xodim.is_empty():
+                continue
+            xodimlar[sys.intern(lavozim)] = xodim
+        extra = cls._extra(raw, cls.FIELDS)
+        joylashuv = raw.get('joylashuv', MISSING)
+        if joylashuv is not MISSING:
+            try:
+                joylashuv = koordinatalar(joylashuv['lat'], joylashuv['lon'])
+            except (TypeError, KeyError, ValueError):
+                # Tushunarsiz qiymat yo'qolmasin - o'zgarishsiz qaytib yoziladi
+                extra = dict(extra or {}, joylashuv=joylashuv)
+                joylashuv = MISSING
+        return cls(xodimlar, raw.get('yaratilgan_vaqt', MISSING), raw.get('holat', MISSING), extra, joylashuv,
+                   _versiya(raw))
+
+    def lavozimlar(self):
+        """To'liq ko'rinish: sxemadagi oltita lavozim (bo'shlari BOSH_XODIM), keyin qo'shimchalari."""
+        xodimlar = dict(self.xodimlar)
+        full = {lavozim: xodimlar.pop(lavozim, BOSH_XODIM) for lavozim in LAVOZIMLAR}
+        full.update(xodimlar)
+        return full
+
+    def to_json(self):
+        return {'xodimlar': {lavozim: xodim.to_json() for lavozim, xodim in list(self.xodimlar.items())},
+                **self.fields_json()}
+
+    def fields_json(self):
+        """Xodimlarsiz maydonlar (o'zgarishlar lentasi uchun)."""
+        out = {}
+        if self.yaratilgan_vaqt is not MISSING:
+            out['yaratilgan_vaqt'] = self.yaratilgan_vaqt
+        if self.holat is not MISSING:
+            out['holat'] = _json_qiymat(self.holat)
+        if self.joylashuv is not MISSING:
+            out['joylashuv'] = {'lat': self.joylashuv[0], 'lon': self.joylashuv[1]}
+        return self._dump(out)
+
+BOSH_XODIM = StaffMember()
+
+def koordinatalar(lat, lon):
+    """(kenglik, uzunlik) - float, chegaradan tashqari bo'lsa ValueError."""
+    lat, lon = float(lat), float(lon)
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        raise ValueError(f"noto'g'ri koordinatalar: {lat}, {lon}")
+    return (lat, lon)
+
+class District(_Entity):
+    """Tuman yoki shahar. mfylar: {nomi: Neighborhood}."""
+    __slots__ = ('type', 'mfylar', 'extra', 'versiya')
+    FIELDS = frozenset(('type', 'mfylar', 'versiya'))
+
+    def __init__(self, type=HududTuri.TUMAN, mfylar=None, extra=None, versiya=0):
+        self.type = hudud_turi(type)
+        self.mfylar = mfylar if mfylar is not None else {}
+        self.extra = extra
+        self.versiya = versiya
+
+    @classmethod
+    def from_json(cls, raw):
+        mfy = Neighborhood.from_json
+        return cls(raw.get('type', MISSING), {nomi: mfy(m) for nomi, m in raw.get('mfylar', {}).items()},
+                   cls._extra(raw, cls.FIELDS), _versiya(raw))
+
+    def to_json(self):
+        out = {}
+        if self.type is not MISSING:
+            out['type'] = _json_qiymat(self.type)
+        out['mfylar'] = {nomi: mfy.to_json() for nomi, mfy in list(self.mfylar.items())}
+        return self._dump(out)
+
+    def fields_json(self):
+        """MFYlarsiz maydonlar (o'zgarishlar lentasi uchun)."""
+        out = {}
+        if self.type is not MISSING:
+            out['type'] = _json_qiymat(self.type)
+        return self._dump(out)
+
+class Region(_Entity):
+    """Viloyat / respublika / shahar. tumanlar: {nomi: District}."""
+    # __weakref__ - hisobot yig'indilari (ROLLUPS) qaysi obyektdan qurilganini eslab qoladi
+    __slots__ = ('type', 'tumanlar', 'extra', 'versiya', '__weakref__')
+    FIELDS = frozenset(('type', 'tumanlar', 'versiya'))
+
+    def __init__(self, type=HududTuri.VILOYAT, tumanlar=None, extra=None, versiya=0):
+        self.type = hudud_turi(type)
+        self.tumanlar = tumanlar if tumanlar is not None else {}
+        self.extra = extra
+        self.versiya = versiya
+
+    @classmethod
+    def from_json(cls, raw):
+        district = District.from_json
+        return cls(raw.get('type', MISSING), {nomi: district(t) for nomi, t in raw.get('tumanlar', {}).items()},
+                   cls._extra(raw, cls.FIELDS), _versiya(raw))
+
+    def to_json(self):
+        out = {}
+        if self.type is not MISSING:
+            out['type'] = _json_qiymat(self.type)
+        out['tumanlar'] = {nomi: tuman.to_json() for nomi, tuman in list(self.tumanlar.items())}
+        return self._dump(out)
+
+    def fields_json(self):
+        """Tumanlarsiz maydonlar (o'zgarishlar lentasi uchun)."""
+        out = {}
+        if self.type is not MISSING:
+            out['type'] = _json_qiymat(self.type)
+        return self._dump(out)
+
+def regions_from_json(raw):
+    return {nomi: Region.from_json(region) for nomi, region in raw.items()}
+
+def regions_to_json(regions):
+    return {nomi: region.to_json() for nomi, region in list(regions.items())}
+
+def find_mfy(data, viloyat, tuman, mahalla):
+    """Neighborhood yoki None."""
+    region = data.get(viloyat)
+    district = region.tumanlar.get(tuman) if region is not None else None
+    return district.mfylar.get(mahalla) if district is not None else None
+
+def _stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+class FileLock:
+    """Jarayonlararo qulf (fcntl.flock, Windowsda msvcrt.locking).
+
+    Bitta jarayon ichida qayta kiriladigan (RLock): so'rov qulfni ushlab turganda
+    save_data()/add_activity() uni yana olishi mumkin.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        # fork dan keyin ham chaqiriladi - ota jarayondagi thread ushlab qolgan qulf meros bo'lmasin
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+        self.owner = None
+
+    def held(self):
+        """Qulf shu threadda ushlab turilganmi."""
+        return self.owner == threading.get_ident()
+
+    def acquire(self):
+        self.lock.acquire()
+        self.depth += 1
+        if self.depth > 1:
+            return
+        self.owner = threading.get_ident()
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            self.fd = fd
+        except BaseException:
+            self.depth -= 1
+            self.owner = None
+            self.lock.release()
+            raise
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            self.owner = None
+            fd, self.fd = self.fd, None
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            os.close(fd)
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+# Barcha yozuvlar (shardlar, admins.json, settings.json, activity.json) shu qulf ostida:
+# bir nechta web worker bo'lsa, o'qish-o'zgartirish-yozish ketma-ketligi bir-birini yo'qotmaydi
+WRITE_LOCK = FileLock(os.path.join(DATA_DIR, 'write.lock'))
+
+class RegionLocks:
+    """Viloyat darajasidagi yozish qulflari - turli viloyatlardagi tahrirlar parallel bajariladi.
+
+    - viloyat nomi xesh bo'yicha REGION_LOCK_STRIPES ta qulfdan biriga (data/locks/stripe-N.lock, FileLock)
+      tushadi: bitta viloyatga tegadigan POST so'rov butun so'rov davomida faqat o'sha qulf(lar)ni ushlaydi.
+      Qulf shard emas, nom bo'yicha: qayta nomlash eski va yangi nomni birga oladi, yangi viloyatning esa
+      hali shardi yo'q. Qulflar soni qat'iy - payloaddagi o'ylab topilgan nomlar fayl va xotira qo'shmaydi,
+      ikki viloyat bitta qulfga tushsa, ular shunchaki navbat bilan yoziladi;
+    - umumiy data/locks/tree.lock: viloyat so'rovlari uni bo'lishib (LOCK_SH), barcha viloyatlarga
+      tegadiganlar (ommaviy import, data.json ni qayta yuklash) yolg'iz (LOCK_EX) oladi. flock ochilgan
+      fayl bo'yicha ishlaydi - har bir so'rov faylni o'zi ochadi, shuning uchun bitta jarayondagi threadlar
+      ham bir-birini ko'radi (Windowsda bo'lishib olish yo'q - so'rovlar ketma-ket bajariladi);
+    - tartib: tree -> viloyat qulflari (raqamlari tartibida) -> WRITE_LOCK (manifest, activity.json - qisqa).
+      WRITE_LOCK ni ushlab turgan kod bu qulflarni olmaydi.
+    """
+
+    def __init__(self, directory, stripes=REGION_LOCK_STRIPES):
+        self.directory = directory
+        self.locks = [FileLock(os.path.join(directory, f"stripe-{i}.lock")) for i in range(stripes)]
+        self.local = threading.local()
+
+    def stripe(self, name):
+        digest = hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % len(self.locks)
+
+    def _tree(self, exclusive):
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, 'tree.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def acquire(self, names=None):
+        """names - viloyat nomlari, None - barcha viloyatlar. Natija release() ga qaytariladi."""
+        fd = self._tree(names is None)
+        held = []
+        try:
+            for index in sorted({self.stripe(name) for name in names or ()}):
+                lock = self.locks[index]
+                lock.acquire()
+                held.append(lock)
+        except BaseException:
+            self._release(fd, held)
+            raise
+        self.local.depth = getattr(self.local, 'depth', 0) + 1
+        return fd, held
+
+    def release(self, token):
+        self.local.depth -= 1
+        self._release(*token)
+
+    @staticmethod
+    def _release(fd, held):
+        for lock in reversed(held):
+            lock.release()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+    def held(self):
+        return getattr(self.local, 'depth', 0) > 0
+
+REGION_LOCKS = RegionLocks(os.path.join(DATA_DIR, 'locks'))
+
+def write_locked():
+    """Shu thread yozish qulfi (umumiy yoki viloyat) ostidami - unda kesh emas, diskdagi holat o'qiladi."""
+    return WRITE_LOCK.held() or REGION_LOCKS.held()
+
+def _bosh_lavozimlar(raw):
+    # Eski formatdagi bo'sh lavozim o'rinbosarlari soni (from_json ularni tashlab yuboradi)
+    bosh = 0
+    for region in raw.values():
+        for district in region.get('tumanlar', {}).values():
+            for mfy in district.get('mfylar', {}).values():
+                for lavozim, xodim in mfy.get('xodimlar', {}).items():
+                    if lavozim in _LAVOZIMLAR_SET and StaffMember.from_json(xodim).is_empty():
+                        bosh += 1
+    return bosh
+
+class RegionsView(MutableMapping):
+    """Bitta so'rov uchun {viloyat: Region} ko'rinishi.
+
+    Viloyatlar ro'yxati manifestdan olinadi, shardlar esa birinchi murojaatda yuklanadi.
+    So'rov tegib chiqqan viloyatlar shu yerda ushlab turiladi - umumiy kesh ularni
+    chiqarib yuborsa ham save_data() aynan shu obyektlarni yozadi.
+    """
+
+    def __init__(self, store, files):
+        self._store = store
+        self._base = dict(files)
+        self._files = dict(files)
+        self._order = list(files)
+        self._loaded = {}
+        self._detached = {}
+
+    def __getitem__(self, name):
+        region = self._loaded.get(name)
+        if region is None:
+            region = self._store.region(self._files[name])
+            self._loaded[name] = region
+        return region
+
+    def __setitem__(self, name, region):
+        if name not in self._files:
+            self._order.append(name)
+        # DATA.pop(eski) + DATA[yangi] = region - nomi o'zgargan viloyat o'z shardini saqlab qoladi
+        detached = self._detached.pop(id(region), None)
+        if detached is not None:
+            self._files[name] = detached[1]
+        elif name not in self._files:
+            self._files[name] = None
+        self._loaded[name] = region
+
+    def __delitem__(self, name):
+        file = self._files.pop(name)
+        self._order.remove(name)
+        region = self._loaded.pop(name, None)
+        if region is not None and file is not None:
+            self._detached[id(region)] = (region, file)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def loaded(self):
+        return list(self._loaded)
+
+class BinaryShardCache:
+    """Shardlarning parse qilingan ko'rinishi: data/cache/<id>.bin - marshal qilingan kortejlar.
+
+    JSON ni o'qib Region obyektlarini qurishdan ~3 barobar tez. Sarlavhada shard JSON baytlarining
+    xeshi turadi: JSON o'zgargan bo'lsa (saqlash, boshqa jarayon, operator) nusxa eskirgan hisoblanadi
+    va keyingi yuklashda JSON dan qayta yoziladi. marshal formati Python versiyasiga bog'liq - u ham tekshiriladi.
+    """
+    MAGIC = b'SMBIN3\n'
+    HEADER = MAGIC + bytes((sys.version_info[0], sys.version_info[1], marshal.version))
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(payload):
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def _path(self, file):
+        return os.path.join(self.directory, os.path.splitext(file)[0] + '.bin')
+
+    def load(self, file, digest):
+        """Region yoki None (nusxa yo'q, eskirgan yoki buzilgan)."""
+        try:
+            with open(self._path(file), 'rb') as f:
+                blob = f.read()
+            start = len(self.HEADER)
+            if blob[:start] == self.HEADER and blob[start:start + 16] == digest:
+                region = _region_from_rows(marshal.loads(blob[start + 16:]))
+                self.hits += 1
+                return region
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ {file} binar nusxasi o'qilmadi: {e}")
+        self.misses += 1
+        return None
+
+    def store(self, file, digest, region):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(file)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(self.HEADER + digest + marshal.dumps(_region_rows(region)))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ {file} binar nusxasi yozilmadi: {e}")
+
+    def remove(self, file):
+        try:
+            os.remove(self._path(file))
+        except FileNotFoundError:
+            pass
+
+# marshal faqat oddiy turlarni biladi: Enum - qiymati, MISSING - Ellipsis (JSON da bunday qiymat yo'q)
+def _binar(value):
+    if value is MISSING:
+        return ...
+    return value.value if isinstance(value, Enum) else value
+
+def _binardan(value):
+    return MISSING if value is ... else value
+
+def _region_rows(region):
+    return (_binar(region.type), region.extra, region.versiya, [
+        (tuman, _binar(district.type), district.extra, district.versiya, [
+            (mahalla, _binar(mfy.yaratilgan_vaqt), _binar(mfy.holat), _binar(mfy.joylashuv), mfy.extra, mfy.versiya, [
+                (lavozim, _binar(x.ism), _binar(x.telefon), _binar(x.email), _binar(x.holat), x.extra, x.versiya)
+                for lavozim, x in list(mfy.xodimlar.items())])
+            for mahalla, mfy in list(district.mfylar.items())])
+        for tuman, district in list(region.tumanlar.items())])
+
+def _region_from_rows(rows):
+    region_type, region_extra, region_versiya, tumanlar = rows
+    staff = StaffMember
+    out = {}
+    for tuman, district_type, district_extra, district_versiya, mfylar in tumanlar:
+        mfy_map = {}
+        for mahalla, yaratilgan_vaqt, holat, joylashuv, extra, versiya, xodimlar in mfylar:
+            mfy_map[mahalla] = Neighborhood(
+                {lavozim: staff(_binardan(ism), _binardan(telefon), _binardan(email), _binardan(x_holat), x_extra,
+                                x_versiya)
+                 for lavozim, ism, telefon, email, x_holat, x_extra, x_versiya in xodimlar},
+                _binardan(yaratilgan_vaqt), _binardan(holat), extra, _binardan(joylashuv), versiya)
+        out[tuman] = District(_binardan(district_type), mfy_map, district_extra, district_versiya)
+    return Region(_binardan(region_type), out, region_extra, region_versiya)
+
+class ShardStore:
+    """Viloyatlar bo'yicha bo'lingan ombor: data/manifest.json + data/shards/<id>.json.
+
+    - shardlar birinchi murojaatda yuklanadi va LRU keshda turadi; kesh DATA_MEMORY_MB
+      dan oshsa eng eski shardlar chiqariladi (keyingi murojaatda fayldan qayta o'qiladi);
+    - save() faqat o'zgargan shardlarni va (kerak bo'lsa) manifestni atomik yozadi;
+    - boshqa jarayon yozgan fayllar mtime/hajm bo'yicha aniqlanib qayta o'qiladi; fayl kuzatuvchisi
+      ishlayotganda (trusted) stat faqat yozish qulfi ostida qilinadi, qolgan o'zgarishlarni reload() bildiradi;
+    - eski monolit data.json birinchi ishga tushishda shardlarga bo'linadi.
+    """
+    MANIFEST = 'manifest.json'
+    # Model obyektlari ixcham JSON dan taxminan 2.5-3 barobar ko'p joy egallaydi
+    MEMORY_FACTOR = 3
+
+    def __init__(self, directory, legacy_path, budget_bytes):
+        self.directory = directory
+        self.shards_dir = os.path.join(directory, 'shards')
+        self.manifest_path = os.path.join(directory, self.MANIFEST)
+        self.legacy_path = legacy_path
+        self.budget = budget_bytes
+        self.lock = threading.RLock()
+        self.files = OrderedDict()
+        self.next_id = 1
+        self.manifest_stamp = None
+        self.cache = OrderedDict()
+        self.used = 0
+        self.version = 0
+        self.updated_at = None
+        # True - FileWatcher tashqi o'zgarishlarni reload() orqali bildiradi
+        self.trusted = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.binary = BinaryShardCache(os.path.join(directory, 'cache')) if DATA_BINARY_CACHE else None
+
+    # --- Manifest ---
+
+    def _open(self, bump=True):
+        if self.manifest_stamp is not None:
+            try:
+                if _stamp(self.manifest_path) == self.manifest_stamp:
+                    return False
+            except FileNotFoundError:
+                pass
+        with self.lock:
+            if not os.path.exists(self.manifest_path):
+                os.makedirs(self.shards_dir, exist_ok=True)
+                if os.path.exists(self.legacy_path):
+                    self._import_legacy()
+                else:
+                    print("🆕 Yangi ma'lumotlar bazasi yaratildi")
+                    self._write_manifest()
+            stamp = _stamp(self.manifest_path)
+            if stamp == self.manifest_stamp:
+                return False
+            manifest = read_json(self.manifest_path)
+            self.files = OrderedDict((item['name'], item['file']) for item in manifest.get('regions', []))
+            self.next_id = manifest.get('next_id', len(self.files) + 1)
+            self.manifest_stamp = stamp
+            if bump:
+                self.version += 1
+                self.updated_at = time.time()
+            live = set(self.files.values())
+            for file in [f for f in self.cache if f not in live]:
+                self._forget(file)
+            return True
+
+    def _write_manifest(self):
+        write_json(self.manifest_path, {
+            'format': 1,
+            'next_id': self.next_id,
+            'regions': [{'name': name, 'file': file} for name, file in self.files.items()]
+        })
+        self.manifest_stamp = _stamp(self.manifest_path)
+
+    def _import_legacy(self):
+        raw = read_json(self.legacy_path)
+        bosh = _bosh_lavozimlar(raw)
+        for name, region in regions_from_json(raw).items():
+            file = self._new_file()
+            self._write_shard(file, region)
+            self.files[name] = file
+        self._write_manifest()
+        os.makedirs('backups', exist_ok=True)
+        backup_path = os.path.join('backups', f"data-{datetime.now():%Y%m%d-%H%M%S}.json")
+        shutil.move(self.legacy_path, backup_path)
+        print(f"🗂️ {self.legacy_path} {len(self.files)} ta viloyat shardiga bo'lindi "
+              f"(bo'sh lavozimlar: {bosh} ta olib tashlandi, asl fayl: {backup_path})")
+
+    def _new_file(self):
+        file = f"r{self.next_id:04d}.json"
+        self.next_id += 1
+        return file
+
+    # --- Shardlar ---
+
+    def _shard_path(self, file):
+        return os.path.join(self.shards_dir, file)
+
+    def _remember(self, file, region, stamp, size):
+        self._forget(file)
+        cost = size * self.MEMORY_FACTOR
+        self.cache[file] = (region, stamp, cost)
+        self.used += cost
+        while self.used > self.budget and len(self.cache) > 1:
+            oldest = next(iter(self.cache))
+            self._forget(oldest)
+            self.evictions += 1
+
+    def _forget(self, file):
+        entry = self.cache.pop(file, None)
+        if entry is not None:
+            self.used -= entry[2]
+
+    def _write_shard(self, file, region):
+        size = write_json(self._shard_path(file), region.to_json())
+        self._remember(file, region, _stamp(self._shard_path(file)), size)
+        return size
+
+    def region(self, file):
+        entry = self.cache.get(file)
+        if entry is not None and self.trusted and not write_locked():
+            # Shard o'zgarsa kuzatuvchi uni reload() bilan keshdan chiqaradi - stat shart emas
+            self.hits += 1
+            try:
+                self.cache.move_to_end(file)
+            except KeyError:
+                pass
+            return entry[0]
+        path = self._shard_path(file)
+        stamp = _stamp(path)
+        if entry is not None and entry[1] == stamp:
+            self.hits += 1
+            try:
+                self.cache.move_to_end(file)
+            except KeyError:
+                pass
+            return entry[0]
+        with self.lock:
+            entry = self.cache.get(file)
+            stamp = _stamp(path)
+            if entry is not None and entry[1] == stamp:
+                self.hits += 1
+                return entry[0]
+            with open(path, 'rb') as f:
+                payload = f.read()
+            region = None
+            if self.binary is not None:
+                digest = self.binary.digest(payload)
+                region = self.binary.load(file, digest)
+            if region is None:
+                region = Region.from_json(JSON_CODEC.loads(payload))
+                if self.binary is not None:
+                    self.binary.store(file, digest, region)
+            self._remember(file, region, stamp, len(payload))
+            self.misses += 1
+            METRICS.inc('smartmahalla_storage_bytes_total', len(payload), (('op', 'load_data'),))
+            if entry is not None:
+                # Shardni boshqa jarayon o'zgartirgan
+                self.version += 1
+                self.updated_at = time.time()
+            return region
+
+    # --- Ommaviy API ---
+
+    def warm(self):
+        """Ishga tushishda shardlarni oldindan yuklash (xotira limiti doirasida) - birinchi so'rov kutmaydi."""
+        self._open(bump=False)
+        for file in list(self.files.values()):
+            if self.used >= self.budget:
+                break
+            self.region(file)
+        return len(self.cache)
+
+    def view(self):
+        # Yozish qulfi ostida (POST so'rovlar) har doim diskdagi holat tekshiriladi - kuzatuvchi
+        # hodisasi hali yetib kelmagan bo'lsa ham boshqa workerning yozuvi yo'qolmaydi
+        if not self.trusted or self.manifest_stamp is None or write_locked():
+            self._open()
+        # save() manifest ro'yxatini joyida o'zgartiradi (parallel viloyat so'rovlari) - nusxa qulf ostida
+        with self.lock:
+            return RegionsView(self, self.files)
+
+    def save(self, view, names=None):
+        """view dagi o'zgarishlarni yozadi: names - o'zgargan viloyatlar (None - view yuklaganlarining hammasi).
+
+        Manifestga faqat shu view qilgan qo'shish/o'chirish/qayta nomlash qo'llanadi, shuning uchun
+        parallel so'rovlar bir-birining viloyatlarini yo'qotib yubormaydi. Yozilgan baytlar sonini qaytaradi.
+        """
+        if names is None:
+            names = view.loaded()
+        with WRITE_LOCK, self.lock:
+            self._open()
+            size = 0
+            removed = [name for name in view._base if name not in view._files]
+            added = [name for name in view._order if name not in view._base or view._files[name] != view._base[name]]
+            # Avval shardlar, keyin manifest - yiqilish bo'lsa manifest yarim holatni ko'rsatmaydi
+            for name in dict.fromkeys(list(names) + added):
+                region = view._loaded.get(name)
+                if region is None or name not in view._files:
+                    continue
+                if view._files[name] is None:
+                    view._files[name] = self._new_file()
+                elif name not in names:
+                    continue
+                size += self._write_shard(view._files[name], region)
+            stale = []
+            if removed or added:
+                for name in removed:
+                    file = self.files.pop(name, None)
+                    if file is not None and file not in view._files.values():
+                        stale.append(file)
+                for name in added:
+                    self.files[name] = view._files[name]
+                self._write_manifest()
+            for file in stale:
+                self._forget(file)
+                try:
+                    os.remove(self._shard_path(file))
+                except FileNotFoundError:
+                    pass
+                if self.binary is not None:
+                    self.binary.remove(file)
+            view._base = dict(view._files)
+            view._detached.clear()
+            self.version += 1
+            self.updated_at = time.time()
+            return size
+
+    def raw_regions(self):
+        """[(viloyat, shard baytlari)] - manifest tartibida, izchil holat (snapshot uchun)."""
+        with self.lock:
+            self._open()
+            out = []
+            for name, file in self.files.items():
+                with open(self._shard_path(file), 'rb') as f:
+                    out.append((name, f.read()))
+            return out
+
+    def reload(self, names=None):
+        """Kuzatuvchi: o'zgargan fayllar (None - hammasi) keshdan chiqariladi. Haqiqiy o'zgarish bo'lsa True.
+
+        Versiyani bu yerda emas, FileWatcher bir to'lqin uchun bir marta (touch()) oshiradi.
+        """
+        with self.lock:
+            changed = False
+            if names is None or self.MANIFEST in names:
+                changed = self._open(bump=False)
+            for file in list(self.cache) if names is None else names:
+                entry = self.cache.get(file)
+                if entry is None:
+                    continue
+                try:
+                    stamp = _stamp(self._shard_path(file))
+                except FileNotFoundError:
+                    stamp = None
+                if stamp != entry[1]:
+                    self._forget(file)
+                    changed = True
+            return changed
+
+    def touch(self):
+        with self.lock:
+            self.version += 1
+            self.updated_at = time.time()
+
+    def import_legacy(self):
+        """Operator data.json ni qayta qo'ygan: barcha shardlar shu fayldan qayta yaratiladi."""
+        # Barcha viloyatlar almashadi - yarim yo'ldagi viloyat tahrirlari tugashini kutamiz
+        token = REGION_LOCKS.acquire()
+        try:
+            with WRITE_LOCK, self.lock:
+                # Bir nechta jarayon hodisani birga ko'radi - faylni birinchi bo'lib olgan import qiladi
+                if not os.path.exists(self.legacy_path):
+                    return False
+                self._open(bump=False)
+                old = self.files
+                self.files = OrderedDict()
+                try:
+                    self._import_legacy()
+                except Exception:
+                    self.files = old
+                    raise
+                for file in old.values():
+                    self._forget(file)
+                    try:
+                        os.remove(self._shard_path(file))
+                    except FileNotFoundError:
+                        pass
+                # Hodisalar bilan ifodalab bo'lmaydi - lenta o'quvchilari snapshotni qayta oladi
+                CHANGES.append([{'op': 'reset'}])
+                return True
+        finally:
+            REGION_LOCKS.release(token)
+
+    def invalidate(self):
+        # Keyingi murojaatda manifest va shardlar fayldan qayta o'qiladi
+        with self.lock:
+            self.cache.clear()
+            self.used = 0
+            self.manifest_stamp = None
+
+    def disk_usage(self):
+        total = _file_size(self.manifest_path)
+        for file in list(self.files.values()):
+            total += _file_size(self._shard_path(file))
+        return total
+
+STORE = ShardStore(DATA_DIR, DATA_FILE, DATA_MEMORY_MB * 1024 * 1024)
+
+# Snapshotlar (supervisor rejimi): admin jarayoni har saqlashdan keyin o'zgarmas
+# snapshot-<seq>.bin faylini yozadi va CURRENT ko'rsatkichini atomik almashtiradi,
+# bot jarayonlari esa faylni mmap qilib, viloyatlarni birinchi murojaatda dekodlaydi.
+# Fayl: SNAPSHOT_MAGIC + uint32 sarlavha uzunligi + sarlavha (JSON) + viloyat shardlari ketma-ket.
+SNAPSHOT_MAGIC = b'SMSNAP1\n'
+SNAPSHOT_CURRENT = 'CURRENT'
+
+class Snapshot(Mapping):
+    """Bitta snapshot fayli - {viloyat: Region}, faqat o'qish uchun."""
+
+    def __init__(self, directory, name):
+        self.name = name
+        with open(os.path.join(directory, name), 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = len(SNAPSHOT_MAGIC)
+        if self._mm[:start] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{name}: snapshot fayli emas")
+        (length,) = struct.unpack_from('<I', self._mm, start)
+        header = JSON_CODEC.loads(self._mm[start + 4:start + 4 + length])
+        base = start + 4 + length
+        self.seq = header['seq']
+        self.created_at = header['created_at']
+        self._index = {name: (base + offset, size) for name, offset, size in header['regions']}
+        self._regions = {}
+
+    def __getitem__(self, name):
+        region = self._regions.get(name)
+        if region is None:
+            offset, size = self._index[name]
+            region = self._regions[name] = Region.from_json(JSON_CODEC.loads(self._mm[offset:offset + size]))
+        return region
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+class SnapshotPublisher:
+    """Admin jarayoni: shardlardan snapshot yig'adi, CURRENT ni almashtiradi va botlarga xabar beradi.
+
+    request() chaqiruvlari fon threadida birlashtiriladi - ketma-ket saqlashlar bitta snapshot beradi.
+    """
+
+    def __init__(self, store, directory, keep, bus=None, targets=()):
+        self.store = store
+        self.directory = directory
+        self.keep = max(1, keep)
+        self.bus = bus
+        self.targets = list(targets)
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.thread = None
+        self.published_at = None
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self.seq = max(self._existing() or [0])
+
+    def _existing(self):
+        return [int(name[9:-4]) for name in os.listdir(self.directory)
+                if name.startswith('snapshot-') and name.endswith('.bin') and name[9:-4].isdigit()]
+
+    def publish(self):
+        started = time.perf_counter()
+        with self.lock:
+            with WRITE_LOCK:
+                regions = self.store.raw_regions()
+            self.seq += 1
+            index, offset = [], 0
+            for name, payload in regions:
+                index.append([name, offset, len(payload)])
+                offset += len(payload)
+            header = JSON_CODEC.dumps({'seq': self.seq, 'created_at': time.time(), 'regions': index})
+            name = f"snapshot-{self.seq:08d}.bin"
+            path = os.path.join(self.directory, name)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(struct.pack('<I', len(header)))
+                f.write(header)
+                for _, payload in regions:
+                    f.write(payload)
+            os.replace(tmp_path, path)
+            # CURRENT ko'rsatkichi atomik almashtiriladi - o'quvchi yarim yozilgan faylni ko'rmaydi
+            current_tmp = os.path.join(self.directory, f"{SNAPSHOT_CURRENT}.tmp")
+            with open(current_tmp, 'w', encoding='utf-8') as f:
+                f.write(name)
+            os.replace(current_tmp, os.path.join(self.directory, SNAPSHOT_CURRENT))
+            self.published_at = time.time()
+            self._prune()
+        if self.bus is not None:
+            for port in self.targets:
+                self.bus.send(port, {'type': 'snapshot', 'seq': self.seq})
+        METRICS.observe('smartmahalla_snapshot_publish_seconds', time.perf_counter() - started)
+        return self.seq
+
+    def _prune(self):
+        # Eski snapshotlar: bot ularni hali mmap qilib turgan bo'lsa ham (POSIX) o'chirish xavfsiz
+        for seq in sorted(self._existing())[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, f"snapshot-{seq:08d}.bin"))
+            except OSError:
+                pass
+
+    def request(self):
+        self.event.set()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def _loop(self):
+        while True:
+            self.event.wait()
+            self.event.clear()
+            try:
+                self.publish()
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Snapshot yozishda xato: {e}")
+
+class SnapshotReader:
+    """Bot jarayoni: CURRENT ko'rsatgan snapshotni ochadi; notify() yoki SNAPSHOT_POLL_INTERVAL dan keyin yangilaydi."""
+
+    def __init__(self, directory, poll_interval):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.current = None
+        self.stale = True
+        self.checked_at = 0.0
+
+    def notify(self, message=None):
+        self.stale = True
+
+    def view(self):
+        if self.stale or time.monotonic() - self.checked_at >= self.poll_interval:
+            self._refresh()
+        return self.current
+
+    def _refresh(self):
+        if FILE_WATCHER is None:
+            # Kuzatuvchi yo'q (WATCH_FILES=0) - admin yozgan obunachilar fayli ham shu oraliqda tekshiriladi
+            SUBSCRIBERS.refresh()
+        with self.lock:
+            self.stale = False
+            self.checked_at = time.monotonic()
+            try:
+                with open(os.path.join(self.directory, SNAPSHOT_CURRENT), 'r', encoding='utf-8') as f:
+                    name = f.read().strip()
+            except FileNotFoundError:
+                return
+            if self.current is not None and self.current.name == name:
+                return
+            snapshot = Snapshot(self.directory, name)
+            self.current = snapshot
+            print(f"📸 Snapshot #{snapshot.seq} ochildi ({len(snapshot)} ta viloyat)")
+
+def ipc_key():
+    """IPC imzo kaliti: IPC_SECRET yoki DATA_DIR dagi faqat egasi o'qiy oladigan ipc.key fayli."""
+    if IPC_SECRET:
+        return IPC_SECRET.encode('utf-8')
+    path = os.path.join(DATA_DIR, 'ipc.key')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        # To'liq yozilgan fayl link qilinadi - bir vaqtda ishga tushgan jarayonlar chala kalit o'qimaydi
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, secrets.token_bytes(32))
+        finally:
+            os.close(fd)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+class LocalBus:
+    """Jarayonlararo yengil xabarlar: 127.0.0.1 dagi UDP datagrammalar ({'type': ..., ...} JSON).
+
+    Datagramma: HMAC-SHA256 (32 bayt) + JSON. Portga istalgan mahalliy jarayon yoza oladi, shuning uchun
+    imzosi mos kelmagan yoki MAX_AGE soniyadan eski (qayta yuborilgan) xabarlar tashlab yuboriladi.
+    """
+    MAX_AGE = 10
+
+    def __init__(self, port=None):
+        # port=None - faqat yuborish uchun (web worker)
+        self.port = port
+        self.key = ipc_key()
+        self.rejected = 0
+        self.sock = None
+        if port is not None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind(('127.0.0.1', port))
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.handlers = {}
+        self.thread = None
+
+    def on(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def _sign(self, body):
+        return hmac.new(self.key, body, hashlib.sha256).digest()
+
+    def send(self, port, message):
+        body = JSON_CODEC.dumps(dict(message, ts=time.time()))
+        try:
+            self.sender.sendto(self._sign(body) + body, ('127.0.0.1', port))
+        except OSError:
+            # Qabul qiluvchi hali ishga tushmagan - bot baribir CURRENT ni vaqti-vaqti bilan tekshiradi
+            pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            payload, _ = self.sock.recvfrom(65536)
+            signature, body = payload[:32], payload[32:]
+            if not hmac.compare_digest(signature, self._sign(body)):
+                self.rejected += 1
+                continue
+            try:
+                message = JSON_CODEC.loads(body)
+                if abs(time.time() - message.get('ts', 0)) > self.MAX_AGE:
+                    self.rejected += 1
+                    continue
+                handler = self.handlers.get(message.get('type'))
+                if handler is not None:
+                    handler(message)
+            except Exception as e:
+                print(f"❌ IPC xabarida xato: {e}")
+
+# Fayl kuzatuvchisi. Backend.wait(timeout) -> [(papka, fayl nomi)]; nom None - papkadagi hamma narsani
+# qayta tekshirish (inotify navbati to'lib ketgan)
+class InotifyWatch:
+    """Linux inotify (ctypes orqali, qo'shimcha paketsiz): papkadagi yozish, almashtirish va o'chirishlar."""
+    name = 'inotify'
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_CLOEXEC = 0o2000000
+    # write_json os.replace qiladi (IN_MOVED_TO), operator muharriri esa joyida yozishi mumkin (IN_CLOSE_WRITE)
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify faqat Linuxda mavjud")
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._errno = ctypes.get_errno
+        self._add_watch = libc.inotify_add_watch
+        self.fd = libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(self._errno(), "inotify_init1")
+        self.dirs = {}
+
+    def add(self, directory, names=None):
+        wd = self._add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            raise OSError(self._errno(), f"inotify_add_watch: {directory}")
+        self.dirs[wd] = directory
+
+    def wait(self, timeout):
+        import select
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        buf = os.read(self.fd, 64 * 1024)
+        events, pos = [], 0
+        while pos < len(buf):
+            wd, mask, _, length = self.EVENT.unpack_from(buf, pos)
+            pos += self.EVENT.size
+            name = os.fsdecode(buf[pos:pos + length].rstrip(b'\0'))
+            pos += length
+            if mask & self.IN_Q_OVERFLOW:
+                events.extend((directory, None) for directory in self.dirs.values())
+            elif wd in self.dirs:
+                events.append((self.dirs[wd], name))
+        return events
+
+class PollingWatch:
+    """inotify bo'lmagan tizimlar uchun: har interval soniyada kuzatilayotgan fayllar stat qilinadi."""
+    name = 'poll'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.dirs = {}
+
+    def add(self, directory, names=None):
+        self.dirs[directory] = (names, self._scan(directory, names))
+
+    @staticmethod
+    def _scan(directory, names):
+        stamps = {}
+        if names is None:
+            try:
+                names = [entry.name for entry in os.scandir(directory) if entry.is_file()]
+            except FileNotFoundError:
+                return stamps
+        for name in names:
+            try:
+                stamps[name] = _stamp(os.path.join(directory, name))
+            except OSError:
+                pass
+        return stamps
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+            events = []
+            for directory, (names, before) in list(self.dirs.items()):
+                after = self._scan(directory, names)
+                events.extend((directory, name) for name in set(before) | set(after)
+                              if before.get(name) != after.get(name))
+                self.dirs[directory] = (names, after)
+            if events or (deadline is not None and time.monotonic() >= deadline):
+                return events
+
+def make_watch_backend(name=None):
+    name = name or WATCH_BACKEND
+    if name == 'poll':
+        return PollingWatch(WATCH_POLL_INTERVAL)
+    try:
+        return InotifyWatch()
+    except (OSError, AttributeError):
+        if name == 'inotify':
+            raise
+        return PollingWatch(WATCH_POLL_INTERVAL)
+
+class FileWatcher:
+    """Fayllar o'zgarishini kuzatib, handlerlarni debounce bilan chaqiradi.
+
+    Birinchi hodisadan keyin debounce soniya davomida kelganlar bitta to'lqinga yig'iladi (shard +
+    manifest yozuvi, operatorning bir nechta fayli). handler(o'zgargan nomlar) True qaytarsa, to'lqin
+    oxirida on_change() bir marta chaqiriladi - ma'lumotlar versiyasi nechta fayl o'zgarmasin bir marta oshadi.
+    Jarayonning o'z yozuvlari (write_json -> expect()) e'tiborga olinmaydi.
+    """
+
+    def __init__(self, backend, debounce, on_change=None):
+        self.backend = backend
+        self.debounce = debounce
+        self.on_change = on_change
+        self.watches = {}
+        self.expected = {}
+        self.thread = None
+        self.events = 0
+        self.reloads = 0
+
+    def watch(self, directory, names, handler):
+        """names - kuzatiladigan fayl nomlari (None - papkadagi barcha fayllar, .tmp dan tashqari)."""
+        directory = os.path.abspath(directory)
+        os.makedirs(directory, exist_ok=True)
+        watches = self.watches.setdefault(directory, [])
+        watches.append((set(names) if names is not None else None, handler))
+        # Polling backend papkadagi faqat shu nomlarni stat qiladi
+        wanted = [n for n, _ in watches]
+        self.backend.add(directory, None if None in wanted else set().union(*wanted))
+
+    def watch_file(self, path, handler):
+        self.watch(os.path.dirname(os.path.abspath(path)), [os.path.basename(path)], handler)
+
+    def expect(self, path):
+        try:
+            self.expected[os.path.abspath(path)] = _stamp(path)
+        except OSError:
+            pass
+
+    def _own(self, path):
+        expected = self.expected.get(path)
+        if expected is None:
+            return False
+        try:
+            return _stamp(path) == expected
+        except OSError:
+            return False
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                events = self.backend.wait(None)
+                if not events:
+                    continue
+                deadline = time.monotonic() + self.debounce
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    events.extend(self.backend.wait(remaining))
+                self.events += len(events)
+                self._dispatch(events)
+            except Exception as e:
+                print(f"❌ Fayl kuzatuvchisida xato: {e}")
+                time.sleep(1)
+
+    def _dispatch(self, events):
+        changed = {}
+        for directory, name in events:
+            if name is None:
+                changed[directory] = None
+            elif changed.get(directory, ()) is not None:
+                changed.setdefault(directory, set()).add(name)
+        bump = False
+        for directory, names in changed.items():
+            for wanted, handler in self.watches.get(directory, ()):
+                if names is None:
+                    hit = set(wanted) if wanted is not None else None
+                else:
+                    hit = {name for name in names
+                           if (name in wanted if wanted is not None else not name.endswith('.tmp'))
+                           and not self._own(os.path.join(directory, name))}
+                    if not hit:
+                        continue
+                try:
+                    if handler(hit):
+                        bump = True
+                except Exception as e:
+                    print(f"❌ O'zgargan faylni qayta yuklashda xato ({directory}): {e}")
+        if bump:
+            self.reloads += 1
+            if self.on_change is not None:
+                self.on_change()
+
+FILE_WATCHER = None
+SNAPSHOTS = None   # bot jarayonida SnapshotReader
+PUBLISHER = None   # admin jarayonida SnapshotPublisher
+
 # Ma'lumotlarni yuklash funksiyalari
+@profiled('load_data')
 def load_data():
+    started = time.perf_counter()
     try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"📊 Ma'lumotlar yuklandi: {len(data)} ta viloyat")
-                return data
+        if SNAPSHOTS is None:
+            data = STORE.view()
         else:
-            print("🆕 Yangi ma'lumotlar bazasi yaratildi")
-            initial_data = {}
-            save_data(initial_data)
-            return initial_data
+            # Bot jarayoni snapshotdan o'qiydi. Snapshot hali yo'q bo'lsa - tayyor shardlardan,
+            # eski data.json ni esa faqat admin jarayoni shardlarga bo'ladi
+            data = SNAPSHOTS.view()
+            if data is None:
+                data = STORE.view() if os.path.exists(STORE.manifest_path) else {}
+        METRICS.observe('smartmahalla_storage_duration_seconds', time.perf_counter() - started, (('op', 'load_data'),))
+        return data
     except Exception as e:
+        METRICS.inc('smartmahalla_storage_errors_total', 1, (('op', 'load_data'),))
         print(f"❌ Ma'lumotlarni yuklashda xato: {e}")
-        return {}
+        # Buzilgan manifestdan ko'ra oxirgi to'g'ri ro'yxat yaxshiroq
+        return RegionsView(STORE, STORE.files)
 
-def save_data(data):
+@profiled('save_data')
+def save_data(data, *viloyatlar):
+    """viloyatlar - o'zgargan viloyat(lar) nomi; berilmasa so'rov yuklagan barcha viloyatlar yoziladi."""
+    started = time.perf_counter()
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"💾 Ma'lumotlar saqlandi: {len(data)} ta viloyat")
+        size = STORE.save(data, viloyatlar or None)
+        METRICS.inc('smartmahalla_storage_bytes_total', size, (('op', 'save_data'),))
+        METRICS.observe('smartmahalla_storage_duration_seconds', time.perf_counter() - started, (('op', 'save_data'),))
+        print(f"💾 Ma'lumotlar saqlandi: {', '.join(viloyatlar) if viloyatlar else f'{len(data)} ta viloyat'}")
+        if PUBLISHER is not None:
+            PUBLISHER.request()
+        schedule_keyboard_refresh()
         return True
     except Exception as e:
+        METRICS.inc('smartmahalla_storage_errors_total', 1, (('op', 'save_data'),))
+        record_save_error('save_data', e)
         print(f"❌ Ma'lumotlarni saqlashda xato: {e}")
+        # Xotiradagi o'zgarish diskka tushmadi - keyingi o'qishda fayldagi holatga qaytamiz
+        STORE.invalidate()
         return False
 
 def load_admins():
     try:
         if os.path.exists(ADMINS_FILE):
-            with open(ADMINS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return read_json(ADMINS_FILE)
         else:
             default_admins = {
                 "smartmahalla": {
@@ -94,22 +1930,21 @@ def load_admins():
 
 def save_admins(admins):
     try:
-        with open(ADMINS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(admins, f, ensure_ascii=False, indent=2)
+        write_json(ADMINS_FILE, admins)
         return True
     except Exception as e:
+        record_save_error('admins', e)
         print(f"❌ Adminlarni saqlashda xato: {e}")
         return False
 
 def load_settings():
     try:
         if os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                settings = json.load(f)
-                for key, value in DEFAULT_SETTINGS.items():
-                    if key not in settings:
-                        settings[key] = value
-                return settings
+            settings = read_json(SETTINGS_FILE)
+            for key, value in DEFAULT_SETTINGS.items():
+                if key not in settings:
+                    settings[key] = value
+            return settings
         else:
             save_settings(DEFAULT_SETTINGS)
             return DEFAULT_SETTINGS
@@ -119,20 +1954,19 @@ def load_settings():
 
 def save_settings(settings):
     try:
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
+        write_json(SETTINGS_FILE, settings)
         return True
     except Exception as e:
+        record_save_error('settings', e)
         print(f"❌ Sozlamalarni saqlashda xato: {e}")
         return False
 
 def load_activity():
     try:
         if os.path.exists(ACTIVITY_FILE):
-            with open(ACTIVITY_FILE, 'r', encoding='utf-8') as f:
-                activities = json.load(f)
-                # Faqat oxirgi 50 ta faoliyatni qaytaramiz
-                return activities[-50:]
+            activities = read_json(ACTIVITY_FILE)
+            # Faqat oxirgi 50 ta faoliyatni qaytaramiz
+            return activities[-50:]
         else:
             return []
     except Exception as e:
@@ -141,32 +1975,731 @@ def load_activity():
 
 def save_activity(activities):
     try:
-        with open(ACTIVITY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(activities, f, ensure_ascii=False, indent=2)
+        write_json(ACTIVITY_FILE, activities)
         return True
     except Exception as e:
+        record_save_error('activity', e)
         print(f"❌ Faoliyatni saqlashda xato: {e}")
         return False
 
 def add_activity(action, details, username):
-    activities = load_activity()
-    activities.append({
-        "action": action,
-        "details": details,
-        "username": username,
-        "timestamp": datetime.now().isoformat(),
-        "time_display": datetime.now().strftime("%H:%M"),
-        "date_display": datetime.now().strftime("%d.%m.%Y")
-    })
-    if len(activities) > 50:
-        activities = activities[-50:]
-    save_activity(activities)
+    with WRITE_LOCK:
+        activities = load_activity()
+        activities.append({
+            "action": action,
+            "details": details,
+            "username": username,
+            "timestamp": datetime.now().isoformat(),
+            "time_display": datetime.now().strftime("%H:%M"),
+            "date_display": datetime.now().strftime("%d.%m.%Y")
+        })
+        if len(activities) > 50:
+            activities = activities[-50:]
+        save_activity(activities)
+    LIVE.activity(activities[-1])
+
+# Obunachilar (MFY bo'yicha foydalanuvchilar) hisobi
+# 'exact' rejimida har bir MFY uchun user ID lar saralangan massivda saqlanadi,
+# 'hll' rejimida esa HyperLogLog orqali taxminiy son yuritiladi.
+SUBSCRIBER_MODE = os.environ.get('SUBSCRIBER_MODE', 'exact')
+SUBSCRIBERS_FLUSH_INTERVAL = float(os.environ.get('SUBSCRIBERS_FLUSH_INTERVAL', 10))
+HLL_PRECISION = 12
+
+def _massiv_baytlari(arr):
+    # Fayl formati doim little-endian bo'ladi
+    if sys.byteorder != 'little':
+        arr = array('q', arr)
+        arr.byteswap()
+    return base64.b64encode(arr.tobytes()).decode('ascii')
+
+class ExactCounter:
+    """MFY obunachilari: saralangan int64 massiv (aniq son)."""
+    __slots__ = ('ids',)
+
+    def __init__(self, ids=None):
+        self.ids = ids if ids is not None else array('q')
+
+    def add(self, user_id):
+        i = bisect.bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            return False
+        self.ids.insert(i, user_id)
+        return True
+
+    def __contains__(self, user_id):
+        i = bisect.bisect_left(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def count(self):
+        return len(self.ids)
+
+    def user_ids(self):
+        return list(self.ids)
+
+    def dump(self):
+        return _massiv_baytlari(self.ids)
+
+    @classmethod
+    def load(cls, raw):
+        ids = array('q')
+        ids.frombytes(base64.b64decode(raw))
+        if sys.byteorder != 'little':
+            ids.byteswap()
+        return cls(ids)
+
+    @classmethod
+    def union(cls, counters):
+        ids = set()
+        for counter in counters:
+            ids.update(counter.ids)
+        return cls(array('q', sorted(ids)))
+
+_NOLMAS = re.compile(rb'[^\x00]')
+
+class HyperLogLog:
+    """MFY obunachilari: taxminiy son (2**p bayt, ~1.6% xato p=12 da)."""
+    __slots__ = ('p', 'registers', '_estimate')
+
+    def __init__(self, p=HLL_PRECISION, registers=None):
+        self.p = p
+        self.registers = registers if registers is not None else bytearray(1 << p)
+        self._estimate = None
+
+    def add(self, user_id):
+        h = int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), 'big')
+        idx = h >> (64 - self.p)
+        rest = (h << self.p) & 0xFFFFFFFFFFFFFFFF
+        rank = min(64 - self.p, 64 - rest.bit_length()) + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+            self._estimate = None
+            return True
+        return False
+
+    def count(self):
+        if self._estimate is None:
+            m = len(self.registers)
+            alpha = 0.7213 / (1 + 1.079 / m)
+            estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+            zeros = self.registers.count(0)
+            if estimate <= 2.5 * m and zeros:
+                estimate = m * math.log(m / zeros)
+            self._estimate = int(round(estimate))
+        return self._estimate
+
+    def user_ids(self):
+        return []
+
+    def dump(self):
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @classmethod
+    def load(cls, raw):
+        registers = bytearray(base64.b64decode(raw))
+        return cls(p=len(registers).bit_length() - 1, registers=registers)
+
+    @classmethod
+    def union(cls, counters):
+        # Birlashma: registrlar bo'yicha maksimum (bir xil p). MFY hisoblagichlari odatda siyrak -
+        # faqat nol bo'lmagan registrlar ko'riladi
+        result = None
+        for counter in counters:
+            if result is None:
+                result = cls(counter.p, bytearray(counter.registers))
+                continue
+            registers = result.registers
+            for match in _NOLMAS.finditer(counter.registers):
+                i = match.start()
+                if counter.registers[i] > registers[i]:
+                    registers[i] = counter.registers[i]
+        return result if result is not None else cls()
+
+class SubscriberRegistry:
+    """Viloyat -> tuman -> MFY bo'yicha obunachilar. Sonlar inkremental yuritiladi.
+
+    Bir foydalanuvchi bir nechta MFYga obuna bo'lishi mumkin: MFY sonlarining yig'indisi - obunalar
+    (subscriptions), foydalanuvchilar esa alohida umumiy hisoblagichda (users) bir martadan sanaladi.
+    """
+
+    def __init__(self, path, mode='exact'):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.RLock()
+        self.mfylar = {}
+        # Takrorlanmas foydalanuvchilar (MFY o'chirilsa ham kamaymaydi - odam botdan foydalangan)
+        self.users = self._new_counter()
+        # MFY obunalari yig'indisi
+        self.subscriptions = 0
+        # Hisobotlar uchun: (viloyat,) va (viloyat, tuman) bo'yicha obunalar soni
+        self.areas = {}
+        # Faylga hali yozilmagan o'zgarishlar soni (write-behind navbati, /readyz da ko'rinadi)
+        self.pending = 0
+        self._flusher = None
+        # Bot jarayonida: yangi obunalar faylga emas, egasiga (admin jarayoniga) yuboriladi
+        self.forward = None
+        self.stamp = None
+        self._load()
+
+    def _new_counter(self):
+        return HyperLogLog() if self.mode == 'hll' else ExactCounter()
+
+    def _load(self, announce=True):
+        try:
+            if not os.path.exists(self.path):
+                return
+            self.stamp = _stamp(self.path)
+            raw = read_json(self.path)
+            file_mode = raw.get('mode', 'exact')
+            counter_cls = HyperLogLog if file_mode == 'hll' else ExactCounter
+
+            def load(encoded):
+                counter = counter_cls.load(encoded)
+                if file_mode == 'exact' and self.mode == 'hll':
+                    hll = HyperLogLog()
+                    for user_id in counter.ids:
+                        hll.add(user_id)
+                    counter = hll
+                return counter
+
+            for v, tumanlar in raw.get('mfylar', {}).items():
+                for t, mfylar in tumanlar.items():
+                    for m, encoded in mfylar.items():
+                        counter = load(encoded)
+                        self.mfylar.setdefault(v, {}).setdefault(t, {})[m] = counter
+                        n = counter.count()
+                        self.subscriptions += n
+                        self._area_add((v, t), n)
+            if file_mode == 'hll' and self.mode != 'hll':
+                print("⚠️ Obunachilar fayli HLL rejimida, aniq rejimga o'tkazib bo'lmaydi")
+                self.mode = 'hll'
+            if 'users' in raw:
+                self.users = load(raw['users'])
+            else:
+                # Eski fayl: foydalanuvchilar MFY hisoblagichlarining birlashmasi
+                counters = [c for tumanlar in self.mfylar.values() for mfylar in tumanlar.values()
+                            for c in mfylar.values()]
+                self.users = (HyperLogLog if self.mode == 'hll' else ExactCounter).union(counters)
+            if announce:
+                print(f"👥 Obunachilar yuklandi: {self.total} ta foydalanuvchi, {self.subscriptions} ta obuna")
+        except Exception as e:
+            print(f"❌ Obunachilarni yuklashda xato: {e}")
+
+    def add(self, viloyat, tuman, mahalla, user_id):
+        with self.lock:
+            tumanlar = self.mfylar.setdefault(viloyat, {})
+            mfylar = tumanlar.setdefault(tuman, {})
+            counter = mfylar.get(mahalla)
+            if counter is None:
+                counter = mfylar[mahalla] = self._new_counter()
+            before = counter.count() if self.mode == 'hll' else 0
+            if not counter.add(user_id):
+                return False
+            delta = (counter.count() - before) if self.mode == 'hll' else 1
+            self.users.add(user_id)
+            self.subscriptions += delta
+            self._area_add((viloyat, tuman), delta)
+            if self.forward is None:
+                self.pending += 1
+        if self.forward is not None:
+            self.forward(viloyat, tuman, mahalla, user_id)
+            return True
+        self._ensure_flusher()
+        return True
+
+    def refresh(self):
+        """Fayl boshqa jarayon tomonidan yangilangan bo'lsa qayta o'qiydi (web worker va bot jarayonlari uchun)."""
+        try:
+            stamp = _stamp(self.path)
+        except OSError:
+            return False
+        if stamp == self.stamp:
+            return False
+        with self.lock:
+            self.mfylar = {}
+            self.users = self._new_counter()
+            self.subscriptions = 0
+            self.areas = {}
+            self._load(announce=False)
+        return True
+
+    @property
+    def total(self):
+        """Takrorlanmas foydalanuvchilar soni."""
+        return self.users.count()
+
+    def count(self, viloyat, tuman, mahalla):
+        counter = self.mfylar.get(viloyat, {}).get(tuman, {}).get(mahalla)
+        return counter.count() if counter is not None else 0
+
+    def area_total(self, viloyat, tuman=None):
+        """Viloyat yoki tuman obunalari (MFY sonlari yig'indisi) - O(1), daraxt aylanmaydi."""
+        return self.areas.get((viloyat,) if tuman is None else (viloyat, tuman), 0)
+
+    def _area_add(self, path, delta):
+        # path ning barcha yuqori hududlari (viloyat, tuman) yig'indisi
+        for depth in range(1, min(len(path), 2) + 1):
+            key = tuple(path[:depth])
+            self.areas[key] = self.areas.get(key, 0) + delta
+
+    def _area_move(self, old_path, new_path, n):
+        """Tugun (n ta obunachi) ko'chirilganda/o'chirilganda hudud yig'indilari; new_path=None - o'chirish."""
+        old_path = tuple(old_path)
+        self._area_add(old_path[:-1], -n)
+        if new_path is not None:
+            self._area_add(tuple(new_path)[:-1], n)
+        # Tugunning o'zi va ichidagi hududlar yangi nom ostiga o'tadi
+        k = len(old_path)
+        for key in [key for key in self.areas if key[:k] == old_path]:
+            value = self.areas.pop(key)
+            if new_path is not None:
+                self.areas[tuple(new_path) + key[k:]] = value
+
+    def user_ids(self, viloyat, tuman=None, mahalla=None):
+        """Tanlangan hudud obunachilari (faqat 'exact' rejimida)."""
+        with self.lock:
+            tumanlar = self.mfylar.get(viloyat, {})
+            if tuman is not None:
+                tumanlar = {tuman: tumanlar.get(tuman, {})}
+            ids = set()
+            for mfylar in tumanlar.values():
+                if mahalla is not None:
+                    mfylar = {mahalla: mfylar[mahalla]} if mahalla in mfylar else {}
+                for counter in mfylar.values():
+                    ids.update(counter.user_ids())
+            return sorted(ids)
+
+    def _tree_count(self, tree):
+        if isinstance(tree, dict):
+            return sum(self._tree_count(child) for child in tree.values())
+        return tree.count()
+
+    def remove(self, viloyat, tuman=None, mahalla=None):
+        with self.lock:
+            if viloyat not in self.mfylar:
+                return
+            path = tuple(x for x in (viloyat, tuman, mahalla) if x is not None)
+            if tuman is None:
+                removed = self.mfylar.pop(viloyat)
+            elif mahalla is None:
+                removed = self.mfylar[viloyat].pop(tuman, {})
+            else:
+                removed = self.mfylar[viloyat].get(tuman, {}).pop(mahalla, None)
+            if removed is not None:
+                n = self._tree_count(removed)
+                self.subscriptions -= n
+                self._area_move(path, None, n)
+                self.pending += 1
+
+    def move(self, old_path, new_path):
+        """Viloyat/tuman/MFY qayta nomlanganda yoki ko'chirilganda."""
+        with self.lock:
+            parent = self.mfylar
+            for key in old_path[:-1]:
+                parent = parent.get(key)
+                if parent is None:
+                    return
+            if old_path[-1] not in parent:
+                return
+            node = parent.pop(old_path[-1])
+            target = self.mfylar
+            for key in new_path[:-1]:
+                target = target.setdefault(key, {})
+            target[new_path[-1]] = node
+            self._area_move(old_path, new_path, self._tree_count(node))
+            self.pending += 1
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return True
+            payload = {
+                'mode': self.mode,
+                'users': self.users.dump(),
+                'mfylar': {
+                    v: {t: {m: c.dump() for m, c in mfylar.items()} for t, mfylar in tumanlar.items()}
+                    for v, tumanlar in self.mfylar.items()
+                }
+            }
+            pending, self.pending = self.pending, 0
+        try:
+            write_json(self.path, payload, pretty=False)
+            self.stamp = _stamp(self.path)
+            return True
+        except Exception as e:
+            with self.lock:
+                self.pending += pending
+            record_save_error('subscribers', e)
+            print(f"❌ Obunachilarni saqlashda xato: {e}")
+            return False
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self.lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(SUBSCRIBERS_FLUSH_INTERVAL)
+            self.flush()
+
+SUBSCRIBERS = SubscriberRegistry(SUBSCRIBERS_FILE, SUBSCRIBER_MODE)
+atexit.register(SUBSCRIBERS.flush)
 
 # Flask admin panel
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'smart-mahallah-secret-key-2024')
 app.config['SESSION_TYPE'] = 'filesystem'
 
+class ModelJSONProvider(DefaultJSONProvider):
+    """jsonify() va |tojson: JSON_CODEC orqali; model obyektlari data.json formatida beriladi."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, _Entity):
+            return o.to_json()
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        pretty = bool(kwargs.get('indent'))
+        sort_keys = kwargs.get('sort_keys', self.sort_keys)
+        return JSON_CODEC.dumps(obj, pretty=pretty, sort_keys=sort_keys, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return JSON_CODEC.loads(s)
+
+app.json = ModelJSONProvider(app)
+
+@app.before_request
+def _metrics_start():
+    g.request_started = time.perf_counter()
+
+# gunicorn (RUN_MODE=web) jarayonlari
+IS_WEB_WORKER = False
+# So'rovlarni qat'iy sonli threadlar bilan xizmat qiladigan server (gunicorn gthread, waitress) - threadlar
+# soni; werkzeug har so'rovga yangi thread ochadi - None
+WEB_POOL_THREADS = None
+
+# region_write() bilan belgilangan so'rovlar qulflaydigan viloyatlar shu maydonlardan olinadi
+REGION_FIELDS = ('viloyat_nomi', 'old_viloyat_nomi', 'new_viloyat_nomi')
+
+def region_write(all_regions=False):
+    """POST endpoint WRITE_LOCK o'rniga viloyat qulflari (REGION_LOCKS) ostida bajariladi.
+
+    Viloyatlar payloaddagi REGION_FIELDS dan olinadi; all_regions=True - barcha viloyatlar.
+    """
+    def decorator(fn):
+        fn.region_write = 'all' if all_regions else 'payload'
+        return fn
+    return decorator
+
+def _write_lock_start(view):
+    # POST so'rovlar (barcha o'zgartirishlar) workerlar orasida navbat bilan bajariladi: ma'lumotlar
+    # tahrirlari - o'z viloyati ichida, qolganlari (adminlar, sozlamalar, xabarnomalar) - WRITE_LOCK ostida.
+    # login_required ichidan, sessiya tekshirilgandan keyin chaqiriladi: anonim so'rov qulf olmaydi.
+    # RUN_MODE=async da barcha so'rovlar bitta threadda ketma-ket - qulf kerak emas
+    if request.method != 'POST' or RUN_MODE == 'async':
+        return
+    mode = getattr(view, 'region_write', None)
+    if mode is None:
+        WRITE_LOCK.acquire()
+        g.write_locked = True
+        return
+    names = None
+    if mode == 'payload':
+        payload = request.get_json(silent=True)
+        payload = payload if isinstance(payload, dict) else {}
+        names = [payload[field].strip() for field in REGION_FIELDS if isinstance(payload.get(field), str)]
+    started = time.perf_counter()
+    g.region_locks = REGION_LOCKS.acquire(names)
+    METRICS.observe('smartmahalla_region_lock_wait_seconds', time.perf_counter() - started, (('mode', mode),))
+
+@app.teardown_request
+def _write_lock_finish(exc=None):
+    if g.pop('write_locked', False):
+        WRITE_LOCK.release()
+    token = g.pop('region_locks', None)
+    if token is not None:
+        REGION_LOCKS.release(token)
+
+@app.before_request
+def _worker_refresh():
+    # Obunachilar va xabarnomalar egasi - master jarayon; worker ularning fayldagi holatini o'qiydi
+    # (fayl kuzatuvchisi ishlasa - u o'zi yangilaydi)
+    if IS_WEB_WORKER and FILE_WATCHER is None:
+        SUBSCRIBERS.refresh()
+        BROADCASTER.refresh()
+
+@app.before_request
+def _profile_start():
+    if PROFILER is not None:
+        g.profile_state = PROFILER.begin()
+
+@app.after_request
+def _profile_finish(response):
+    state = g.pop('profile_state', None)
+    if state is not None:
+        PROFILER.end(state, 'http', request.endpoint or request.path)
+    return response
+
+@app.after_request
+def _metrics_finish(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = (('endpoint', request.endpoint or 'unknown'),)
+        METRICS.observe('smartmahalla_http_request_duration_seconds', time.perf_counter() - started, endpoint)
+        METRICS.inc('smartmahalla_http_responses_total', 1, endpoint + (('status', response.status_code),))
+        if response.status_code >= 400:
+            METRICS.inc('smartmahalla_http_errors_total', 1, endpoint)
+    return response
+
+class CompressionCache:
+    """Siqilgan javob tanalari: (kodlash, tana xeshi) -> baytlar, hajm chegarali LRU.
+
+    Kalit - tananing o'zi: sahifa ma'lumotlar versiyasi, til va faoliyat ro'yxatiga bog'liq,
+    ularning har biri o'zgarsa tana (demak xesh) ham o'zgaradi; eski yozuvlar LRU bo'yicha chiqadi.
+    """
+
+    def __init__(self, limit_bytes, level):
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        self.brotli = brotli
+        # Afzallik tartibida
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self.limit = limit_bytes
+        self.level = level
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # {kodlash: [asl baytlar, siqilgan baytlar]} - yuborilgan javoblar bo'yicha
+        self.totals = {name: [0, 0] for name in self.encodings}
+
+    def negotiate(self, accept_encodings):
+        for name in self.encodings:
+            if accept_encodings[name]:
+                return name
+        return None
+
+    def _compress(self, encoding, body):
+        if encoding == 'br':
+            return self.brotli.compress(body, quality=min(self.level, 11))
+        # mtime=0 - bir xil tana doim bir xil baytlar
+        return gzip.compress(body, compresslevel=self.level, mtime=0)
+
+    def get(self, encoding, body):
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        with self.lock:
+            compressed = self.entries.get(key)
+            if compressed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if compressed is None:
+            compressed = self._compress(encoding, body)
+            with self.lock:
+                self.misses += 1
+                if key not in self.entries and len(compressed) <= self.limit:
+                    self.entries[key] = compressed
+                    self.size += len(compressed)
+                    while self.size > self.limit:
+                        _, old = self.entries.popitem(last=False)
+                        self.size -= len(old)
+        with self.lock:
+            totals = self.totals[encoding]
+            totals[0] += len(body)
+            totals[1] += len(compressed)
+        return compressed
+
+COMPRESSOR = CompressionCache(int(COMPRESS_CACHE_MB * 1024 * 1024), COMPRESS_LEVEL)
+_COMPRESSIBLE = {'text/html', 'application/json', 'text/plain', 'text/csv'}
+
+@app.after_request
+def _compress_response(response):
+    if (not COMPRESSION or response.direct_passthrough or response.status_code != 200
+            or response.mimetype not in _COMPRESSIBLE or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = COMPRESSOR.negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(COMPRESSOR.get(encoding, body))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def _bearer_ok(secret):
+    """Authorization: Bearer <secret> tekshiruvi (doimiy vaqtli taqqoslash). secret bo'sh bo'lsa - yo'q."""
+    header = request.headers.get('Authorization', '')
+    if not secret or not header.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(header[7:].encode(), secret.encode())
+
+@app.route('/metrics')
+def metrics():
+    if not METRICS_TOKEN:
+        return 'Not Found\n', 404
+    if not _bearer_ok(METRICS_TOKEN):
+        return 'Forbidden\n', 403
+    return METRICS.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def _cache_stats():
+    return {'render': (RENDER_CACHE.hits, RENDER_CACHE.misses), 'data': (STORE.hits, STORE.misses),
+            'keyboard': (KEYBOARDS.hits, KEYBOARDS.misses), 'stats': (STATS_CACHE.hits, STATS_CACHE.misses),
+            'compression': (COMPRESSOR.hits, COMPRESSOR.misses),
+            'binary_shards': (STORE.binary.hits, STORE.binary.misses) if STORE.binary is not None else (0, 0)}
+
+def _cache_requests():
+    return [((('cache', name), ('result', result)), value)
+            for name, (hits, misses) in _cache_stats().items()
+            for result, value in (('hit', hits), ('miss', misses))]
+
+def _cache_hit_ratio():
+    return [((('cache', name),), round(hits / (hits + misses), 4) if hits + misses else 0)
+            for name, (hits, misses) in _cache_stats().items()]
+
+def _bot_queue_depth():
+    return BOT_APP.update_queue.qsize() if BOT_APP is not None else 0
+
+METRICS.collect('smartmahalla_data_file_bytes', 'gauge', "Ma'lumotlar (manifest + shardlar) hajmi", STORE.disk_usage)
+METRICS.collect('smartmahalla_data_shards_loaded', 'gauge', "Xotiradagi viloyat shardlari",
+                lambda: len(STORE.cache))
+METRICS.collect('smartmahalla_data_shard_evictions_total', 'counter', "Xotira limiti tufayli chiqarilgan shardlar",
+                lambda: STORE.evictions)
+METRICS.collect('smartmahalla_activity_file_bytes', 'gauge', "activity.json hajmi", lambda: _file_size(ACTIVITY_FILE))
+METRICS.collect('smartmahalla_subscribers_total', 'gauge', "Obuna bo'lgan foydalanuvchilar (takrorlanmas)",
+                lambda: SUBSCRIBERS.total)
+METRICS.collect('smartmahalla_subscriptions_total', 'gauge', "MFY obunalari (bir foydalanuvchi - bir nechta MFY)",
+                lambda: SUBSCRIBERS.subscriptions)
+METRICS.collect('smartmahalla_cache_requests_total', 'counter', "Kesh murojaatlari (hit/miss)", _cache_requests)
+METRICS.collect('smartmahalla_cache_hit_ratio', 'gauge', "Kesh hit ulushi", _cache_hit_ratio)
+METRICS.collect('smartmahalla_bot_update_queue_depth', 'gauge', "Bot update navbati uzunligi", _bot_queue_depth)
+METRICS.collect('smartmahalla_snapshot_seq', 'gauge', "Oxirgi yozilgan snapshot raqami (supervisor rejimi)",
+                lambda: PUBLISHER.seq if PUBLISHER is not None else 0)
+METRICS.collect('smartmahalla_file_watch_events_total', 'counter', "Fayl kuzatuvchisi hodisalari",
+                lambda: [((('backend', FILE_WATCHER.backend.name),), FILE_WATCHER.events)] if FILE_WATCHER else [])
+METRICS.collect('smartmahalla_file_watch_reloads_total', 'counter',
+                "Tashqi o'zgarish tufayli ma'lumotlar versiyasi oshirilgan to'lqinlar",
+                lambda: [((('backend', FILE_WATCHER.backend.name),), FILE_WATCHER.reloads)] if FILE_WATCHER else [])
+METRICS.collect('smartmahalla_report_rollup_builds_total', 'counter',
+                "Hisobot yig'indilarining viloyat bo'yicha to'liq qayta qurilishlari", lambda: ROLLUPS.builds)
+METRICS.collect('smartmahalla_staff_columns_builds_total', 'counter',
+                "Xodimlar ustunlari bloklarining (viloyat bo'yicha) qayta qurilishlari",
+                lambda: [((('backend', STAFF_TABLE.kernels.name),), STAFF_TABLE.builds)])
+METRICS.collect('smartmahalla_staff_columns_rows', 'gauge', "Xodimlar ustunlaridagi qatorlar (MFY x lavozim)",
+                lambda: STAFF_TABLE.rows())
+METRICS.collect('smartmahalla_http_compression_bytes_total', 'counter',
+                "Siqilgan javoblar hajmi: asl (original) va yuborilgan (compressed)",
+                lambda: [((('encoding', name), ('stage', stage)), value)
+                         for name, (original, compressed) in list(COMPRESSOR.totals.items())
+                         for stage, value in (('original', original), ('compressed', compressed))])
+METRICS.collect('smartmahalla_http_compression_ratio', 'gauge', "Siqilgan / asl hajm nisbati",
+                lambda: [((('encoding', name),), round(compressed / original, 4) if original else 0)
+                         for name, (original, compressed) in list(COMPRESSOR.totals.items())])
+METRICS.collect('smartmahalla_http_compression_cache_bytes', 'gauge', "Siqilgan javoblar keshi hajmi",
+                lambda: COMPRESSOR.size)
+METRICS.collect('smartmahalla_live_clients', 'gauge', "Ulangan jonli dashboardlar (SSE)", lambda: len(LIVE.clients))
+METRICS.collect('smartmahalla_live_events_total', 'counter', "Dashboardlarga yuborilgan hodisalar",
+                lambda: LIVE.events)
+METRICS.collect('smartmahalla_live_dropped_total', 'counter', "Sekin o'qigani uchun uzilgan SSE ulanishlari",
+                lambda: LIVE.dropped)
+METRICS.collect('smartmahalla_geo_points', 'gauge', "Joylashuv indeksidagi MFYlar", lambda: MFY_LOCATIONS.points)
+METRICS.collect('smartmahalla_geo_index_builds_total', 'counter', "Joylashuv indeksiga viloyat qo'shishlar",
+                lambda: MFY_LOCATIONS.builds)
+METRICS.collect('smartmahalla_phone_index_keys', 'gauge', "Telefon indeksidagi raqamlar", lambda: len(PHONES.phones))
+METRICS.collect('smartmahalla_json_codec_info', 'gauge', "Ishlatilayotgan JSON kodek",
+                lambda: [((('codec', JSON_CODEC.name),), 1)])
+
+# Sog'liq tekshiruvi (orkestrator uchun, login talab qilinmaydi)
+def write_behind_pending():
+    """Hali diskka/Telegramga yetmagan ishlar: obunalar o'zgarishlari, xabarnomalar, snapshot so'rovi."""
+    with BROADCASTER.lock:
+        broadcasts = sum(1 for job in BROADCASTER.jobs.values() if job['status'] in BROADCAST_ACTIVE)
+    snapshot = isinstance(PUBLISHER, SnapshotPublisher) and PUBLISHER.event.is_set()
+    return {'subscribers': SUBSCRIBERS.pending, 'broadcasts': broadcasts, 'snapshot': int(snapshot)}
+
+def _bot_problems(entry, now):
+    """Polling holatidagi bot uchun muammolar (bo'sh ro'yxat - bot tirik)."""
+    name = entry.get('name')
+    problems = []
+    if now - (entry.get('checked_at') or 0) > 3 * HEALTH_INTERVAL:
+        problems.append(f"{name}: holat {now - (entry.get('checked_at') or 0):.0f} s yangilanmagan")
+    polled = entry.get('last_poll') or entry.get('started_at') or now
+    if now - polled > BOT_POLL_STALE:
+        problems.append(f"{name}: oxirgi getUpdates {now - polled:.0f} s oldin")
+    if (entry.get('loop_lag') or 0) > HEALTH_MAX_LOOP_LAG:
+        problems.append(f"{name}: event loop kechikishi {entry['loop_lag']:.2f} s")
+    return problems
+
+def _health_response(problems, payload):
+    payload = dict(status='fail' if problems else 'ok', problems=problems, **payload)
+    response = jsonify(payload)
+    response.status_code = 503 if problems else 200
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: jarayon javob beryapti; bot shu jarayonda bo'lsa - threadi tirik va polling osilmagan.
+
+    Bot qayta ishga tushirilayotgan bo'lsa (restarting) jarayon tirik hisoblanadi - buni /readyz ko'rsatadi.
+    """
+    problems = []
+    bot = None
+    if BOT_HEALTH.name is not None:
+        bot = BOT_HEALTH.snapshot()
+        if BOT_THREAD is not None and not BOT_THREAD.is_alive():
+            problems.append("bot threadi to'xtagan")
+        elif bot['state'] == 'polling':
+            problems += _bot_problems(bot, time.time())
+    return _health_response(problems, {'pid': os.getpid(), 'bot': bot})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: ma'lumotlar bazasi ochilgan va barcha botlar poll qilyapti (HEALTH_DIR bo'yicha)."""
+    now = time.time()
+    problems = []
+    if STORE.manifest_stamp is None:
+        problems.append("ma'lumotlar bazasi ochilmagan")
+    bots = []
+    for entry in read_bot_health():
+        if entry.get('state') == 'polling':
+            entry_problems = _bot_problems(entry, now)
+        else:
+            entry_problems = [f"{entry.get('name')}: {entry.get('state')}"]
+        problems += entry_problems
+        polled = entry.get('last_poll')
+        bots.append(dict(entry, ready=not entry_problems,
+                         poll_age=round(now - polled, 3) if polled else None))
+    updated = STORE.updated_at
+    if updated is None and STORE.manifest_stamp is not None:
+        # Ishga tushgandan beri o'zgarish bo'lmagan - oxirgi yozilgan manifest vaqti
+        updated = os.path.getmtime(STORE.manifest_path)
+    return _health_response(problems, {
+        'store': {'version': STORE.version, 'regions': len(STORE.files),
+                  'age_seconds': round(now - updated, 3) if updated else None},
+        'bots': bots,
+        'write_behind': write_behind_pending(),
+        'last_save_error': LAST_SAVE_ERROR,
+    })
+
+METRICS.describe('smartmahalla_bot_restarts_total', 'counter', "Yiqilgan bot pollingini qayta ishga tushirishlar")
+METRICS.collect('smartmahalla_bot_poll_age_seconds', 'gauge', "Oxirgi muvaffaqiyatli getUpdates dan beri",
+                lambda: BOT_HEALTH.poll_age() or 0)
+METRICS.collect('smartmahalla_bot_loop_lag_seconds', 'gauge', "Bot event loop kechikishi",
+                lambda: BOT_HEALTH.loop_lag)
+METRICS.collect('smartmahalla_write_behind_pending', 'gauge', "Hali yozilmagan/yuborilmagan ishlar",
+                lambda: [((('queue', name),), value) for name, value in write_behind_pending().items()])
+
 # Til matnlari
 TEXTS = {
     'uz': {
@@ -180,6 +2713,7 @@ TEXTS = {
         'activity': 'Faoliyat',
         'logout': 'Chiqish',
         'welcome': 'Xush kelibsiz',
+        'total_users': 'Foydalanuvchilar',
         'total_regions': 'Viloyatlar',
         'total_districts': 'Tumanlar/Shaharlar',
         'total_neighborhoods': 'MFYlar',
@@ -293,80 +2827,914 @@ TEXTS = {
     }
 }
 
-# Login tizimi
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not session.get('logged_in'):
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
+# Login tizimi
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('logged_in'):
+            return redirect(url_for('login'))
+        # Qulflar teardown (_write_lock_finish) da qo'yib yuboriladi
+        _write_lock_start(f)
+        return f(*args, **kwargs)
+    return decorated_function
+
+@app.route('/admin/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+        
+        admins = load_admins()
+        
+        if username in admins and admins[username]['is_active']:
+            if check_password_hash(admins[username]['password'], password):
+                session['logged_in'] = True
+                session['username'] = username
+                session['role'] = admins[username]['role']
+                
+                settings = load_settings()
+                session['language'] = settings.get('language', 'uz')
+                
+                add_activity("Tizimga kirish", f"{username} tizimga kirdi", username)
+                
+                # Login login_required siz - qulf faqat parol tekshirilgandan keyin, yozish uchun olinadi
+                with WRITE_LOCK:
+                    admins = load_admins()
+                    if username in admins:
+                        admins[username]['last_login'] = datetime.now().isoformat()
+                        save_admins(admins)
+                
+                return redirect(url_for('admin_dashboard'))
+        
+        return render_template('login.html', error="Login yoki parol noto'g'ri")
+    
+    return render_template('login.html')
+
+@app.route('/admin/logout')
+def logout():
+    if 'username' in session:
+        add_activity("Tizimdan chiqish", f"{session['username']} tizimdan chiqdi", session['username'])
+    session.clear()
+    return redirect(url_for('login'))
+
+# Statistika hisoblash
+class StatsCache:
+    """Tuzilma sonlari (viloyat/tuman/MFY/xodim) - ma'lumotlar versiyasiga bog'langan.
+
+    Snapshot o'zgarmas, shuning uchun har doim keshlanadi. Shardlar esa faqat fayl kuzatuvchisi
+    ishlayotganda: shunda boshqa jarayon yoki operator yozgan o'zgarish ham versiyani oshiradi.
+    Obunachilar soni keshlanmaydi.
+    """
+
+    def __init__(self):
+        self.entry = None
+        self.hits = 0
+        self.misses = 0
+
+    def usable(self, data):
+        if isinstance(data, Snapshot):
+            return True
+        return (isinstance(data, RegionsView) and data._store is STORE and STORE.trusted
+                and not write_locked())
+
+    def get(self, build):
+        version = data_version()
+        entry = self.entry
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        counts = build()
+        # Hisoblash paytida versiya o'zgargan bo'lsa, keyingi chaqiruv qayta hisoblaydi
+        self.entry = (version, counts)
+        self.misses += 1
+        return counts
+
+STATS_CACHE = StatsCache()
+
+@profiled('calculate_stats')
+def calculate_stats(data):
+    if STATS_CACHE.usable(data):
+        counts = STATS_CACHE.get(lambda: STAFF_TABLE.totals(data))
+    else:
+        counts = STAFF_TABLE.totals(data)
+    return {'total_users': SUBSCRIBERS.total, **counts}
+
+# Hisobotlar: viloyat va tuman bo'yicha tayyor yig'indilar (materialized rollup).
+# Har bir tuman uchun lavozimlar bo'yicha band o'rinlar soni, bo'sh lavozimli va nofaol MFYlar
+# to'plamlari yuritiladi. O'zgartirish endpointlari ROLLUPS.update() bilan faqat tegilgan MFY yoki
+# tumanni yangilaydi, shuning uchun "Samarqanddagi raissiz MFYlar" so'rovi butun daraxtni aylanmaydi.
+class DistrictRollup:
+    __slots__ = ('signatures', 'filled', 'vacant', 'inactive')
+
+    def __init__(self, district=None):
+        # MFY -> (nofaolmi, band lavozimlar)
+        self.signatures = {}
+        self.filled = dict.fromkeys(LAVOZIMLAR, 0)
+        self.vacant = {lavozim: set() for lavozim in LAVOZIMLAR}
+        self.inactive = set()
+        if district is not None:
+            for nomi, mfy in list(district.mfylar.items()):
+                self.set_mfy(nomi, mfy)
+
+    def set_mfy(self, nomi, mfy):
+        self.remove_mfy(nomi)
+        inactive = mfy.holat is Holat.NOFAOL
+        filled = frozenset(lavozim for lavozim in LAVOZIMLAR if mfy.xodimlar[lavozim].filled())
+        self.signatures[nomi] = (inactive, filled)
+        if inactive:
+            self.inactive.add(nomi)
+        for lavozim in LAVOZIMLAR:
+            if lavozim in filled:
+                self.filled[lavozim] += 1
+            else:
+                self.vacant[lavozim].add(nomi)
+
+    def remove_mfy(self, nomi):
+        signature = self.signatures.pop(nomi, None)
+        if signature is None:
+            return
+        inactive, filled = signature
+        self.inactive.discard(nomi)
+        for lavozim in LAVOZIMLAR:
+            if lavozim in filled:
+                self.filled[lavozim] -= 1
+            else:
+                self.vacant[lavozim].discard(nomi)
+
+    def row(self, nomi, subscriptions):
+        return {'nomi': nomi, 'mfylar': len(self.signatures), 'nofaol_mfylar': len(self.inactive),
+                'band': dict(self.filled), 'bosh': {lavozim: len(self.vacant[lavozim]) for lavozim in LAVOZIMLAR},
+                'obunalar': subscriptions}
+
+class RegionRollup:
+    __slots__ = ('source', 'tumanlar', 'summary')
+
+    def __init__(self, region):
+        self.source = weakref.ref(region)
+        self.tumanlar = {nomi: DistrictRollup(district) for nomi, district in list(region.tumanlar.items())}
+        self.summary = None
+
+def _sum_rows(nomi, rows):
+    total = {'nomi': nomi, 'mfylar': 0, 'nofaol_mfylar': 0, 'band': dict.fromkeys(LAVOZIMLAR, 0),
+             'bosh': dict.fromkeys(LAVOZIMLAR, 0), 'obunalar': 0}
+    for row in rows:
+        for key in ('mfylar', 'nofaol_mfylar', 'obunalar'):
+            total[key] += row[key]
+        for lavozim in LAVOZIMLAR:
+            total['band'][lavozim] += row['band'][lavozim]
+            total['bosh'][lavozim] += row['bosh'][lavozim]
+    return total
+
+class Rollups:
+    """{viloyat: RegionRollup}. Yig'indi aynan qaysi Region obyektidan qurilganini (weakref) biladi:
+    shard boshqa jarayon yozgani uchun qayta o'qilsa yoki saqlash xatosidan keyin kesh tozalansa,
+    obyekt almashadi va yig'indi birinchi so'rovda shu viloyat uchungina qayta quriladi.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.regions = {}
+        self.builds = 0
+
+    def region(self, nomi, region):
+        with self.lock:
+            entry = self.regions.get(nomi)
+            if entry is None or entry.source() is not region:
+                entry = self.regions[nomi] = RegionRollup(region)
+                self.builds += 1
+            return entry
+
+    def region_row(self, nomi, entry):
+        with self.lock:
+            if entry.summary is None:
+                entry.summary = _sum_rows(nomi, [d.row(t, 0) for t, d in entry.tumanlar.items()])
+            return dict(entry.summary, nomi=nomi, obunalar=SUBSCRIBERS.area_total(nomi))
+
+    def update(self, viloyat, region, tuman=None, mahalla=None):
+        """O'zgartirishdan keyin: region - o'zgargan Region (o'chirilgan bo'lsa None).
+
+        tuman/mahalla berilsa faqat shu tuman yoki MFY qayta hisoblanadi (ular o'chirilgan ham bo'lishi mumkin).
+        """
+        with self.lock:
+            entry = self.regions.get(viloyat)
+            if entry is None:
+                return
+            if region is None or entry.source() is not region:
+                del self.regions[viloyat]
+                return
+            entry.summary = None
+            if tuman is None:
+                return
+            district = region.tumanlar.get(tuman)
+            if district is None:
+                entry.tumanlar.pop(tuman, None)
+            elif mahalla is None or tuman not in entry.tumanlar:
+                entry.tumanlar[tuman] = DistrictRollup(district)
+            else:
+                mfy = district.mfylar.get(mahalla)
+                if mfy is None:
+                    entry.tumanlar[tuman].remove_mfy(mahalla)
+                else:
+                    entry.tumanlar[tuman].set_mfy(mahalla, mfy)
+
+    def rename(self, old, new):
+        with self.lock:
+            entry = self.regions.pop(old, None)
+            if entry is not None:
+                entry.summary = None
+                self.regions[new] = entry
+
+ROLLUPS = Rollups()
+
+@profiled('build_report')
+def build_report(data, viloyat=None, tuman=None, lavozim=None, nofaol=False):
+    """Tanlangan hudud (None - respublika) jami, bir pog'ona pastdagi qatorlar va filtr berilsa MFYlar ro'yxati.
+
+    lavozim - shu lavozimi bo'sh MFYlar, nofaol - nofaol MFYlar (ikkalasi - kesishmasi).
+    Vaqt natija hajmiga proporsional: yig'indilar tayyor, ro'yxatlar to'plamlardan olinadi.
+    Hudud topilmasa None.
+    """
+    with ROLLUPS.lock:
+        if viloyat is None:
+            entries = [(v, ROLLUPS.region(v, data[v])) for v in data]
+            rows = [ROLLUPS.region_row(v, entry) for v, entry in entries]
+            total = _sum_rows('Respublika', rows)
+            # Hudud qatorlarida obunalar (bir odam bir nechta MFYda sanaladi); respublika uchun odamlar soni ham
+            total['obunachilar'] = SUBSCRIBERS.total
+            level = 'respublika'
+        else:
+            region = data.get(viloyat)
+            if region is None:
+                return None
+            entries = [(viloyat, ROLLUPS.region(viloyat, region))]
+            if tuman is None:
+                rows = [d.row(t, SUBSCRIBERS.area_total(viloyat, t)) for t, d in entries[0][1].tumanlar.items()]
+                total = ROLLUPS.region_row(viloyat, entries[0][1])
+                level = 'viloyat'
+            else:
+                district = entries[0][1].tumanlar.get(tuman)
+                if district is None:
+                    return None
+                total = district.row(tuman, SUBSCRIBERS.area_total(viloyat, tuman))
+                rows = [{'nomi': m, 'holat': 'nofaol' if inactive else 'faol',
+                         'bosh_lavozimlar': [lavozim for lavozim in LAVOZIMLAR if lavozim not in filled],
+                         'obunachilar': SUBSCRIBERS.count(viloyat, tuman, m)}
+                        for m, (inactive, filled) in district.signatures.items()]
+                level = 'tuman'
+        report = {'daraja': level, 'jami': total, 'qatorlar': rows}
+        if lavozim or nofaol:
+            mfylar = []
+            for v, entry in entries:
+                for t, district in entry.tumanlar.items():
+                    if tuman is not None and t != tuman:
+                        continue
+                    names = district.vacant[lavozim] if lavozim else district.inactive
+                    if lavozim and nofaol:
+                        names = names & district.inactive
+                    mfylar.extend({'viloyat': v, 'tuman': t, 'mahalla': m, 'obunachilar': SUBSCRIBERS.count(v, t, m)}
+                                  for m in sorted(names))
+            report['mfylar'] = mfylar
+        return report
+
+# Xodimlar jadvali ustunlar ko'rinishida: har bir MFY lavozimi (bo'sh bo'lsa ham) - bitta qator.
+# ~10k MFY x 6 lavozim = 60k qator; guruhlab sanash va filtrlar ichma-ich dictlar ustidagi
+# Python sikllari o'rniga ustunlar ustida bajariladi.
+class ArrayColumns:
+    """NumPy yo'q bo'lganda: array.array ustunlari, amallar C darajasidagi iteratorlar bilan."""
+    name = 'array'
+
+    def bincount(self, block, codes, size, mask=None):
+        column = block.columns[codes]
+        values = itertools.compress(column, block.columns[mask]) if mask else column
+        counts = [0] * size
+        for code, n in Counter(values).items():
+            counts[code] = n
+        return counts
+
+    def _index(self, block, name):
+        # Ustunlar kam qiymatli (lavozim, holat, band) - {qiymat: qator raqamlari}, blok bilan birga yashaydi
+        index = block.cache.get(name)
+        if index is None:
+            index = block.cache[name] = {}
+            for row, value in enumerate(block.columns[name]):
+                rows = index.get(value)
+                if rows is None:
+                    rows = index[value] = array('I')
+                rows.append(row)
+        return index
+
+    def where(self, block, conditions):
+        if not conditions:
+            return list(range(len(block.staff)))
+        # Eng kichik indeks ro'yxatidan boshlab qolgan shartlar tekshiriladi
+        order = sorted((len(self._index(block, name).get(value, ())), name, value) for name, value in conditions)
+        _, name, value = order[0]
+        rows = self._index(block, name).get(value, ())
+        for _, name, value in order[1:]:
+            column = block.columns[name]
+            rows = [row for row in rows if column[row] == value]
+        return list(rows)
+
+class NumpyColumns:
+    """Xuddi shu ustunlar nusxasiz np.frombuffer ko'rinishida; amallar vektorlashtirilgan."""
+    name = 'numpy'
+
+    def __init__(self):
+        import numpy
+        self.np = numpy
+
+    def _view(self, block, name):
+        view = block.cache.get(name)
+        if view is None:
+            column = block.columns[name]
+            view = block.cache[name] = self.np.frombuffer(column, dtype=self.np.dtype(column.typecode))
+        return view
+
+    def bincount(self, block, codes, size, mask=None):
+        weights = self._view(block, mask) if mask else None
+        counts = self.np.bincount(self._view(block, codes), weights=weights, minlength=size)
+        return counts.astype(self.np.int64).tolist()
+
+    def where(self, block, conditions):
+        selected = self.np.ones(len(block.staff), dtype=bool)
+        for name, value in conditions:
+            selected &= self._view(block, name) == value
+        return self.np.flatnonzero(selected).tolist()
+
+def make_column_kernels(name=None):
+    name = name or COLUMNS_BACKEND
+    if name != 'array':
+        try:
+            return NumpyColumns()
+        except ImportError:
+            if name == 'numpy':
+                raise
+    return ArrayColumns()
+
+def _holat_raqami(holat):
+    # 0 - faol (yoki ko'rsatilmagan), 1 - nofaol, 2 - boshqa qiymat
+    if holat is Holat.NOFAOL:
+        return 1
+    return 0 if holat is Holat.FAOL or not holat else 2
 
-@app.route('/admin/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-        
-        admins = load_admins()
-        
-        if username in admins and admins[username]['is_active']:
-            if check_password_hash(admins[username]['password'], password):
-                session['logged_in'] = True
-                session['username'] = username
-                session['role'] = admins[username]['role']
-                
-                settings = load_settings()
-                session['language'] = settings.get('language', 'uz')
-                
-                add_activity("Tizimga kirish", f"{username} tizimga kirdi", username)
-                
-                admins[username]['last_login'] = datetime.now().isoformat()
-                save_admins(admins)
-                
-                return redirect(url_for('admin_dashboard'))
-        
-        return render_template('login.html', error="Login yoki parol noto'g'ri")
-    
-    return render_template('login.html')
+class StaffBlock:
+    """Bitta viloyat ustunlari. columns: tuman, mfy (blok ichidagi tartib raqamlari), lavozim kodi,
+    holat, band (ismi bor xodim). staff - qatorlardagi StaffMember (bo'sh lavozimda None)."""
+    __slots__ = ('source', 'districts', 'mfys', 'mfy_district', 'columns', 'staff', 'present', 'n_staff', 'cache')
 
-@app.route('/admin/logout')
-def logout():
-    if 'username' in session:
-        add_activity("Tizimdan chiqish", f"{session['username']} tizimdan chiqdi", session['username'])
-    session.clear()
-    return redirect(url_for('login'))
+    def __init__(self, table, region):
+        self.source = weakref.ref(region)
+        self.districts = []
+        self.mfys = []
+        self.mfy_district = array('H')
+        district, mfy, position, status, filled = array('H'), array('I'), array('H'), array('B'), array('B')
+        self.staff = []
+        codes = table.codes
+        for d_index, (tuman, tuman_data) in enumerate(list(region.tumanlar.items())):
+            self.districts.append(tuman)
+            for mahalla, mahalla_data in list(tuman_data.mfylar.items()):
+                m_index = len(self.mfys)
+                self.mfys.append(mahalla)
+                self.mfy_district.append(d_index)
+                xodimlar = mahalla_data.xodimlar
+                extra = [lavozim for lavozim in xodimlar if lavozim not in _LAVOZIMLAR_SET]
+                for lavozim in itertools.chain(LAVOZIMLAR, extra):
+                    code = codes.get(lavozim)
+                    if code is None:
+                        code = table.add_position(lavozim)
+                    xodim = dict.get(xodimlar, lavozim)
+                    district.append(d_index)
+                    mfy.append(m_index)
+                    position.append(code)
+                    if xodim is None:
+                        status.append(0)
+                        filled.append(0)
+                    else:
+                        status.append(_holat_raqami(xodim.holat))
+                        filled.append(1 if xodim.filled() else 0)
+                    self.staff.append(xodim)
+        self.columns = {'district': district, 'mfy': mfy, 'position': position, 'status': status, 'filled': filled}
+        self.present = set(position)
+        self.n_staff = filled.count(1)
+        # Backendning yordamchi tuzilmalari (NumPy ko'rinishlari yoki qiymat indekslari)
+        self.cache = {}
 
-# Statistika hisoblash
-def calculate_stats(data):
-    total_users = 0
-    total_regions = len(data)
-    total_districts = 0
-    total_neighborhoods = 0
-    total_staff = 0
-    
-    for region in data.values():
-        total_districts += len(region.get('tumanlar', {}))
-        for district in region.get('tumanlar', {}).values():
-            total_neighborhoods += len(district.get('mfylar', {}))
-            for neighborhood in district.get('mfylar', {}).values():
-                if 'foydalanuvchilar_soni' in neighborhood:
-                    try:
-                        total_users += int(neighborhood['foydalanuvchilar_soni'])
-                    except (ValueError, TypeError):
-                        pass
-                if 'xodimlar' in neighborhood:
-                    for staff in neighborhood['xodimlar'].values():
-                        if staff.get('ism') and staff['ism'].strip():
-                            total_staff += 1
-    
-    return {
-        'total_users': total_users,
-        'total_regions': total_regions,
-        'total_districts': total_districts,
-        'total_neighborhoods': total_neighborhoods,
-        'total_staff': total_staff
-    }
+class StaffTable:
+    """{viloyat: StaffBlock}. Blok ROLLUPS dagi kabi Region obyektiga bog'langan: o'zgartirish
+    endpointlari data_changed() orqali faqat o'sha viloyat blokini bekor qiladi, u keyingi so'rovda
+    qayta quriladi; boshqa jarayon yozgan shard yangi obyekt bo'lib keladi va blok ham yangilanadi.
+    """
+
+    def __init__(self, backend=None):
+        self.kernels = make_column_kernels(backend)
+        self.lock = threading.RLock()
+        self.positions = list(LAVOZIMLAR)
+        self.codes = {lavozim: code for code, lavozim in enumerate(LAVOZIMLAR)}
+        self.blocks = {}
+        self.builds = 0
+
+    def add_position(self, lavozim):
+        with self.lock:
+            code = self.codes.get(lavozim)
+            if code is None:
+                code = self.codes[lavozim] = len(self.positions)
+                self.positions.append(lavozim)
+            return code
+
+    def block(self, nomi, region):
+        with self.lock:
+            block = self.blocks.get(nomi)
+            if block is None or block.source() is not region:
+                block = self.blocks[nomi] = StaffBlock(self, region)
+                self.builds += 1
+            return block
+
+    def _blocks(self, data, viloyat=None):
+        names = [viloyat] if viloyat is not None else list(data)
+        return [(v, self.block(v, data[v])) for v in names if v in data]
+
+    def invalidate(self, nomi):
+        with self.lock:
+            self.blocks.pop(nomi, None)
+
+    def rename(self, old, new):
+        with self.lock:
+            block = self.blocks.pop(old, None)
+            if block is not None:
+                self.blocks[new] = block
+
+    def rows(self):
+        return sum(len(block.staff) for block in list(self.blocks.values()))
+
+    def totals(self, data):
+        """calculate_stats() uchun tuzilma sonlari."""
+        blocks = self._blocks(data)
+        return {
+            'total_regions': len(blocks),
+            'total_districts': sum(len(block.districts) for _, block in blocks),
+            'total_neighborhoods': sum(len(block.mfys) for _, block in blocks),
+            'total_staff': sum(block.n_staff for _, block in blocks)
+        }
+
+    def position_counts(self, data, viloyat=None):
+        """{lavozim: band o'rinlar soni} - ma'lumotlarda uchraydigan lavozimlar, standartlari birinchi."""
+        size = len(self.positions)
+        counts = [0] * size
+        present = set()
+        for _, block in self._blocks(data, viloyat):
+            for code, n in enumerate(self.kernels.bincount(block, 'position', size, 'filled')):
+                counts[code] += n
+            present |= block.present
+        return {self.positions[code]: counts[code] for code in sorted(present)}
+
+    def select(self, data, viloyat=None, lavozim=None, filled=True, holat=None):
+        """[(viloyat, tuman, mfy, lavozim, StaffMember yoki None)] - filtrga mos qatorlar."""
+        conditions = []
+        if lavozim is not None:
+            if lavozim not in self.codes:
+                return []
+            conditions.append(('position', self.codes[lavozim]))
+        if filled is not None:
+            conditions.append(('filled', 1 if filled else 0))
+        if holat is not None:
+            conditions.append(('status', _holat_raqami(holat_kodi(holat))))
+        out = []
+        positions = self.positions
+        for v, block in self._blocks(data, viloyat):
+            mfy, position = block.columns['mfy'], block.columns['position']
+            for i in self.kernels.where(block, conditions):
+                m = mfy[i]
+                out.append((v, block.districts[block.mfy_district[m]], block.mfys[m],
+                            positions[position[i]], block.staff[i]))
+        return out
+
+STAFF_TABLE = StaffTable()
+
+EARTH_RADIUS_KM = 6371.0088
+
+def masofa_km(lat1, lon1, lat2, lon2):
+    """Ikki nuqta orasidagi masofa (haversine), km."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class MfyLocationIndex:
+    """Koordinatali MFYlar uchun katakli (grid) indeks: {(i, j): [(lat, lon, viloyat, tuman, mfy)]}.
+
+    Viloyat nuqtalari STAFF_TABLE bloklari kabi Region obyektiga bog'langan: data_changed() faqat
+    o'sha viloyatni bekor qiladi va keyingi so'rovda faqat uning nuqtalari qayta qo'shiladi. Qidiruv
+    so'rov katagidan boshlab halqama-halqa kengayadi - ~10k nuqtada bir necha o'nlab katak ko'riladi.
+    """
+
+    def __init__(self, cell=GEO_CELL_DEG):
+        self.cell = cell
+        self.lock = threading.RLock()
+        self.cells = {}
+        # viloyat -> (weakref(Region), [katak kalitlari])
+        self.sources = {}
+        self.version = None
+        self.points = 0
+        self.builds = 0
+
+    def _key(self, lat, lon):
+        return (math.floor(lat / self.cell), math.floor(lon / self.cell))
+
+    def _drop(self, viloyat):
+        source = self.sources.pop(viloyat, None)
+        if source is None:
+            return
+        for key in set(source[1]):
+            kept = [entry for entry in self.cells.get(key, ()) if entry[2] != viloyat]
+            self.points -= len(self.cells.get(key, ())) - len(kept)
+            if kept:
+                self.cells[key] = kept
+            else:
+                self.cells.pop(key, None)
+
+    def _add(self, viloyat, region):
+        keys = []
+        for tuman, district in list(region.tumanlar.items()):
+            for mahalla, mfy in list(district.mfylar.items()):
+                if mfy.joylashuv is MISSING:
+                    continue
+                lat, lon = mfy.joylashuv
+                key = self._key(lat, lon)
+                self.cells.setdefault(key, []).append((lat, lon, viloyat, tuman, mahalla))
+                keys.append(key)
+        self.sources[viloyat] = (weakref.ref(region), keys)
+        self.points += len(keys)
+        self.builds += 1
+
+    def sync(self, data):
+        """Indeksni ma'lumotlar versiyasiga moslaydi (versiya o'zgarmagan bo'lsa - hech narsa qilinmaydi)."""
+        version = data_version()
+        if version == self.version:
+            return
+        with self.lock:
+            for viloyat in [v for v in self.sources if v not in data]:
+                self._drop(viloyat)
+            for viloyat in list(data):
+                region = data[viloyat]
+                source = self.sources.get(viloyat)
+                if source is None or source[0]() is not region:
+                    self._drop(viloyat)
+                    self._add(viloyat, region)
+            self.version = version
+
+    def invalidate(self, viloyat):
+        with self.lock:
+            self._drop(viloyat)
+            self.version = None
+
+    def nearest(self, data, lat, lon, limit=NEAREST_LIMIT, max_km=NEAREST_MAX_KM):
+        """[(km, viloyat, tuman, mfy)] - eng yaqinlari, max_km ichida, yaqinlik tartibida."""
+        self.sync(data)
+        with self.lock:
+            if not self.points:
+                return []
+            ci, cj = self._key(lat, lon)
+            # Halqa kengligi (km) - uzunlik bo'yicha katak qutbga yaqinlashgan sari torayadi
+            cell_km = math.radians(self.cell) * EARTH_RADIUS_KM
+            ring_km = cell_km * max(math.cos(math.radians(min(89.0, abs(lat) + max_km / 111.0))), 0.01)
+            found = []
+            cells = self.cells
+            for r in range(int(max_km / ring_km) + 2):
+                if r == 0:
+                    ring = [(ci, cj)]
+                else:
+                    ring = [(ci + di, cj + dj) for di in (-r, r) for dj in range(-r, r + 1)]
+                    ring += [(ci + di, cj + dj) for dj in (-r, r) for di in range(-r + 1, r)]
+                for key in ring:
+                    for p_lat, p_lon, viloyat, tuman, mahalla in cells.get(key, ()):
+                        km = masofa_km(lat, lon, p_lat, p_lon)
+                        if km <= max_km:
+                            found.append((km, viloyat, tuman, mahalla))
+                # Ko'rilmagan kataklardagi nuqtalar kamida r * ring_km uzoqlikda
+                if len(found) >= limit and heapq.nsmallest(limit, found)[-1][0] <= r * ring_km:
+                    break
+            return heapq.nsmallest(limit, found)
+
+MFY_LOCATIONS = MfyLocationIndex()
+
+def telefon_kaliti(telefon):
+    """Telefon raqamining indeks kaliti: faqat raqamlar, O'zbekiston raqamlari 998XXXXXXXXX ko'rinishida.
+
+    "+998 90 123-45-67", "90 123 45 67", "8 90 1234567" - bitta kalit; 7 raqamdan kam bo'lsa None.
+    """
+    digits = ''.join(ch for ch in str(telefon or '') if ch.isdigit())
+    if len(digits) == 9:
+        digits = '998' + digits
+    elif len(digits) == 10 and digits[0] == '8':
+        digits = '998' + digits[1:]
+    return digits if len(digits) >= 7 else None
+
+class PhoneIndex:
+    """Xodimlar telefonlari bo'yicha xesh indeks: {kalit: {(viloyat, tuman, mfy, lavozim)}}.
+
+    Viloyat yozuvlari Region obyektiga bog'langan (boshqa jarayon yozgan shard yoki yangi snapshot -
+    viloyat qayta indekslanadi), admin o'zgarishlarida esa data_changed() faqat o'zgargan MFY
+    yozuvlarini almashtiradi. Qidiruv - bitta lug'at murojaati, xodimlar aylanib chiqilmaydi.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.phones = {}
+        # viloyat -> (weakref(Region), {(tuman, mfy): [(kalit, lavozim)]})
+        self.sources = {}
+        self.version = None
+        self.builds = 0
+
+    def _index_mfy(self, viloyat, mfylar, tuman, mahalla, mfy):
+        entries = []
+        for lavozim, xodim in list(mfy.xodimlar.items()):
+            key = telefon_kaliti(xodim.telefon)
+            if key is not None:
+                self.phones.setdefault(key, set()).add((viloyat, tuman, mahalla, lavozim))
+                entries.append((key, lavozim))
+        if entries:
+            mfylar[(tuman, mahalla)] = entries
+
+    def _unindex_mfy(self, viloyat, mfylar, tuman, mahalla):
+        for key, lavozim in mfylar.pop((tuman, mahalla), ()):
+            slots = self.phones.get(key)
+            if slots is not None:
+                slots.discard((viloyat, tuman, mahalla, lavozim))
+                if not slots:
+                    del self.phones[key]
+
+    def _drop(self, viloyat):
+        source = self.sources.pop(viloyat, None)
+        if source is not None:
+            for tuman, mahalla in list(source[1]):
+                self._unindex_mfy(viloyat, source[1], tuman, mahalla)
+
+    def _add(self, viloyat, region):
+        mfylar = {}
+        for tuman, district in list(region.tumanlar.items()):
+            for mahalla, mfy in list(district.mfylar.items()):
+                self._index_mfy(viloyat, mfylar, tuman, mahalla, mfy)
+        self.sources[viloyat] = (weakref.ref(region), mfylar)
+        self.builds += 1
+
+    def sync(self, data):
+        version = data_version()
+        if version == self.version:
+            return
+        with self.lock:
+            for viloyat in [v for v in self.sources if v not in data]:
+                self._drop(viloyat)
+            for viloyat in list(data):
+                region = data[viloyat]
+                source = self.sources.get(viloyat)
+                if source is None or source[0]() is not region:
+                    self._drop(viloyat)
+                    self._add(viloyat, region)
+            self.version = version
+
+    def changed(self, viloyat, region, tuman=None, mahalla=None):
+        """Bitta MFY o'zgarsa - faqat uning yozuvlari; tuman/viloyat darajasidagi o'zgarishda viloyat qayta quriladi."""
+        with self.lock:
+            source = self.sources.get(viloyat)
+            if mahalla is None or region is None or source is None or source[0]() is not region:
+                self._drop(viloyat)
+                self.version = None
+                return
+            self._unindex_mfy(viloyat, source[1], tuman, mahalla)
+            district = region.tumanlar.get(tuman)
+            mfy = district.mfylar.get(mahalla) if district is not None else None
+            if mfy is not None:
+                self._index_mfy(viloyat, source[1], tuman, mahalla, mfy)
+
+    def invalidate(self, viloyat):
+        with self.lock:
+            self._drop(viloyat)
+            self.version = None
+
+    def lookup(self, data, telefon):
+        """[(viloyat, tuman, mfy, lavozim, StaffMember)] - shu raqamli xodimlar."""
+        key = telefon_kaliti(telefon)
+        if key is None:
+            return []
+        self.sync(data)
+        with self.lock:
+            slots = sorted(self.phones.get(key, ()))
+        out = []
+        for viloyat, tuman, mahalla, lavozim in slots:
+            mfy = find_mfy(data, viloyat, tuman, mahalla)
+            xodim = dict.get(mfy.xodimlar, lavozim) if mfy is not None else None
+            if xodim is not None and telefon_kaliti(xodim.telefon) == key:
+                out.append((viloyat, tuman, mahalla, lavozim, xodim))
+        return out
+
+    def duplicates(self):
+        """{kalit: [(viloyat, tuman, mfy, lavozim)]} - bir nechta xodimda uchraydigan raqamlar."""
+        with self.lock:
+            return {key: sorted(slots) for key, slots in self.phones.items() if len(slots) > 1}
+
+PHONES = PhoneIndex()
+
+def data_changed(viloyat, region, tuman=None, mahalla=None):
+    """O'zgartirish endpointlari saqlashdan keyin chaqiradi: hisobot yig'indilari, ustunlar,
+    joylashuv va telefon indekslari yangilanadi."""
+    ROLLUPS.update(viloyat, region, tuman, mahalla)
+    STAFF_TABLE.invalidate(viloyat)
+    MFY_LOCATIONS.invalidate(viloyat)
+    PHONES.changed(viloyat, region, tuman, mahalla)
+
+def region_renamed(old, new):
+    ROLLUPS.rename(old, new)
+    STAFF_TABLE.rename(old, new)
+    # Nuqtalar va telefon yozuvlarida viloyat nomi saqlanadi - yangi nom bilan qayta qo'shiladi
+    MFY_LOCATIONS.invalidate(old)
+    MFY_LOCATIONS.invalidate(new)
+    PHONES.invalidate(old)
+    PHONES.invalidate(new)
+
+class ChangeFeed:
+    """O'zgarishlar lentasi: har bir tahrir tartib raqamli (seq) hodisa bo'lib CHANGES_FILE ga qo'shiladi.
+
+    Fayl - JSON qatorlar, faqat oxiriga yoziladi; raqam berish va yozish WRITE_LOCK ostida, shuning uchun
+    bir nechta jarayon (gunicorn workerlari, RUN_MODE=admin) yozsa ham raqamlar ketma-ket. Xotirada oxirgi
+    `keep` ta hodisa tayyor baytlar bo'lib turadi, boshqa jarayon qo'shganlari fayl oxiridan o'qib olinadi.
+
+    Hodisa: {"seq", "op": upsert | delete | move | reset, "entity": viloyat | tuman | mahalla | xodim,
+    "viloyat", "tuman", "mahalla", "lavozim" (yozuv yo'li), "to": {...} (move - yangi yo'l),
+    "data": {...} (upsert - yozuvning ichki ro'yxatlarsiz maydonlari), "action", "username", "timestamp"}.
+    upsert yozuvning butun holatini beradi - snapshot va undan keyingi hodisalar joriy holatga teng.
+    reset - ma'lumotlar tashqaridan almashtirildi (data.json qayta yuklandi), snapshot qaytadan olinadi.
+    """
+
+    def __init__(self, path, keep):
+        self.path = path
+        self.keep = keep
+        self.cond = threading.Condition(threading.RLock())
+        self.events = deque()
+        self.seq = 0
+        self.offset = 0
+        self.inode = None
+        self.lines = 0
+        self.appended = 0
+        self.waiters = 0
+
+    @staticmethod
+    def _seq(line):
+        # Qatorlar {"seq":N,... bilan boshlanadi - butun JSON ni parse qilish shart emas
+        try:
+            return int(line[7:line.index(b',', 7)])
+        except ValueError:
+            return JSON_CODEC.loads(line)['seq']
+
+    def _catch_up(self):
+        """Fayldagi yangi qatorlar xotiraga (self.cond ostida). Fayl almashtirilgan bo'lsa - boshidan."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            self.events.clear()
+            self.offset = 0
+            self.lines = 0
+            self.inode = st.st_ino
+        if st.st_size == self.offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(st.st_size - self.offset)
+        # Oxirgi qator hali to'liq yozilmagan bo'lishi mumkin - keyingi safar o'qiladi
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].splitlines():
+            try:
+                seq = self._seq(line)
+            except (ValueError, KeyError, TypeError):
+                continue
+            self.events.append((seq, line))
+            self.seq = max(self.seq, seq)
+            self.lines += 1
+        self.offset += end
+        while len(self.events) > self.keep:
+            self.events.popleft()
+
+    def append(self, events):
+        """Hodisalarni raqamlab yozadi. Endpointlar saqlashdan keyin, viloyat qulfi hali ushlab turilganda
+        chaqiradi - bitta viloyatdagi hodisalar tahrirlar tartibida bo'ladi."""
+        if not events:
+            return
+        timestamp = datetime.now().isoformat()
+        with WRITE_LOCK, self.cond:
+            try:
+                self._catch_up()
+                if self.inode is not None and _file_size(self.path) > self.offset:
+                    # Yiqilgan jarayondan qolgan chala qator
+                    os.truncate(self.path, self.offset)
+                payload = b''.join(JSON_CODEC.dumps({'seq': self.seq + n, **event, 'timestamp': timestamp}) + b'\n'
+                                   for n, event in enumerate(events, 1))
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, payload)
+                finally:
+                    os.close(fd)
+                self._catch_up()
+                if self.lines > 2 * self.keep:
+                    self._compact()
+            except Exception as e:
+                record_save_error('changes', e)
+                METRICS.inc('smartmahalla_storage_errors_total', 1, (('op', 'changes'),))
+                print(f"❌ O'zgarishlar lentasiga yozishda xato: {e}")
+                return
+            self.appended += len(events)
+            self.cond.notify_all()
+
+    def _compact(self):
+        # Fayl oxirgi keep ta hodisagacha qisqartiriladi; boshqa jarayonlar yangi faylni boshidan o'qiydi
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(line + b'\n' for _, line in self.events))
+        os.replace(tmp_path, self.path)
+        self._catch_up()
+
+    def last(self):
+        with self.cond:
+            self._catch_up()
+            return self.seq
+
+    def read(self, since, limit):
+        """(keyingi since, [hodisa baytlari]) yoki None - since saqlangan oraliqdan tashqarida (snapshot kerak)."""
+        with self.cond:
+            self._catch_up()
+            first = self.events[0][0] if self.events else self.seq + 1
+            if since > self.seq or since < first - 1:
+                return None
+            # Raqamlar ketma-ket - since dan keyingi hodisaning o'rni hisoblanadi
+            picked = [line for seq, line in itertools.islice(self.events, since - first + 1, since - first + 1 + limit)]
+            return since + len(picked), picked
+
+    def wait(self, since, timeout, limit):
+        """read(), yangi hodisa bo'lmasa timeout gacha kutib. Boshqa jarayonlar yozganini ko'rish uchun
+        fayl CHANGES_POLL_INTERVAL da tekshiriladi, shu jarayondagilari esa darhol uyg'otadi."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.waiters += 1
+            try:
+                while True:
+                    result = self.read(since, limit)
+                    remaining = deadline - time.monotonic()
+                    if result is None or result[1] or remaining <= 0:
+                        return result
+                    self.cond.wait(min(remaining, CHANGES_POLL_INTERVAL))
+            finally:
+                self.waiters -= 1
+
+    def mount(self, asgi_app):
+        """RUN_MODE=async: /api/changes kutishi event loopda (asyncio.sleep) o'tadi, keyin so'rov kutmasdan
+        admin panelga beriladi - bitta thread to'xtab qolmaydi."""
+        async def router(scope, receive, send):
+            if scope['type'] == 'http' and scope['path'] == CHANGES_PATH:
+                query = urllib.parse.parse_qs(scope.get('query_string', b'').decode('latin-1'))
+                try:
+                    since = int(query.get('since', ['0'])[0])
+                    timeout = min(float(query.get('timeout', [CHANGES_MAX_WAIT])[0]), CHANGES_MAX_WAIT)
+                except ValueError:
+                    since, timeout = None, 0
+                deadline = time.monotonic() + timeout
+                while since is not None and time.monotonic() < deadline:
+                    result = self.read(since, 1)
+                    if result is None or result[1]:
+                        break
+                    await asyncio.sleep(CHANGES_POLL_INTERVAL)
+            return await asgi_app(scope, receive, send)
+        return router
+
+CHANGES = ChangeFeed(CHANGES_FILE, CHANGES_KEEP)
+CHANGES_PATH = '/api/changes'
+# Yozuv yo'li darajalari va shu chuqurlikdagi yozuv turi
+CHANGE_LEVELS = ('viloyat', 'tuman', 'mahalla', 'lavozim')
+CHANGE_ENTITIES = ('viloyat', 'tuman', 'mahalla', 'xodim')
+
+METRICS.describe('smartmahalla_changes_long_polls_total', 'counter', "/api/changes so'rovlari (natija bo'yicha)")
+METRICS.collect('smartmahalla_changes_seq', 'gauge', "O'zgarishlar lentasidagi oxirgi raqam", lambda: CHANGES.seq)
+METRICS.collect('smartmahalla_changes_events_total', 'counter', "Shu jarayon yozgan lenta hodisalari",
+                lambda: CHANGES.appended)
+METRICS.collect('smartmahalla_changes_waiters', 'gauge', "Yangi hodisani kutayotgan /api/changes so'rovlari",
+                lambda: CHANGES.waiters)
+
+def change_event(op, path, entity=None, to=None):
+    """Lenta hodisasi: path - (viloyat, tuman, mahalla, lavozim) ning boshi; entity - upsert dagi yozuv."""
+    event = {'op': op, 'entity': CHANGE_ENTITIES[len(path) - 1], **dict(zip(CHANGE_LEVELS, path))}
+    if to is not None:
+        event['to'] = dict(zip(CHANGE_LEVELS, to))
+    if entity is not None:
+        event['data'] = entity.fields_json()
+    return event
+
+def record_changes(*events):
+    """O'zgartirish endpointlari muvaffaqiyatli saqlashdan keyin chaqiradi."""
+    CHANGES.append([dict(event, action=request.endpoint, username=session.get('username')) for event in events])
+
+def moved_changes(old, new, entity):
+    """Yo'li o'zgargan bo'lsa move, keyin yangi joyda upsert."""
+    events = [change_event('move', old, to=new)] if old != new else []
+    return events + [change_event('upsert', new, entity)]
 
 # Asosiy route'lar
 
@@ -390,6 +3758,7 @@ def admin_dashboard():
                         texts=TEXTS[language],
                         active_admins=active_admins,
                         activities=activities,
+                        live_events_url=LIVE.url(),
                         language=language)
 
 @app.route('/admin/viloyatlar')
@@ -414,14 +3783,15 @@ def admin_tumanlar():
     language = session.get('language', 'uz')
     
     tumanlar_list = []
-    for viloyat_nomi, viloyat in DATA.items():
-        for tuman_nomi, tuman in viloyat.get('tumanlar', {}).items():
-            mfy_soni = len(tuman.get('mfylar', {}))
+    for viloyat_nomi, viloyat in list(DATA.items()):
+        for tuman_nomi, tuman in list(viloyat.tumanlar.items()):
+            mfy_soni = len(tuman.mfylar)
             tumanlar_list.append({
                 'viloyat': viloyat_nomi,
                 'tuman': tuman_nomi,
-                'tuman_turi': tuman.get('type', 'tuman'),
-                'mfy_soni': mfy_soni
+                'tuman_turi': tuman.type or HududTuri.TUMAN,
+                'mfy_soni': mfy_soni,
+                'versiya': tuman.versiya
             })
     
     return render_template('tumanlar.html', 
@@ -440,17 +3810,19 @@ def admin_mfylar():
     language = session.get('language', 'uz')
     
     mfylar_list = []
-    for viloyat_nomi, viloyat in DATA.items():
-        for tuman_nomi, tuman in viloyat.get('tumanlar', {}).items():
-            for mfy_nomi, mfy in tuman.get('mfylar', {}).items():
-                xodim_soni = len([x for x in mfy.get('xodimlar', {}).values() if x.get('ism')])
+    for viloyat_nomi, viloyat in list(DATA.items()):
+        for tuman_nomi, tuman in list(viloyat.tumanlar.items()):
+            for mfy_nomi, mfy in list(tuman.mfylar.items()):
+                xodim_soni = len([x for x in list(mfy.xodimlar.values()) if x.filled()])
                 mfylar_list.append({
                     'viloyat': viloyat_nomi,
                     'tuman': tuman_nomi,
                     'mfy': mfy_nomi,
-                    'foydalanuvchilar': mfy.get('foydalanuvchilar_soni', '0'),
+                    'foydalanuvchilar': SUBSCRIBERS.count(viloyat_nomi, tuman_nomi, mfy_nomi),
                     'xodim_soni': xodim_soni,
-                    'holat': mfy.get('holat', 'faol')
+                    'holat': mfy.holat or Holat.FAOL,
+                    'joylashuv': mfy.joylashuv or None,
+                    'versiya': mfy.versiya
                 })
     
     return render_template('mfylar.html', 
@@ -468,33 +3840,35 @@ def admin_lavozimlar():
     stats = calculate_stats(DATA)
     language = session.get('language', 'uz')
     
-    lavozimlar = {}
-    xodimlar_list = []
+    # Ixtiyoriy filtrlar: ?viloyat=...&lavozim=...&holat=faol|nofaol
+    viloyat = request.args.get('viloyat') or None
+    lavozim = request.args.get('lavozim') or None
+    holat = request.args.get('holat') or None
     
-    for viloyat_nomi, viloyat in DATA.items():
-        for tuman_nomi, tuman in viloyat.get('tumanlar', {}).items():
-            for mfy_nomi, mfy in tuman.get('mfylar', {}).items():
-                for lavozim, xodim in mfy.get('xodimlar', {}).items():
-                    if lavozim not in lavozimlar:
-                        lavozimlar[lavozim] = 0
-                    if xodim.get('ism') and xodim['ism'].strip():
-                        lavozimlar[lavozim] += 1
-                        xodimlar_list.append({
-                            'viloyat': viloyat_nomi,
-                            'tuman': tuman_nomi,
-                            'mfy': mfy_nomi,
-                            'lavozim': lavozim,
-                            'ism': xodim['ism'],
-                            'telefon': xodim.get('telefon', ''),
-                            'email': xodim.get('email', ''),
-                            'holat': xodim.get('holat', 'faol')
-                        })
+    lavozimlar = STAFF_TABLE.position_counts(DATA, viloyat)
+    xodimlar_list = []
+    for viloyat_nomi, tuman_nomi, mfy_nomi, xodim_lavozim, xodim in STAFF_TABLE.select(
+            DATA, viloyat=viloyat, lavozim=lavozim, holat=holat):
+        xodimlar_list.append({
+            'viloyat': viloyat_nomi,
+            'tuman': tuman_nomi,
+            'mfy': mfy_nomi,
+            'lavozim': xodim_lavozim,
+            'ism': xodim.ism,
+            'telefon': xodim.telefon or '',
+            'email': xodim.email or '',
+            'holat': xodim.holat or Holat.FAOL,
+            'versiya': xodim.versiya
+        })
     
     return render_template('lavozimlar.html', 
                         data=DATA, 
                         stats=stats, 
                         lavozimlar=lavozimlar,
                         xodimlar=xodimlar_list,
+                        selected_viloyat=viloyat,
+                        selected_lavozim=lavozim,
+                        selected_holat=holat,
                         username=session.get('username'),
                         texts=TEXTS[language],
                         language=language)
@@ -550,10 +3924,9 @@ def admin_xodimlar():
     
     xodimlar = {}
     if viloyat and tuman and mahalla:
-        if (viloyat in DATA and 
-            tuman in DATA[viloyat]['tumanlar'] and 
-            mahalla in DATA[viloyat]['tumanlar'][tuman]['mfylar']):
-            xodimlar = DATA[viloyat]['tumanlar'][tuman]['mfylar'][mahalla]['xodimlar']
+        mfy = find_mfy(DATA, viloyat, tuman, mahalla)
+        if mfy is not None:
+            xodimlar = mfy.lavozimlar()
     
     return render_template('xodimlar.html', 
                         data=DATA, 
@@ -566,9 +3939,59 @@ def admin_xodimlar():
                         selected_mahalla=mahalla,
                         language=language)
 
+def _report_args():
+    viloyat = request.args.get('viloyat', '').strip() or None
+    tuman = request.args.get('tuman', '').strip() or None
+    lavozim = request.args.get('lavozim', '').strip() or None
+    nofaol = request.args.get('holat', '').strip() == 'nofaol'
+    return viloyat, tuman, lavozim, nofaol
+
+@app.route('/admin/hisobotlar')
+@login_required
+def admin_hisobotlar():
+    DATA = load_data()
+    stats = calculate_stats(DATA)
+    language = session.get('language', 'uz')
+    viloyat, tuman, lavozim, nofaol = _report_args()
+    if lavozim not in _LAVOZIMLAR_SET:
+        lavozim = None
+    report = build_report(DATA, viloyat, tuman if viloyat else None, lavozim, nofaol)
+    
+    return render_template('hisobotlar.html', 
+                        data=DATA, 
+                        stats=stats, 
+                        username=session.get('username'),
+                        texts=TEXTS[language],
+                        report=report,
+                        lavozimlar=LAVOZIMLAR,
+                        selected_viloyat=viloyat or '',
+                        selected_tuman=tuman or '',
+                        selected_lavozim=lavozim or '',
+                        selected_holat='nofaol' if nofaol else '',
+                        language=language)
+
 # API Route'lari
+def _versiya_ziddiyati(entity):
+    """Optimistik qulf: so'rovdagi 'versiya' yozuvnikidan farq qilsa - 409 javobi, aks holda None.
+
+    Versiya o'qish API'laridan (get_*) olinadi; yuborilmasa tekshirilmaydi (eski mijozlar).
+    """
+    kutilgan = request.json.get('versiya')
+    if kutilgan is None or kutilgan == '':
+        return None
+    try:
+        kutilgan = int(kutilgan)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Versiya noto\'g\'ri'})
+    if kutilgan == entity.versiya:
+        return None
+    METRICS.inc('smartmahalla_version_conflicts_total', 1, (('endpoint', request.endpoint),))
+    return jsonify({'success': False, 'conflict': True, 'versiya': entity.versiya,
+                    'message': 'Yozuvni boshqa admin oʻzgartirgan - maʼlumotlarni yangilab, qaytadan urinib koʻring'}), 409
+
 @app.route('/admin/add_viloyat', methods=['POST'])
 @login_required
+@region_write()
 def add_viloyat():
     try:
         DATA = load_data()
@@ -581,15 +4004,14 @@ def add_viloyat():
         if viloyat_nomi in DATA:
             return jsonify({'success': False, 'message': 'Bu viloyat allaqachon mavjud'})
         
-        DATA[viloyat_nomi] = {
-            "type": viloyat_turi,
-            "tumanlar": {}
-        }
-        success = save_data(DATA)
+        DATA[viloyat_nomi] = Region(viloyat_turi, versiya=1)
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi])
+            record_changes(change_event('upsert', (viloyat_nomi,), DATA[viloyat_nomi]))
             add_activity("Yangi viloyat qo'shildi", f"{viloyat_nomi} qo'shildi", session.get('username'))
-            return jsonify({'success': True, 'message': f'"{viloyat_nomi}" muvaffaqiyatli qoʻshildi!'})
+            return jsonify({'success': True, 'message': f'"{viloyat_nomi}" muvaffaqiyatli qoʻshildi!', 'versiya': 1})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
@@ -598,6 +4020,7 @@ def add_viloyat():
 
 @app.route('/admin/add_tuman', methods=['POST'])
 @login_required
+@region_write()
 def add_tuman():
     try:
         DATA = load_data()
@@ -611,26 +4034,33 @@ def add_tuman():
         if viloyat_nomi not in DATA:
             return jsonify({'success': False, 'message': 'Bunday viloyat mavjud emas'})
             
-        if tuman_nomi in DATA[viloyat_nomi]['tumanlar']:
+        if tuman_nomi in DATA[viloyat_nomi].tumanlar:
             return jsonify({'success': False, 'message': 'Bu tuman/shahar allaqachon mavjud'})
         
-        DATA[viloyat_nomi]['tumanlar'][tuman_nomi] = {
-            "type": tuman_turi,
-            "mfylar": {}
-        }
-        success = save_data(DATA)
+        DATA[viloyat_nomi].tumanlar[tuman_nomi] = District(tuman_turi, versiya=1)
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi)
+            record_changes(change_event('upsert', (viloyat_nomi, tuman_nomi), DATA[viloyat_nomi].tumanlar[tuman_nomi]))
             add_activity("Yangi tuman/shahar qo'shildi", f"{viloyat_nomi}, {tuman_nomi} ({tuman_turi}) qo'shildi", session.get('username'))
-            return jsonify({'success': True, 'message': f'"{tuman_nomi}" {tuman_turi} muvaffaqiyatli qoʻshildi!'})
+            return jsonify({'success': True, 'message': f'"{tuman_nomi}" {tuman_turi} muvaffaqiyatli qoʻshildi!', 'versiya': 1})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
 
+def _joylashuv_arg(payload):
+    """So'rov yoki import qatoridagi lat/lon: ikkalasi bo'sh - None, noto'g'ri qiymat - ValueError/TypeError."""
+    lat, lon = payload.get('lat'), payload.get('lon')
+    if lat in (None, '') and lon in (None, ''):
+        return None
+    return koordinatalar(lat, lon)
+
 @app.route('/admin/add_mahalla', methods=['POST'])
 @login_required
+@region_write()
 def add_mahalla():
     try:
         DATA = load_data()
@@ -642,38 +4072,49 @@ def add_mahalla():
             return jsonify({'success': False, 'message': 'Barcha maydonlarni to\'ldiring'})
             
         if (viloyat_nomi not in DATA or 
-            tuman_nomi not in DATA[viloyat_nomi]['tumanlar']):
+            tuman_nomi not in DATA[viloyat_nomi].tumanlar):
             return jsonify({'success': False, 'message': 'Bunday viloyat yoki tuman mavjud emas'})
             
-        if mahalla_nomi in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar']:
+        if mahalla_nomi in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar:
             return jsonify({'success': False, 'message': 'Bu MFY allaqachon mavjud'})
         
-        DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi] = {
-            "xodimlar": {
-                "hokim": {"ism": "", "telefon": "", "email": "", "holat": "faol"},
-                "2-sektor_rahbari": {"ism": "", "telefon": "", "email": "", "holat": "faol"},
-                "mfy_raisi": {"ism": "", "telefon": "", "email": "", "holat": "faol"},
-                "iib_inspektori": {"ism": "", "telefon": "", "email": "", "holat": "faol"},
-                "hokim_yordamchisi": {"ism": "", "telefon": "", "email": "", "holat": "faol"},
-                "yoshlar_yetakchisi": {"ism": "", "telefon": "", "email": "", "holat": "faol"}
-            },
-            "foydalanuvchilar_soni": "0",
-            "yaratilgan_vaqt": datetime.now().isoformat(),
-            "holat": "faol"
-        }
-        success = save_data(DATA)
+        try:
+            joylashuv = _joylashuv_arg(request.json)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Koordinatalar noto\'g\'ri'})
+        
+        mfy = DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi] = Neighborhood.new()
+        if joylashuv is not None:
+            mfy.joylashuv = joylashuv
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi, mahalla_nomi)
+            record_changes(change_event('upsert', (viloyat_nomi, tuman_nomi, mahalla_nomi), mfy))
             add_activity("Yangi MFY qo'shildi", f"{viloyat_nomi}, {tuman_nomi}, {mahalla_nomi} MFYsi qo'shildi", session.get('username'))
-            return jsonify({'success': True, 'message': f'"{mahalla_nomi}" MFY muvaffaqiyatli qoʻshildi!'})
+            return jsonify({'success': True, 'message': f'"{mahalla_nomi}" MFY muvaffaqiyatli qoʻshildi!', 'versiya': mfy.versiya})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
 
+def _telefon_dublikatlari(DATA, telefon, *slots):
+    """Shu raqamli boshqa xodimlar; slots - tahrirlanayotgan xodimning o'z o'rni (viloyat, tuman, mfy, lavozim)."""
+    return [{'viloyat': v, 'tuman': t, 'mahalla': m, 'lavozim': lavozim, 'ism': xodim.ism or ''}
+            for v, t, m, lavozim, xodim in PHONES.lookup(DATA, telefon) if (v, t, m, lavozim) not in slots]
+
+def _dublikat_ogohlantirish(dublikatlar):
+    if not dublikatlar:
+        return ''
+    first = dublikatlar[0]
+    more = f" va yana {len(dublikatlar) - 1} ta" if len(dublikatlar) > 1 else ''
+    return (f" ⚠️ Bu telefon raqami boshqa xodimda ham bor: {first['ism']} ({first['viloyat']}, {first['tuman']}, "
+            f"{first['mahalla']} - {first['lavozim']}){more}")
+
 @app.route('/admin/add_xodim', methods=['POST'])
 @login_required
+@region_write()
 def add_xodim():
     try:
         DATA = load_data()
@@ -689,21 +4130,27 @@ def add_xodim():
             return jsonify({'success': False, 'message': 'Barcha maydonlarni to\'ldiring'})
             
         if (viloyat_nomi not in DATA or 
-            tuman_nomi not in DATA[viloyat_nomi]['tumanlar'] or 
-            mahalla_nomi not in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar']):
+            tuman_nomi not in DATA[viloyat_nomi].tumanlar or 
+            mahalla_nomi not in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar):
             return jsonify({'success': False, 'message': 'MFY topilmadi'})
         
-        DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['xodimlar'][lavozim] = {
-            "ism": ism,
-            "telefon": telefon,
-            "email": email,
-            "holat": "faol"
-        }
-        success = save_data(DATA)
+        xodimlar = DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi].xodimlar
+        # Lavozim band bo'lsa xodim almashadi - versiya davom etadi
+        eski = xodimlar.get(lavozim, BOSH_XODIM)
+        ziddiyat = _versiya_ziddiyati(eski)
+        if ziddiyat is not None:
+            return ziddiyat
+        
+        dublikatlar = _telefon_dublikatlari(DATA, telefon, (viloyat_nomi, tuman_nomi, mahalla_nomi, lavozim))
+        xodim = xodimlar[sys.intern(lavozim)] = StaffMember(ism, telefon, email, Holat.FAOL, versiya=eski.versiya + 1)
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi, mahalla_nomi)
+            record_changes(change_event('upsert', (viloyat_nomi, tuman_nomi, mahalla_nomi, lavozim), xodim))
             add_activity("Xodim qo'shildi", f"{viloyat_nomi}, {tuman_nomi}, {mahalla_nomi} - {lavozim}: {ism}", session.get('username'))
-            return jsonify({'success': True, 'message': f'Xodim muvaffaqiyatli qoʻshildi!'})
+            return jsonify({'success': True, 'message': 'Xodim muvaffaqiyatli qoʻshildi!' + _dublikat_ogohlantirish(dublikatlar),
+                            'dublikatlar': dublikatlar, 'versiya': xodim.versiya})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
@@ -713,6 +4160,7 @@ def add_xodim():
 # Tahrirlash API'lari
 @app.route('/admin/update_viloyat', methods=['POST'])
 @login_required
+@region_write()
 def update_viloyat():
     try:
         DATA = load_data()
@@ -729,16 +4177,24 @@ def update_viloyat():
         if old_viloyat_nomi != new_viloyat_nomi and new_viloyat_nomi in DATA:
             return jsonify({'success': False, 'message': 'Yangi viloyat nomi allaqachon mavjud'})
         
+        ziddiyat = _versiya_ziddiyati(DATA[old_viloyat_nomi])
+        if ziddiyat is not None:
+            return ziddiyat
+        
         # Viloyatni yangilash
         viloyat_data = DATA.pop(old_viloyat_nomi)
-        viloyat_data['type'] = viloyat_turi
+        viloyat_data.type = hudud_turi(viloyat_turi)
+        viloyat_data.versiya += 1
         DATA[new_viloyat_nomi] = viloyat_data
         
-        success = save_data(DATA)
+        success = save_data(DATA, new_viloyat_nomi)
         
         if success:
+            SUBSCRIBERS.move((old_viloyat_nomi,), (new_viloyat_nomi,))
+            region_renamed(old_viloyat_nomi, new_viloyat_nomi)
+            record_changes(*moved_changes((old_viloyat_nomi,), (new_viloyat_nomi,), viloyat_data))
             add_activity("Viloyat tahrirlandi", f"{old_viloyat_nomi} -> {new_viloyat_nomi} ({viloyat_turi})", session.get('username'))
-            return jsonify({'success': True, 'message': f'Viloyat muvaffaqiyatli yangilandi!'})
+            return jsonify({'success': True, 'message': f'Viloyat muvaffaqiyatli yangilandi!', 'versiya': viloyat_data.versiya})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
@@ -747,6 +4203,7 @@ def update_viloyat():
 
 @app.route('/admin/update_tuman', methods=['POST'])
 @login_required
+@region_write()
 def update_tuman():
     try:
         DATA = load_data()
@@ -759,36 +4216,49 @@ def update_tuman():
         if not all([old_viloyat_nomi, old_tuman_nomi, new_viloyat_nomi, new_tuman_nomi]):
             return jsonify({'success': False, 'message': 'Barcha maydonlarni to\'ldiring'})
         
-        if old_viloyat_nomi not in DATA or old_tuman_nomi not in DATA[old_viloyat_nomi]['tumanlar']:
+        if old_viloyat_nomi not in DATA or old_tuman_nomi not in DATA[old_viloyat_nomi].tumanlar:
             return jsonify({'success': False, 'message': 'Tuman topilmadi'})
         
+        ziddiyat = _versiya_ziddiyati(DATA[old_viloyat_nomi].tumanlar[old_tuman_nomi])
+        if ziddiyat is not None:
+            return ziddiyat
+        
         # Agar viloyat o'zgartirilgan bo'lsa
         if old_viloyat_nomi != new_viloyat_nomi:
             if new_viloyat_nomi not in DATA:
                 return jsonify({'success': False, 'message': 'Yangi viloyat topilmadi'})
             
-            # Tuman ma'lumotlarini yangi viloyatga ko'chirish
-            tuman_data = DATA[old_viloyat_nomi]['tumanlar'].pop(old_tuman_nomi)
-            DATA[new_viloyat_nomi]['tumanlar'][new_tuman_nomi] = tuman_data
+            if new_tuman_nomi in DATA[new_viloyat_nomi].tumanlar:
+                return jsonify({'success': False, 'message': 'Bu tuman nomi allaqachon mavjud'})
+            
+            # Tuman ma'lumotlarini yangi viloyatga ko'chirish (ikkala viloyat shardi yoziladi)
+            tuman_data = DATA[old_viloyat_nomi].tumanlar.pop(old_tuman_nomi)
+            DATA[new_viloyat_nomi].tumanlar[new_tuman_nomi] = tuman_data
         else:
             # Faqat tuman nomi o'zgartirilgan bo'lsa
             if old_tuman_nomi != new_tuman_nomi:
-                if new_tuman_nomi in DATA[old_viloyat_nomi]['tumanlar']:
+                if new_tuman_nomi in DATA[old_viloyat_nomi].tumanlar:
                     return jsonify({'success': False, 'message': 'Bu tuman nomi allaqachon mavjud'})
                 
-                tuman_data = DATA[old_viloyat_nomi]['tumanlar'].pop(old_tuman_nomi)
-                DATA[old_viloyat_nomi]['tumanlar'][new_tuman_nomi] = tuman_data
+                tuman_data = DATA[old_viloyat_nomi].tumanlar.pop(old_tuman_nomi)
+                DATA[old_viloyat_nomi].tumanlar[new_tuman_nomi] = tuman_data
         
         # Tuman turini yangilash
-        DATA[new_viloyat_nomi]['tumanlar'][new_tuman_nomi]['type'] = tuman_turi
+        tuman = DATA[new_viloyat_nomi].tumanlar[new_tuman_nomi]
+        tuman.type = hudud_turi(tuman_turi)
+        tuman.versiya += 1
         
-        success = save_data(DATA)
+        success = save_data(DATA, old_viloyat_nomi, new_viloyat_nomi)
         
         if success:
+            SUBSCRIBERS.move((old_viloyat_nomi, old_tuman_nomi), (new_viloyat_nomi, new_tuman_nomi))
+            data_changed(old_viloyat_nomi, DATA[old_viloyat_nomi], old_tuman_nomi)
+            data_changed(new_viloyat_nomi, DATA[new_viloyat_nomi], new_tuman_nomi)
+            record_changes(*moved_changes((old_viloyat_nomi, old_tuman_nomi), (new_viloyat_nomi, new_tuman_nomi), tuman))
             add_activity("Tuman yangilandi", 
                         f"{old_viloyat_nomi}, {old_tuman_nomi} -> {new_viloyat_nomi}, {new_tuman_nomi} ({tuman_turi})", 
                         session.get('username'))
-            return jsonify({'success': True, 'message': f'Tuman muvaffaqiyatli yangilandi!'})
+            return jsonify({'success': True, 'message': f'Tuman muvaffaqiyatli yangilandi!', 'versiya': tuman.versiya})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
@@ -797,6 +4267,7 @@ def update_tuman():
 
 @app.route('/admin/update_mahalla', methods=['POST'])
 @login_required
+@region_write()
 def update_mahalla():
     try:
         DATA = load_data()
@@ -811,32 +4282,146 @@ def update_mahalla():
             return jsonify({'success': False, 'message': 'Barcha maydonlarni to\'ldiring'})
         
         if (old_viloyat_nomi not in DATA or 
-            old_tuman_nomi not in DATA[old_viloyat_nomi]['tumanlar'] or 
-            old_mahalla_nomi not in DATA[old_viloyat_nomi]['tumanlar'][old_tuman_nomi]['mfylar']):
+            old_tuman_nomi not in DATA[old_viloyat_nomi].tumanlar or 
+            old_mahalla_nomi not in DATA[old_viloyat_nomi].tumanlar[old_tuman_nomi].mfylar):
             return jsonify({'success': False, 'message': 'MFY topilmadi'})
         
-        # MFY ma'lumotlarini olish
-        mahalla_data = DATA[old_viloyat_nomi]['tumanlar'][old_tuman_nomi]['mfylar'].pop(old_mahalla_nomi)
+        ziddiyat = _versiya_ziddiyati(DATA[old_viloyat_nomi].tumanlar[old_tuman_nomi].mfylar[old_mahalla_nomi])
+        if ziddiyat is not None:
+            return ziddiyat
         
-        # Yangi joyga qo'shish
+        # Yangi joyni tekshirish (daraxt umumiy - xato bo'lsa hech narsa o'zgarmasligi kerak)
         if new_viloyat_nomi not in DATA:
             return jsonify({'success': False, 'message': 'Yangi viloyat topilmadi'})
         
-        if new_tuman_nomi not in DATA[new_viloyat_nomi]['tumanlar']:
+        if new_tuman_nomi not in DATA[new_viloyat_nomi].tumanlar:
             return jsonify({'success': False, 'message': 'Yangi tuman topilmadi'})
         
-        if new_mahalla_nomi in DATA[new_viloyat_nomi]['tumanlar'][new_tuman_nomi]['mfylar']:
+        if new_mahalla_nomi in DATA[new_viloyat_nomi].tumanlar[new_tuman_nomi].mfylar:
             return jsonify({'success': False, 'message': 'Bu MFY nomi allaqachon mavjud'})
         
-        DATA[new_viloyat_nomi]['tumanlar'][new_tuman_nomi]['mfylar'][new_mahalla_nomi] = mahalla_data
+        # MFY ma'lumotlarini yangi joyga ko'chirish
+        mahalla_data = DATA[old_viloyat_nomi].tumanlar[old_tuman_nomi].mfylar.pop(old_mahalla_nomi)
+        mahalla_data.versiya += 1
+        DATA[new_viloyat_nomi].tumanlar[new_tuman_nomi].mfylar[new_mahalla_nomi] = mahalla_data
         
-        success = save_data(DATA)
+        success = save_data(DATA, old_viloyat_nomi, new_viloyat_nomi)
         
         if success:
+            SUBSCRIBERS.move((old_viloyat_nomi, old_tuman_nomi, old_mahalla_nomi),
+                             (new_viloyat_nomi, new_tuman_nomi, new_mahalla_nomi))
+            data_changed(old_viloyat_nomi, DATA[old_viloyat_nomi], old_tuman_nomi, old_mahalla_nomi)
+            data_changed(new_viloyat_nomi, DATA[new_viloyat_nomi], new_tuman_nomi, new_mahalla_nomi)
+            record_changes(*moved_changes((old_viloyat_nomi, old_tuman_nomi, old_mahalla_nomi),
+                                          (new_viloyat_nomi, new_tuman_nomi, new_mahalla_nomi), mahalla_data))
             add_activity("MFY yangilandi", 
                         f"{old_viloyat_nomi}, {old_tuman_nomi}, {old_mahalla_nomi} -> {new_viloyat_nomi}, {new_tuman_nomi}, {new_mahalla_nomi}", 
                         session.get('username'))
-            return jsonify({'success': True, 'message': f'MFY muvaffaqiyatli yangilandi!'})
+            return jsonify({'success': True, 'message': f'MFY muvaffaqiyatli yangilandi!', 'versiya': mahalla_data.versiya})
+        else:
+            return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
+
+@app.route('/admin/update_mahalla_joylashuv', methods=['POST'])
+@login_required
+@region_write()
+def update_mahalla_joylashuv():
+    """MFY koordinatalari (lat, lon); ikkalasi bo'sh yuborilsa - o'chiriladi."""
+    try:
+        DATA = load_data()
+        viloyat_nomi = request.json.get('viloyat_nomi', '').strip()
+        tuman_nomi = request.json.get('tuman_nomi', '').strip()
+        mahalla_nomi = request.json.get('mahalla_nomi', '').strip()
+        
+        if not all([viloyat_nomi, tuman_nomi, mahalla_nomi]):
+            return jsonify({'success': False, 'message': 'Barcha maydonlarni to\'ldiring'})
+        
+        mfy = find_mfy(DATA, viloyat_nomi, tuman_nomi, mahalla_nomi)
+        if mfy is None:
+            return jsonify({'success': False, 'message': 'MFY topilmadi'})
+        
+        try:
+            joylashuv = _joylashuv_arg(request.json)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Koordinatalar noto\'g\'ri'})
+        
+        ziddiyat = _versiya_ziddiyati(mfy)
+        if ziddiyat is not None:
+            return ziddiyat
+        
+        mfy.joylashuv = MISSING if joylashuv is None else joylashuv
+        mfy.versiya += 1
+        success = save_data(DATA, viloyat_nomi)
+        
+        if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi, mahalla_nomi)
+            record_changes(change_event('upsert', (viloyat_nomi, tuman_nomi, mahalla_nomi), mfy))
+            details = f"{joylashuv[0]}, {joylashuv[1]}" if joylashuv is not None else "o'chirildi"
+            add_activity("MFY joylashuvi yangilandi", f"{viloyat_nomi}, {tuman_nomi}, {mahalla_nomi}: {details}",
+                         session.get('username'))
+            return jsonify({'success': True, 'message': 'MFY joylashuvi yangilandi!', 'versiya': mfy.versiya})
+        else:
+            return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
+
+def _joylashuv_qatorlari():
+    """Import qatorlari: CSV fayl (viloyat,tuman,mahalla,lat,lon sarlavhali) yoki JSON {"joylashuvlar": [...]}."""
+    upload = request.files.get('file')
+    if upload is not None:
+        return list(csv.DictReader(io.StringIO(upload.read().decode('utf-8-sig'))))
+    return (request.get_json(silent=True) or {}).get('joylashuvlar', [])
+
+@app.route('/admin/import_joylashuvlar', methods=['POST'])
+@login_required
+@region_write(all_regions=True)
+def import_joylashuvlar():
+    """MFY koordinatalarini ommaviy yuklash. Topilmagan MFY yoki noto'g'ri koordinatali qatorlar
+    o'tkazib yuboriladi (qator raqamlari javobda), qolganlari bitta saqlashda yoziladi."""
+    try:
+        DATA = load_data()
+        rows = _joylashuv_qatorlari()
+        changed = set()
+        # Bir MFY bir necha qatorda bo'lsa ham lentaga bitta hodisa
+        mfylar = {}
+        yangilandi = 0
+        topilmadi, xato = [], []
+        for n, row in enumerate(rows, 1):
+            viloyat_nomi = str(row.get('viloyat') or '').strip()
+            tuman_nomi = str(row.get('tuman') or '').strip()
+            mahalla_nomi = str(row.get('mahalla') or '').strip()
+            mfy = find_mfy(DATA, viloyat_nomi, tuman_nomi, mahalla_nomi)
+            if mfy is None:
+                topilmadi.append(n)
+                continue
+            try:
+                joylashuv = _joylashuv_arg(row)
+            except (TypeError, ValueError):
+                xato.append(n)
+                continue
+            mfy.joylashuv = MISSING if joylashuv is None else joylashuv
+            mfy.versiya += 1
+            changed.add(viloyat_nomi)
+            mfylar[(viloyat_nomi, tuman_nomi, mahalla_nomi)] = mfy
+            yangilandi += 1
+        
+        result = {'yangilandi': yangilandi, 'topilmadi': topilmadi[:100], 'xato': xato[:100]}
+        if not changed:
+            return jsonify({'success': False, 'message': 'Yangilanadigan MFY topilmadi', **result})
+        
+        success = save_data(DATA, *changed)
+        
+        if success:
+            for viloyat_nomi in changed:
+                data_changed(viloyat_nomi, DATA[viloyat_nomi])
+            record_changes(*(change_event('upsert', path, mfy) for path, mfy in mfylar.items()))
+            add_activity("MFY joylashuvlari import qilindi",
+                         f"{yangilandi} ta MFY, {len(topilmadi)} ta topilmadi, {len(xato)} ta xato",
+                         session.get('username'))
+            return jsonify({'success': True, 'message': f'{yangilandi} ta MFY joylashuvi yangilandi', **result})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
@@ -845,6 +4430,7 @@ def update_mahalla():
 
 @app.route('/admin/update_xodim', methods=['POST'])
 @login_required
+@region_write()
 def update_xodim():
     try:
         DATA = load_data()
@@ -862,28 +4448,37 @@ def update_xodim():
             return jsonify({'success': False, 'message': 'Barcha maydonlarni to\'ldiring'})
             
         if (viloyat_nomi not in DATA or 
-            tuman_nomi not in DATA[viloyat_nomi]['tumanlar'] or 
-            mahalla_nomi not in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar']):
+            tuman_nomi not in DATA[viloyat_nomi].tumanlar or 
+            mahalla_nomi not in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar):
             return jsonify({'success': False, 'message': 'MFY topilmadi'})
         
+        xodimlar = DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi].xodimlar
+        eski = xodimlar.get(lavozim_old or lavozim, BOSH_XODIM)
+        ziddiyat = _versiya_ziddiyati(eski)
+        if ziddiyat is not None:
+            return ziddiyat
+        # Boshqa lavozimga o'tkazilsa o'sha o'rindagi xodim almashadi - versiya ikkalasidan katta bo'ladi
+        versiya = max(eski.versiya, xodimlar.get(lavozim, BOSH_XODIM).versiya) + 1
+        
+        dublikatlar = _telefon_dublikatlari(DATA, telefon, (viloyat_nomi, tuman_nomi, mahalla_nomi, lavozim),
+                                            (viloyat_nomi, tuman_nomi, mahalla_nomi, lavozim_old))
+        
         # Agar lavozim o'zgartirilgan bo'lsa
         if lavozim_old and lavozim_old != lavozim:
-            if lavozim_old in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['xodimlar']:
-                # Eski lavozimni o'chirish
-                del DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['xodimlar'][lavozim_old]
+            # Eski lavozimni o'chirish (sxemadagi lavozim bo'lsa, bo'sh holatga qaytadi)
+            xodimlar.pop(lavozim_old, None)
         
         # Yangi ma'lumotlarni saqlash
-        DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['xodimlar'][lavozim] = {
-            "ism": ism,
-            "telefon": telefon,
-            "email": email,
-            "holat": holat
-        }
-        success = save_data(DATA)
+        xodim = xodimlar[sys.intern(lavozim)] = StaffMember(ism, telefon, email, holat, versiya=versiya)
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi, mahalla_nomi)
+            record_changes(*moved_changes((viloyat_nomi, tuman_nomi, mahalla_nomi, lavozim_old or lavozim),
+                                          (viloyat_nomi, tuman_nomi, mahalla_nomi, lavozim), xodim))
             add_activity("Xodim tahrirlandi", f"{viloyat_nomi}, {tuman_nomi}, {mahalla_nomi} - {lavozim}: {ism}", session.get('username'))
-            return jsonify({'success': True, 'message': f'Xodim muvaffaqiyatli tahrirlandi!'})
+            return jsonify({'success': True, 'message': 'Xodim muvaffaqiyatli tahrirlandi!' + _dublikat_ogohlantirish(dublikatlar),
+                            'dublikatlar': dublikatlar, 'versiya': versiya})
         else:
             return jsonify({'success': False, 'message': 'Ma\'lumotlarni saqlashda xato'})
         
@@ -893,6 +4488,7 @@ def update_xodim():
 # O'chirish API'lari
 @app.route('/admin/delete_viloyat', methods=['POST'])
 @login_required
+@region_write()
 def delete_viloyat():
     try:
         DATA = load_data()
@@ -904,10 +4500,17 @@ def delete_viloyat():
         if viloyat_nomi not in DATA:
             return jsonify({'success': False, 'message': 'Viloyat topilmadi'})
         
+        ziddiyat = _versiya_ziddiyati(DATA[viloyat_nomi])
+        if ziddiyat is not None:
+            return ziddiyat
+        
         del DATA[viloyat_nomi]
         success = save_data(DATA)
         
         if success:
+            SUBSCRIBERS.remove(viloyat_nomi)
+            data_changed(viloyat_nomi, None)
+            record_changes(change_event('delete', (viloyat_nomi,)))
             add_activity("Viloyat o'chirildi", f"{viloyat_nomi} viloyati o'chirildi", session.get('username'))
             return jsonify({'success': True, 'message': f'"{viloyat_nomi}" o\'chirildi'})
         else:
@@ -918,6 +4521,7 @@ def delete_viloyat():
 
 @app.route('/admin/delete_tuman', methods=['POST'])
 @login_required
+@region_write()
 def delete_tuman():
     try:
         DATA = load_data()
@@ -927,16 +4531,23 @@ def delete_tuman():
         if not all([viloyat_nomi, tuman_nomi]):
             return jsonify({'success': False, 'message': 'Viloyat yoki tuman nomi berilmagan'})
             
-        if viloyat_nomi not in DATA or tuman_nomi not in DATA[viloyat_nomi]['tumanlar']:
+        if viloyat_nomi not in DATA or tuman_nomi not in DATA[viloyat_nomi].tumanlar:
             return jsonify({'success': False, 'message': 'Tuman topilmadi'})
         
+        ziddiyat = _versiya_ziddiyati(DATA[viloyat_nomi].tumanlar[tuman_nomi])
+        if ziddiyat is not None:
+            return ziddiyat
+        
         # MFYlar sonini hisoblash
-        mfy_count = len(DATA[viloyat_nomi]['tumanlar'][tuman_nomi].get('mfylar', {}))
+        mfy_count = len(DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar)
         
-        del DATA[viloyat_nomi]['tumanlar'][tuman_nomi]
-        success = save_data(DATA)
+        del DATA[viloyat_nomi].tumanlar[tuman_nomi]
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            SUBSCRIBERS.remove(viloyat_nomi, tuman_nomi)
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi)
+            record_changes(change_event('delete', (viloyat_nomi, tuman_nomi)))
             add_activity("Tuman o'chirildi", 
                         f"{viloyat_nomi}, {tuman_nomi} ({mfy_count} ta MFY bilan)", 
                         session.get('username'))
@@ -949,6 +4560,7 @@ def delete_tuman():
 
 @app.route('/admin/delete_mahalla', methods=['POST'])
 @login_required
+@region_write()
 def delete_mahalla():
     try:
         DATA = load_data()
@@ -960,14 +4572,21 @@ def delete_mahalla():
             return jsonify({'success': False, 'message': 'Barcha maydonlar to\'ldirilmagan'})
             
         if (viloyat_nomi not in DATA or 
-            tuman_nomi not in DATA[viloyat_nomi]['tumanlar'] or 
-            mahalla_nomi not in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar']):
+            tuman_nomi not in DATA[viloyat_nomi].tumanlar or 
+            mahalla_nomi not in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar):
             return jsonify({'success': False, 'message': 'MFY topilmadi'})
         
-        del DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]
-        success = save_data(DATA)
+        ziddiyat = _versiya_ziddiyati(DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi])
+        if ziddiyat is not None:
+            return ziddiyat
+        
+        del DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi]
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            SUBSCRIBERS.remove(viloyat_nomi, tuman_nomi, mahalla_nomi)
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi, mahalla_nomi)
+            record_changes(change_event('delete', (viloyat_nomi, tuman_nomi, mahalla_nomi)))
             add_activity("MFY o'chirildi", f"{viloyat_nomi}, {tuman_nomi}, {mahalla_nomi} MFYsi o'chirildi", session.get('username'))
             return jsonify({'success': True, 'message': f'"{mahalla_nomi}" MFY o\'chirildi'})
         else:
@@ -978,6 +4597,7 @@ def delete_mahalla():
 
 @app.route('/admin/delete_xodim', methods=['POST'])
 @login_required
+@region_write()
 def delete_xodim():
     try:
         DATA = load_data()
@@ -990,19 +4610,26 @@ def delete_xodim():
             return jsonify({'success': False, 'message': 'Barcha maydonlar to\'ldirilmagan'})
             
         if (viloyat_nomi not in DATA or 
-            tuman_nomi not in DATA[viloyat_nomi]['tumanlar'] or 
-            mahalla_nomi not in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'] or
-            lavozim not in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['xodimlar']):
+            tuman_nomi not in DATA[viloyat_nomi].tumanlar or 
+            mahalla_nomi not in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar or
+            (lavozim not in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi].xodimlar and
+             lavozim not in _LAVOZIMLAR_SET)):
             return jsonify({'success': False, 'message': 'Xodim topilmadi'})
         
-        xodim_ismi = DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['xodimlar'][lavozim].get('ism', '')
+        xodim = DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi].xodimlar[lavozim]
+        ziddiyat = _versiya_ziddiyati(xodim)
+        if ziddiyat is not None:
+            return ziddiyat
+        xodim_ismi = xodim.ism or ''
         
-        # Xodimni butunlay o'chirish
-        del DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['xodimlar'][lavozim]
+        # Xodimni o'chirish (sxemadagi lavozim bo'sh holatga qaytadi)
+        DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi].xodimlar.pop(lavozim, None)
         
-        success = save_data(DATA)
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi, mahalla_nomi)
+            record_changes(change_event('delete', (viloyat_nomi, tuman_nomi, mahalla_nomi, lavozim)))
             add_activity("Xodim o'chirildi", f"{viloyat_nomi}, {tuman_nomi}, {mahalla_nomi} - {lavozim}: {xodim_ismi}", session.get('username'))
             return jsonify({'success': True, 'message': f'Xodim o\'chirildi!'})
         else:
@@ -1184,6 +4811,21 @@ def change_language():
         return jsonify({'success': False, 'message': f'Xato: {e}'})
 
 # Qolgan API'lar
+# ?versiya=1 - nomlar o'rniga [{"nomi": ..., "versiya": ...}] (tahrirlash/o'chirishda qaytariladi)
+def _nomlar(items):
+    if request.args.get('versiya') == '1':
+        return jsonify([{'nomi': nomi, 'versiya': entity.versiya} for nomi, entity in items])
+    return jsonify([nomi for nomi, _ in items])
+
+@app.route('/admin/get_viloyatlar')
+@login_required
+def get_viloyatlar():
+    try:
+        DATA = load_data()
+        return _nomlar(list(DATA.items()))
+    except Exception as e:
+        return jsonify([])
+
 @app.route('/admin/get_tumanlar')
 @login_required
 def get_tumanlar():
@@ -1194,8 +4836,7 @@ def get_tumanlar():
         if not viloyat or viloyat not in DATA:
             return jsonify([])
             
-        tumans = list(DATA[viloyat]['tumanlar'].keys())
-        return jsonify(tumans)
+        return _nomlar(list(DATA[viloyat].tumanlar.items()))
     except Exception as e:
         return jsonify([])
 
@@ -1207,35 +4848,188 @@ def get_mahallalar():
         viloyat = request.args.get('viloyat', '').strip()
         tuman = request.args.get('tuman', '').strip()
         
-        if not viloyat or not tuman or viloyat not in DATA or tuman not in DATA[viloyat]['tumanlar']:
+        if not viloyat or not tuman or viloyat not in DATA or tuman not in DATA[viloyat].tumanlar:
             return jsonify([])
             
-        mahallalar = list(DATA[viloyat]['tumanlar'][tuman]['mfylar'].keys())
-        return jsonify(mahallalar)
+        return _nomlar(list(DATA[viloyat].tumanlar[tuman].mfylar.items()))
     except Exception as e:
         return jsonify([])
 
-@app.route('/admin/get_xodimlar')
+@app.route('/admin/get_xodimlar')
+@login_required
+def get_xodimlar():
+    try:
+        DATA = load_data()
+        viloyat = request.args.get('viloyat', '').strip()
+        tuman = request.args.get('tuman', '').strip()
+        mahalla = request.args.get('mahalla', '').strip()
+        
+        if not all([viloyat, tuman, mahalla]):
+            return jsonify({})
+            
+        mfy = find_mfy(DATA, viloyat, tuman, mahalla)
+        if mfy is not None:
+            return jsonify({lavozim: {**xodim.to_json(), 'versiya': xodim.versiya}
+                            for lavozim, xodim in mfy.lavozimlar().items()})
+        
+        return jsonify({})
+    except Exception as e:
+        return jsonify({})
+
+@app.route('/admin/find_telefon')
+@login_required
+def find_telefon():
+    """Telefon raqami bo'yicha xodim(lar) - PHONES indeksidan."""
+    try:
+        DATA = load_data()
+        telefon = request.args.get('telefon', '').strip()
+        if telefon_kaliti(telefon) is None:
+            return jsonify({'success': False, 'message': 'Telefon raqamini kiriting'})
+        return jsonify({'success': True, 'xodimlar': [
+            {'viloyat': v, 'tuman': t, 'mahalla': m, 'lavozim': lavozim, **xodim.to_json()}
+            for v, t, m, lavozim, xodim in PHONES.lookup(DATA, telefon)]})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
+
+@app.route('/admin/telefon_dublikatlar')
+@login_required
+def telefon_dublikatlar():
+    """Bir nechta xodimda uchraydigan telefon raqamlari."""
+    try:
+        PHONES.sync(load_data())
+        return jsonify({'success': True, 'dublikatlar': [
+            {'telefon': key, 'xodimlar': [{'viloyat': v, 'tuman': t, 'mahalla': m, 'lavozim': lavozim}
+                                          for v, t, m, lavozim in slots]}
+            for key, slots in sorted(PHONES.duplicates().items())]})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
+
+# Xabarnoma API'lari
+@app.route('/admin/broadcast', methods=['POST'])
+@login_required
+def broadcast():
+    try:
+        DATA = load_data()
+        viloyat_nomi = request.json.get('viloyat_nomi', '').strip()
+        tuman_nomi = request.json.get('tuman_nomi', '').strip()
+        mahalla_nomi = request.json.get('mahalla_nomi', '').strip()
+        matn = request.json.get('matn', '').strip()
+        
+        if not viloyat_nomi or not matn:
+            return jsonify({'success': False, 'message': 'Viloyat va xabar matnini kiriting'})
+        
+        if mahalla_nomi and not tuman_nomi:
+            return jsonify({'success': False, 'message': 'MFY uchun tumanni ham tanlang'})
+        
+        if (viloyat_nomi not in DATA or
+            (tuman_nomi and tuman_nomi not in DATA[viloyat_nomi].tumanlar) or
+            (mahalla_nomi and mahalla_nomi not in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar)):
+            return jsonify({'success': False, 'message': 'Hudud topilmadi'})
+        
+        if SUBSCRIBERS.mode != 'exact':
+            return jsonify({'success': False, 'message': 'Xabarnoma uchun obunachilar aniq rejimda bo\'lishi kerak'})
+        
+        target = {'viloyat': viloyat_nomi, 'tuman': tuman_nomi or None, 'mahalla': mahalla_nomi or None}
+        job = BROADCASTER.submit(target, matn, session.get('username'))
+        
+        hudud = ", ".join(x for x in [viloyat_nomi, tuman_nomi, mahalla_nomi] if x)
+        add_activity("Xabarnoma yuborildi", f"{hudud}: {job['total']} ta obunachiga", session.get('username'))
+        return jsonify({'success': True,
+                        'message': f'Xabarnoma {job["total"]} ta obunachiga navbatga qo\'yildi',
+                        'broadcast_id': job['id']})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
+
+@app.route('/admin/get_hisobot')
 @login_required
-def get_xodimlar():
+def get_hisobot():
     try:
         DATA = load_data()
-        viloyat = request.args.get('viloyat', '').strip()
-        tuman = request.args.get('tuman', '').strip()
-        mahalla = request.args.get('mahalla', '').strip()
+        viloyat, tuman, lavozim, nofaol = _report_args()
         
-        if not all([viloyat, tuman, mahalla]):
-            return jsonify({})
-            
-        if (viloyat in DATA and 
-            tuman in DATA[viloyat]['tumanlar'] and 
-            mahalla in DATA[viloyat]['tumanlar'][tuman]['mfylar']):
-            xodimlar = DATA[viloyat]['tumanlar'][tuman]['mfylar'][mahalla]['xodimlar']
-            return jsonify(xodimlar)
+        if tuman and not viloyat:
+            return jsonify({'success': False, 'message': 'Tuman uchun viloyatni ham tanlang'})
         
-        return jsonify({})
+        if lavozim and lavozim not in _LAVOZIMLAR_SET:
+            return jsonify({'success': False, 'message': 'Noma\'lum lavozim'})
+        
+        report = build_report(DATA, viloyat, tuman, lavozim, nofaol)
+        if report is None:
+            return jsonify({'success': False, 'message': 'Hudud topilmadi'})
+        return jsonify({'success': True, **report})
     except Exception as e:
-        return jsonify({})
+        return jsonify({'success': False, 'message': f'Server xatosi: {e}'})
+
+@app.route('/admin/broadcast_status')
+@login_required
+def broadcast_status():
+    broadcast_id = request.args.get('id', '').strip()
+    if broadcast_id and broadcast_id not in BROADCASTER.jobs:
+        return jsonify({'success': False, 'message': 'Xabarnoma topilmadi'})
+    return jsonify({'success': True, 'broadcasts': BROADCASTER.status(broadcast_id or None)})
+
+# O'zgarishlar lentasi API'lari (tashqi tizimlar va replikalar uchun)
+def _changes_allowed():
+    """Admin sessiyasi yoki CHANGES_TOKEN (Authorization: Bearer; URL dagi token qabul qilinmaydi)."""
+    if session.get('logged_in'):
+        return True
+    return _bearer_ok(CHANGES_TOKEN)
+
+@app.route(CHANGES_PATH)
+def api_changes():
+    """since dan keyingi hodisalar (ko'pi bilan limit ta). Yangisi bo'lmasa timeout soniyagacha kutadi.
+
+    Javob: {"success": true, "seq": keyingi since, "more": yana bormi, "changes": [...]}; since saqlangan
+    oraliqdan tashqarida bo'lsa - 410 va "resync": /api/changes/snapshot dan qaytadan boshlanadi.
+    """
+    if not _changes_allowed():
+        return jsonify({'success': False, 'message': 'Ruxsat yo\'q'}), 401
+    try:
+        since = int(request.args.get('since', 0))
+        timeout = min(max(float(request.args.get('timeout', CHANGES_MAX_WAIT)), 0.0), CHANGES_MAX_WAIT)
+        limit = min(max(int(request.args.get('limit', 1000)), 1), 10000)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'since, timeout yoki limit noto\'g\'ri'}), 400
+    # Kutayotgan so'rovlar threadlarni band qiladi (gunicorn workeri va waitressda WEB_THREADS ta) - bittasi
+    # admin panel uchun doim bo'sh qoladi, chegaradan oshganlari darhol qaytadi.
+    # RUN_MODE=async da kutish CHANGES.mount() da, event loopda bo'lgan
+    waiters = CHANGES_MAX_WAITERS if WEB_POOL_THREADS is None else min(CHANGES_MAX_WAITERS, WEB_POOL_THREADS - 1)
+    busy = CHANGES.waiters >= waiters
+    if busy or RUN_MODE == 'async':
+        timeout = 0.0
+    result = CHANGES.wait(since, timeout, limit)
+    if result is None:
+        METRICS.inc('smartmahalla_changes_long_polls_total', 1, (('result', 'resync'),))
+        return jsonify({'success': False, 'resync': True, 'seq': CHANGES.seq,
+                        'message': 'Bu raqamdagi hodisalar saqlanmagan - snapshotni qaytadan oling'}), 410
+    seq, lines = result
+    METRICS.inc('smartmahalla_changes_long_polls_total', 1, (('result', 'changes' if lines else 'empty'),))
+    # Hodisalar fayldagi tayyor baytlar - qayta kodlanmaydi
+    body = b'{"success":true,"seq":%d,"more":%s,"changes":[%s]}' % (
+        seq, b'true' if seq < CHANGES.seq else b'false', b','.join(lines))
+    response = app.response_class(body, mimetype='application/json')
+    if busy:
+        response.headers['Retry-After'] = '1'
+    return response
+
+@app.route(CHANGES_PATH + '/snapshot')
+def api_changes_snapshot():
+    """To'liq holat va unga mos lenta raqami: {"success": true, "seq": N, "data": {...}} - keyin ?since=N."""
+    if not _changes_allowed():
+        return jsonify({'success': False, 'message': 'Ruxsat yo\'q'}), 401
+    # Barcha viloyat qulflari: yarim yo'ldagi tahrirlar saqlanib, hodisasi yozilib bo'ladi - raqam va
+    # shardlar aynan bir holatni ko'rsatadi (RUN_MODE=async da so'rovlar baribir ketma-ket)
+    token = REGION_LOCKS.acquire() if RUN_MODE != 'async' else None
+    try:
+        seq = CHANGES.last()
+        regions = STORE.raw_regions()
+    finally:
+        if token is not None:
+            REGION_LOCKS.release(token)
+    # Shardlar tayyor JSON - parse qilinmay bitta javobga ulanadi
+    data = b','.join(JSON_CODEC.dumps(name) + b':' + raw for name, raw in regions)
+    return app.response_class(b'{"success":true,"seq":%d,"data":{%s}}' % (seq, data), mimetype='application/json')
 
 # 404 sahifasi
 @app.errorhandler(404)
@@ -1245,20 +5039,539 @@ def not_found(error):
                         language=language, 
                         texts=TEXTS.get(language, TEXTS['uz'])), 404
 
+# Ommaviy xabarnomalar (MFY, tuman yoki viloyat obunachilariga)
+def load_broadcasts():
+    try:
+        if os.path.exists(BROADCASTS_FILE):
+            return read_json(BROADCASTS_FILE)
+        return {}
+    except Exception as e:
+        print(f"❌ Xabarnomalarni yuklashda xato: {e}")
+        return {}
+
+def save_broadcasts(broadcasts):
+    try:
+        write_json(BROADCASTS_FILE, broadcasts, pretty=False)
+        return True
+    except Exception as e:
+        record_save_error('broadcasts', e)
+        print(f"❌ Xabarnomalarni saqlashda xato: {e}")
+        return False
+
+class TokenBucket:
+    """Umumiy yuborish tezligi cheklovi (xabar/soniya), portlashlarsiz.
+
+    pause() - Telegram 429 (RetryAfter) qaytarsa, barcha yuboruvchilar shu vaqtgacha to'xtaydi.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Hali yuborilayotgan xabarnomalar holatlari; qolganlari - yakunlandi yoki xato
+BROADCAST_ACTIVE = ('navbatda', 'yuborilmoqda')
+
+class Broadcaster:
+    """Xabarnomalarni fon threadida, tezlik limitlariga rioya qilib yuboradi.
+
+    Har bir yuborilgan xabar BROADCAST_LOG_FILE ga yoziladi (append-only),
+    shuning uchun qayta ishga tushganda yuborish to'xtagan joyidan davom etadi.
+    Yetkazish kamida bir marta (at-least-once): jurnal send_message dan keyin yoziladi, jarayon
+    aynan shu oraliqda to'xtasa, o'sha qabul qiluvchiga xabar qayta yuboriladi.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = load_broadcasts()
+        self.done = {}
+        self.loop = None
+        self.queue = None
+        self.thread = None
+        self.log_file = None
+        self.chat_last_sent = {}
+        # Web workerda: xabarnoma broadcasts.json ga yoziladi, uni yuboruvchi (master) jarayon oladi
+        self.remote = False
+        # broadcasts.json ning oxirgi o'qilgan/yozilgan holati - o'zgarmagan faylni qayta o'qimaslik uchun
+        self.stamp = None
+        self._replay_log()
+
+    def _replay_log(self):
+        # Oxirgi checkpointdan keyingi natijalarni tiklash
+        if not os.path.exists(BROADCAST_LOG_FILE):
+            return
+        results = {}
+        try:
+            with open(BROADCAST_LOG_FILE, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 3 or parts[0] not in self.jobs:
+                        continue
+                    results.setdefault(parts[0], {})[int(parts[1])] = parts[2] == '1'
+            # Jurnal faol xabarnomalarning barcha natijalarini saqlaydi
+            for job_id, job_results in results.items():
+                job = self.jobs[job_id]
+                job['sent'] = sum(1 for ok in job_results.values() if ok)
+                job['failed'] = len(job_results) - job['sent']
+                job['cursor'] = 0
+                self.done[job_id] = set(job_results)
+                self._advance_cursor(job, self.done[job_id])
+        except Exception as e:
+            print(f"❌ Xabarnoma jurnalini o'qishda xato: {e}")
+
+    def _advance_cursor(self, job, done):
+        while job['cursor'] in done:
+            done.discard(job['cursor'])
+            job['cursor'] += 1
+
+    def _record(self, job, index, ok):
+        with self.lock:
+            self.log_file.write(f"{job['id']} {index} {1 if ok else 0}\n")
+            self.log_file.flush()
+            job['sent' if ok else 'failed'] += 1
+            done = self.done.setdefault(job['id'], set())
+            done.add(index)
+            self._advance_cursor(job, done)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._thread_main, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def start_in_loop(self):
+        """Joriy event loopda ishga tushirish (RUN_MODE=async) - alohida thread ochilmaydi."""
+        if self.thread is not None or self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._prepare()
+        self.task = self.loop.create_task(self._worker())
+
+    def _thread_main(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._prepare()
+        ready.set()
+        self.loop.run_until_complete(self._worker())
+
+    def _compact(self):
+        # Tugagan xabarnomalarda qabul qiluvchilar ro'yxati kerak emas (broadcasts.json har soniyada
+        # qayta yoziladi); ulardan faqat eng yangi BROADCASTS_KEEP tasi qoladi. self.lock ostida
+        finished = []
+        for job in self.jobs.values():
+            if job['status'] not in BROADCAST_ACTIVE:
+                if 'recipients' in job:
+                    job.setdefault('total', len(job['recipients']))
+                    del job['recipients']
+                finished.append(job)
+        finished.sort(key=lambda j: j.get('finished_at') or j['created_at'])
+        for job in finished[:max(0, len(finished) - BROADCASTS_KEEP)]:
+            del self.jobs[job['id']]
+
+    def _save(self):
+        # WRITE_LOCK va self.lock ostida (shu tartibda): workerlar qo'shgan xabarnomalar ustidan yozib
+        # yuborilmasin - avval ular olinadi
+        self._adopt()
+        if save_broadcasts(self.jobs):
+            self.stamp = _stamp(BROADCASTS_FILE)
+
+    def _adopt(self):
+        """Web workerlar broadcasts.json ga yozgan yangi xabarnomalarni olish va navbatga qo'yish."""
+        try:
+            stamp = _stamp(BROADCASTS_FILE)
+        except OSError:
+            return []
+        if stamp == self.stamp:
+            return []
+        self.stamp = stamp
+        added = []
+        for job_id, job in load_broadcasts().items():
+            if job_id not in self.jobs and job.get('status') == 'navbatda':
+                self.jobs[job_id] = job
+                added.append(job_id)
+        if self.queue is not None:
+            for job_id in added:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, job_id)
+        return added
+
+    def adopt(self):
+        """Yuboruvchi jarayon: fayl kuzatuvchisi yoki navbat bo'sh turganda chaqiradi."""
+        try:
+            if _stamp(BROADCASTS_FILE) == self.stamp:
+                return
+        except OSError:
+            return
+        with WRITE_LOCK, self.lock:
+            added = self._adopt()
+        if added:
+            print(f"📨 Web workerdan {len(added)} ta yangi xabarnoma")
+
+    def _prepare(self):
+        with WRITE_LOCK, self.lock:
+            self._compact()
+            self._save()
+            self.log_file = open(BROADCAST_LOG_FILE, 'a', encoding='utf-8')
+        self.queue = asyncio.Queue()
+        with self.lock:
+            pending = [job['id'] for job in sorted(self.jobs.values(), key=lambda j: j['created_at'])
+                       if job['status'] in BROADCAST_ACTIVE]
+        for job_id in pending:
+            self.queue.put_nowait(job_id)
+        if pending:
+            print(f"📨 {len(pending)} ta xabarnoma davom ettiriladi")
+
+    def submit(self, target, text, username):
+        recipients = SUBSCRIBERS.user_ids(target['viloyat'], target.get('tuman'), target.get('mahalla'))
+        job = {
+            "id": secrets.token_hex(6),
+            "target": target,
+            "text": text,
+            "recipients": recipients,
+            "total": len(recipients),
+            "cursor": 0,
+            "sent": 0,
+            "failed": 0,
+            "retries": 0,
+            "attempts": 0,
+            "status": "navbatda",
+            "created_by": username,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None
+        }
+        if self.remote:
+            # Faylga yozilmagan xabarnoma qabul qilinmaydi - yuboruvchi jarayon uni albatta ko'radi
+            with WRITE_LOCK:
+                jobs = load_broadcasts()
+                jobs[job['id']] = job
+                if not save_broadcasts(jobs):
+                    raise OSError("xabarnomani saqlab bo'lmadi")
+                with self.lock:
+                    self.jobs = jobs
+            return job
+        with WRITE_LOCK, self.lock:
+            self.jobs[job['id']] = job
+            self._save()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, job['id'])
+        return job
+
+    def refresh(self):
+        """Web worker: xabarnomalar holatini fayldan yangilash (yuboruvchi jarayon har soniyada yozadi)."""
+        try:
+            stamp = _stamp(BROADCASTS_FILE)
+        except OSError:
+            return
+        if stamp != self.stamp:
+            self.stamp = stamp
+            jobs = load_broadcasts()
+            with self.lock:
+                self.jobs = jobs
+
+    def status(self, job_id=None):
+        with self.lock:
+            jobs = [self.jobs[job_id]] if job_id else list(self.jobs.values())
+            result = []
+            for job in jobs:
+                info = {k: v for k, v in job.items() if k != 'recipients'}
+                info['total'] = job['total'] if 'total' in job else len(job['recipients'])
+                info['progress'] = round(100 * job['cursor'] / info['total'], 1) if info['total'] else 100.0
+                if job['started_at'] and job['status'] == 'yuborilmoqda':
+                    elapsed = (datetime.now() - datetime.fromisoformat(job['started_at'])).total_seconds()
+                    info['rate'] = round(job['cursor'] / elapsed, 2) if elapsed > 0 else 0.0
+                result.append(info)
+            return result
+
+    async def _worker(self):
+        bot = None
+        self.bucket = TokenBucket(BROADCAST_GLOBAL_RATE)
+        while True:
+            try:
+                job_id = await asyncio.wait_for(self.queue.get(), 2)
+            except asyncio.TimeoutError:
+                # Fayl kuzatuvchisi o'chirilgan bo'lsa ham workerlar qo'shgan xabarnomalar olinadi
+                self.adopt()
+                continue
+            try:
+                if bot is None:
+                    # RUN_MODE=admin: telegram birinchi xabarnomada yuklanadi
+                    import_telegram()
+                    bot = Bot(BOT_TOKEN, base_url=TELEGRAM_API_URL,
+                              request=HTTPXRequest(connection_pool_size=BROADCAST_CONCURRENCY + 1))
+                if not bot._initialized:
+                    await bot.initialize()
+                await self._process(bot, job_id)
+            except Exception as e:
+                print(f"❌ Xabarnoma xatosi ({job_id}): {e}")
+                if self._give_up(job_id, e):
+                    continue
+                await asyncio.sleep(5)
+                self.queue.put_nowait(job_id)
+
+    def _give_up(self, job_id, error):
+        """Xabarnoma BROADCAST_JOB_RETRIES marta yiqilgan bo'lsa 'xato' holatida yakunlanadi."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return True
+        with WRITE_LOCK, self.lock:
+            job['attempts'] = job.get('attempts', 0) + 1
+            if job['attempts'] < BROADCAST_JOB_RETRIES:
+                return False
+            job['status'] = 'xato'
+            job['error'] = f"{type(error).__name__}: {error}"
+            job['finished_at'] = datetime.now().isoformat()
+            self._finish(job_id)
+        print(f"❌ Xabarnoma {job_id} to'xtatildi: {job['attempts']} marta yiqildi")
+        return True
+
+    def _finish(self, job_id):
+        # WRITE_LOCK va self.lock ostida: natijalar jurnali endi kerak emas, ro'yxat va eski xabarnomalar tozalanadi
+        self.done.pop(job_id, None)
+        self._compact()
+        self._save()
+        if not any(j['status'] in BROADCAST_ACTIVE for j in self.jobs.values()):
+            self.log_file.truncate(0)
+
+    async def _process(self, bot, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job['status'] not in BROADCAST_ACTIVE:
+            return
+        with WRITE_LOCK, self.lock:
+            job['status'] = 'yuborilmoqda'
+            job['started_at'] = job['started_at'] or datetime.now().isoformat()
+            self._save()
+
+        recipients = job['recipients']
+        done = self.done.get(job_id, set())
+        pending = iter([i for i in range(job['cursor'], len(recipients)) if i not in done])
+
+        async def sender():
+            for index in pending:
+                ok = await self._send(bot, recipients[index], job)
+                self._record(job, index, ok)
+
+        async def checkpoint():
+            while True:
+                await asyncio.sleep(1)
+                with WRITE_LOCK, self.lock:
+                    self._save()
+
+        checkpointer = asyncio.ensure_future(checkpoint())
+        senders = [asyncio.ensure_future(sender()) for _ in range(BROADCAST_CONCURRENCY)]
+        try:
+            await asyncio.gather(*senders)
+        finally:
+            # Bittasi yiqilsa gather qolganlarini to'xtatmaydi - qayta urinishdan oldin ular ham
+            # to'xtashi shart, aks holda yangi _process o'sha qabul qiluvchilarga yana yuboradi
+            for task in senders + [checkpointer]:
+                task.cancel()
+            await asyncio.gather(*senders, checkpointer, return_exceptions=True)
+
+        with WRITE_LOCK, self.lock:
+            job['status'] = 'yakunlandi'
+            job['finished_at'] = datetime.now().isoformat()
+            self._finish(job_id)
+        self.chat_last_sent.clear()
+        print(f"📨 Xabarnoma {job_id} yakunlandi: {job['sent']} ta yuborildi, {job['failed']} ta xato")
+
+    async def _send(self, bot, chat_id, job):
+        attempt = 0
+        while True:
+            # Bitta chatga soniyasiga 1 tadan ko'p yubormaslik
+            wait = self.chat_last_sent.get(chat_id, 0) + BROADCAST_CHAT_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.bucket.acquire()
+            self.chat_last_sent[chat_id] = time.monotonic()
+            try:
+                await bot.send_message(chat_id=chat_id, text=job['text'])
+                return True
+            except RetryAfter as e:
+                job['retries'] += 1
+                # Limit bot uchun umumiy - boshqa yuboruvchilar ham kutadi (acquire() pauza tugashini kutadi)
+                self.bucket.pause(e.retry_after)
+            except (Forbidden, BadRequest):
+                # Foydalanuvchi botni bloklagan yoki chat mavjud emas
+                return False
+            except NetworkError:
+                attempt += 1
+                job['retries'] += 1
+                if attempt >= BROADCAST_MAX_RETRIES:
+                    return False
+                await asyncio.sleep(min(2 ** attempt, 60) * (0.5 + secrets.randbelow(1000) / 1000))
+            except TelegramError:
+                # ChatMigrated va boshqa qayta urinib bo'lmaydigan xatolar - shu qabul qiluvchi xato
+                return False
+
+BROADCASTER = Broadcaster()
+
 # Telegram bot qismi
-def get_viloyatlar():
+class RenderCache:
+    """(chat_id, message_id) -> oxirgi ko'rsatilgan ekran (matn + tugmalar) xeshi.
+
+    Foydalanuvchi tugmani ikki marta bossa yoki o'sha ekranga qaytsa,
+    edit_message_text chaqirilmaydi.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(text, reply_markup=None, parse_mode=None):
+        markup = json.dumps(reply_markup.to_dict(), sort_keys=True) if reply_markup else ''
+        raw = f"{parse_mode}\0{text}\0{markup}".encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def is_unchanged(self, key, fp):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == fp and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def remember(self, key, fp):
+        with self.lock:
+            self.entries[key] = (fp, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+RENDER_CACHE = RenderCache(RENDER_CACHE_SIZE, RENDER_CACHE_TTL)
+
+async def edit_screen(query, text, reply_markup=None, parse_mode=None):
+    """Ekran o'zgargan bo'lsagina xabarni tahrirlaydi."""
+    message = query.message
+    key = (message.chat_id, message.message_id) if message else query.inline_message_id
+    fp = RenderCache.fingerprint(text, reply_markup, parse_mode)
+    if RENDER_CACHE.is_unchanged(key, fp):
+        return False
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    except BadRequest as e:
+        if 'message is not modified' not in str(e).lower():
+            raise
+    RENDER_CACHE.remember(key, fp)
+    return True
+
+def instrument_bot_handler(name=None):
+    """Bot handleri davomiyligi va xatolarini METRICS ga yozadi (va PROFILER ga).
+
+    name berilmasa, callback_data ning birinchi qismi (VIL, TUM, MAH, BACK) olinadi.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(update, context):
+            if name is not None:
+                label = name
+            elif update.callback_query and update.callback_query.data:
+                label = update.callback_query.data.split('|', 1)[0]
+            else:
+                label = fn.__name__
+            labels = (('handler', label),)
+            BOT_HEALTH.updated()
+            profile_state = PROFILER.begin() if PROFILER is not None else None
+            started = time.perf_counter()
+            try:
+                return await fn(update, context)
+            except Exception:
+                METRICS.inc('smartmahalla_bot_handler_errors_total', 1, labels)
+                raise
+            finally:
+                METRICS.observe('smartmahalla_bot_handler_duration_seconds', time.perf_counter() - started, labels)
+                if profile_state is not None:
+                    PROFILER.end(profile_state, 'bot', label)
+        return wrapper
+    return decorator
+
+def data_version():
+    snapshot = SNAPSHOTS.current if SNAPSHOTS is not None else None
+    return ('snapshot', snapshot.seq) if snapshot is not None else ('store', STORE.version)
+
+class KeyboardCache:
+    """Faqat ma'lumotlarga bog'liq tugmalar: bosh sahifa (viloyatlar) va viloyat -> tumanlar.
+
+    Yozuvlar ma'lumotlar versiyasiga bog'langan - saqlash, boshqa jarayon yozgan shard yoki
+    yangi snapshot keshni o'zi bo'shatadi. TUM ekrani obunachilar sonini ko'rsatgani uchun keshlanmaydi.
+    Faqat bot event loopidan chaqiriladi, shuning uchun qulf kerak emas.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        version = data_version()
+        if version != self.version:
+            self.entries = {}
+            self.version = version
+        markup = self.entries.get(key)
+        if markup is None:
+            markup = self.entries[key] = build()
+            self.misses += 1
+        else:
+            self.hits += 1
+        return markup
+
+    def refresh(self):
+        # Admin o'zgarishidan keyin bot loopida: eski tugmalar tashlanadi, bosh sahifa oldindan tuziladi
+        self.entries = {}
+        self.version = None
+        home_keyboard()
+
+KEYBOARDS = KeyboardCache()
+# Bot ishlayotgan event loop (keyboard keshi shu loopda yangilanadi)
+BOT_LOOP = None
+
+def schedule_keyboard_refresh():
+    if BOT_LOOP is not None and not BOT_LOOP.is_closed():
+        BOT_LOOP.call_soon_threadsafe(KEYBOARDS.refresh)
+
+def home_keyboard():
     DATA = load_data()
-    return list(DATA.keys())
+    return KEYBOARDS.get('HOME', lambda: InlineKeyboardMarkup(
+        [[InlineKeyboardButton(f"🏛️ {v}", callback_data=f"VIL|{v}")] for v in DATA]))
 
+@instrument_bot_handler('/start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    text = f"👋 Assalomu alaykum, {user.first_name}!\n\n🏛️ *Smart Mahalla* botiga xush kelibsiz!\n\nViloyatingizni tanlang:"
-    keyboard = []
-    for v in get_viloyatlar():
-        keyboard.append([InlineKeyboardButton(f"🏛️ {v}", callback_data=f"VIL|{v}")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+    text = (f"👋 Assalomu alaykum, {user.first_name}!\n\n🏛️ *Smart Mahalla* botiga xush kelibsiz!\n\n"
+            "Viloyatingizni tanlang yoki 📍 joylashuvingizni yuboring:")
+    reply_markup = home_keyboard()
+    message = await update.message.reply_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+    RENDER_CACHE.remember((message.chat_id, message.message_id),
+                          RenderCache.fingerprint(text, reply_markup, "Markdown"))
 
+@instrument_bot_handler()
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     DATA = load_data()
     query = update.callback_query
@@ -1268,43 +5581,50 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if parts[0] == "VIL":
         viloyat = parts[1]
-        tumans = list(DATA.get(viloyat, {}).get('tumanlar', {}).keys())
+        region = DATA.get(viloyat)
+        tumans = list(region.tumanlar) if region is not None else []
         if not tumans:
             keyboard = [[InlineKeyboardButton("🔙 Bosh sahifa", callback_data="BACK|HOME")]]
-            await query.edit_message_text(
+            await edit_screen(
+                query,
                 f"❌ *{viloyat}* uchun hozircha tumanlar mavjud emas.",
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode="Markdown"
             )
             return
         
-        keyboard = []
-        for t in tumans:
-            mahalla_count = len(DATA[viloyat]['tumanlar'][t]['mfylar'])
-            button_text = f"📍 {t} ({mahalla_count})"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"TUM|{viloyat}|{t}")])
-        
-        keyboard.append([InlineKeyboardButton("🔙 Bosh sahifa", callback_data="BACK|HOME")])
+        def tumanlar_keyboard():
+            keyboard = []
+            for t in tumans:
+                mahalla_count = len(region.tumanlar[t].mfylar)
+                button_text = f"📍 {t} ({mahalla_count})"
+                keyboard.append([InlineKeyboardButton(button_text, callback_data=f"TUM|{viloyat}|{t}")])
+            keyboard.append([InlineKeyboardButton("🔙 Bosh sahifa", callback_data="BACK|HOME")])
+            return InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
+        await edit_screen(
+            query,
             text=f"🏛️ *{viloyat}*\n\n📍 Tumanlardan birini tanlang:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=KEYBOARDS.get(('VIL', viloyat), tumanlar_keyboard),
             parse_mode="Markdown"
         )
 
     elif parts[0] == "TUM":
         if len(parts) < 3:
-            await query.edit_message_text("❌ Nimadir xato bo'ldi.")
+            await edit_screen(query, "❌ Nimadir xato bo'ldi.")
             return
         viloyat, tuman = parts[1], parts[2]
-        mahallalar = list(DATA.get(viloyat, {}).get('tumanlar', {}).get(tuman, {}).get('mfylar', {}).keys())
+        region = DATA.get(viloyat)
+        district = region.tumanlar.get(tuman) if region is not None else None
+        mahallalar = list(district.mfylar) if district is not None else []
         
         if not mahallalar:
             keyboard = [
                 [InlineKeyboardButton("🔙 Tumanlar", callback_data=f"VIL|{viloyat}")],
                 [InlineKeyboardButton("🏠 Bosh sahifa", callback_data="BACK|HOME")]
             ]
-            await query.edit_message_text(
+            await edit_screen(
+                query,
                 f"❌ *{tuman}* uchun hozircha mahallalar mavjud emas.",
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode="Markdown"
@@ -1313,14 +5633,15 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         keyboard = []
         for m in mahallalar:
-            user_count = DATA[viloyat]['tumanlar'][tuman]['mfylar'][m].get('foydalanuvchilar_soni', '0')
+            user_count = SUBSCRIBERS.count(viloyat, tuman, m)
             button_text = f"🏘️ {m} ({user_count})"
             keyboard.append([InlineKeyboardButton(button_text, callback_data=f"MAH|{viloyat}|{tuman}|{m}")])
         
         keyboard.append([InlineKeyboardButton("🔙 Viloyatlar", callback_data=f"VIL|{viloyat}")])
         keyboard.append([InlineKeyboardButton("🏠 Bosh sahifa", callback_data="BACK|HOME")])
         
-        await query.edit_message_text(
+        await edit_screen(
+            query,
             text=f"📍 *{viloyat} - {tuman}*\n\n🏘️ Mahallalardan birini tanlang:",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown"
@@ -1328,28 +5649,29 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif parts[0] == "MAH":
         if len(parts) < 4:
-            await query.edit_message_text("❌ Nimadir xato bo'ldi.")
+            await edit_screen(query, "❌ Nimadir xato bo'ldi.")
             return
         viloyat, tuman, mahalla = parts[1], parts[2], parts[3]
-        info = DATA.get(viloyat, {}).get('tumanlar', {}).get(tuman, {}).get('mfylar', {}).get(mahalla)
+        info = find_mfy(DATA, viloyat, tuman, mahalla)
         
-        if not info:
-            await query.edit_message_text(f"❌ {mahalla} uchun ma'lumot topilmadi.")
+        if info is None:
+            await edit_screen(query, f"❌ {mahalla} uchun ma'lumot topilmadi.")
             return
 
+        SUBSCRIBERS.add(viloyat, tuman, mahalla, query.from_user.id)
+
         out = f"📍 *{viloyat} - {tuman}*\n"
         out += f"🏘️ *{mahalla}*\n\n"
         
-        xodimlar = info.get('xodimlar', {})
-        for lavozim, malumot in xodimlar.items():
-            if malumot.get('ism'):
+        for lavozim, malumot in info.lavozimlar().items():
+            if malumot.ism:
                 lavozim_nomi = lavozim.replace('_', ' ').title()
                 out += f"*{lavozim_nomi}:*\n"
-                out += f"👤 {malumot['ism']}\n"
-                if malumot.get('telefon'):
-                    out += f"📞 {malumot['telefon']}\n"
-                if malumot.get('email'):
-                    out += f"📧 {malumot['email']}\n"
+                out += f"👤 {malumot.ism}\n"
+                if malumot.telefon:
+                    out += f"📞 {malumot.telefon}\n"
+                if malumot.email:
+                    out += f"📧 {malumot.email}\n"
                 out += "\n"
 
         out += f"\n🕐 {datetime.now().strftime('%H:%M')}"
@@ -1359,20 +5681,19 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("🔙 Tumanlar", callback_data=f"VIL|{viloyat}")],
             [InlineKeyboardButton("🏠 Bosh sahifa", callback_data="BACK|HOME")]
         ]
-        await query.edit_message_text(out, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(keyboard))
+        await edit_screen(query, out, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(keyboard))
 
     elif parts[0] == "BACK":
         if parts[1] == "HOME":
-            keyboard = []
-            for v in get_viloyatlar():
-                keyboard.append([InlineKeyboardButton(f"🏛️ {v}", callback_data=f"VIL|{v}")])
-            await query.edit_message_text(
+            await edit_screen(
+                query,
                 "👋 *Smart Mahalla* botiga xush kelibsiz!\n\n🏛️ Viloyatingizni tanlang:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                reply_markup=home_keyboard(),
                 parse_mode="Markdown"
             )
 @app.route('/admin/toggle_mahalla_status', methods=['POST'])
 @login_required
+@region_write()
 def toggle_mahalla_status():
     try:
         DATA = load_data()
@@ -1385,24 +5706,33 @@ def toggle_mahalla_status():
             return jsonify({'success': False, 'message': 'Barcha maydonlar to\'ldirilmagan'})
             
         if (viloyat_nomi not in DATA or 
-            tuman_nomi not in DATA[viloyat_nomi]['tumanlar'] or 
-            mahalla_nomi not in DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar']):
+            tuman_nomi not in DATA[viloyat_nomi].tumanlar or 
+            mahalla_nomi not in DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar):
             return jsonify({'success': False, 'message': 'MFY topilmadi'})
         
-        DATA[viloyat_nomi]['tumanlar'][tuman_nomi]['mfylar'][mahalla_nomi]['holat'] = new_status
-        success = save_data(DATA)
+        mfy = DATA[viloyat_nomi].tumanlar[tuman_nomi].mfylar[mahalla_nomi]
+        ziddiyat = _versiya_ziddiyati(mfy)
+        if ziddiyat is not None:
+            return ziddiyat
+        
+        mfy.holat = holat_kodi(new_status)
+        mfy.versiya += 1
+        success = save_data(DATA, viloyat_nomi)
         
         if success:
+            data_changed(viloyat_nomi, DATA[viloyat_nomi], tuman_nomi, mahalla_nomi)
+            record_changes(change_event('upsert', (viloyat_nomi, tuman_nomi, mahalla_nomi), mfy))
             status_text = "faollashtirildi" if new_status == 'faol' else "nofaollashtirildi"
             add_activity("MFY holati o'zgartirildi", 
                         f"{viloyat_nomi}, {tuman_nomi}, {mahalla_nomi} MFYsi {status_text}", 
                         session.get('username'))
-            return jsonify({'success': True, 'message': f'MFY {status_text}!'})
+            return jsonify({'success': True, 'message': f'MFY {status_text}!', 'versiya': mfy.versiya})
         else:
             return jsonify({'success': False, 'message': 'Saqlashda xato'})
             
     except Exception as e:
         return jsonify({'success': False, 'message': f'Xato: {e}'})
+@instrument_bot_handler('/help')
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = """
 🤖 *Smart Mahalla Bot*
@@ -1418,9 +5748,71 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Foydalanuvchilar soni
 
 📍 *Ishlatish:* Viloyat -> Tuman -> Mahalla tanlang
+yoki joylashuvingizni yuboring - eng yaqin mahallalar ko'rsatiladi
+📞 Telefon raqamini yuborsangiz - u qaysi mahalla xodimiga tegishli ekani
     """
     await update.message.reply_text(help_text, parse_mode="Markdown")
 
+def _masofa_matni(km):
+    return f"{km * 1000:.0f} m" if km < 1 else f"{km:.1f} km"
+
+@instrument_bot_handler('location')
+async def location_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Yuborilgan joylashuvga eng yaqin MFYlar (MFY_LOCATIONS indeksi bo'yicha)."""
+    DATA = load_data()
+    location = update.message.location
+    nearest = MFY_LOCATIONS.nearest(DATA, location.latitude, location.longitude)
+    if not nearest:
+        await update.message.reply_text(
+            f"❌ {NEAREST_MAX_KM:.0f} km atrofida joylashuvi kiritilgan mahalla topilmadi.\n\n🏛️ Viloyatingizni tanlang:",
+            reply_markup=home_keyboard())
+        return
+
+    out = "📍 *Sizga eng yaqin mahallalar:*\n\n"
+    keyboard = []
+    for km, viloyat, tuman, mahalla in nearest:
+        out += f"🏘️ *{mahalla}* - {_masofa_matni(km)}\n"
+        out += f"📍 {viloyat}, {tuman}\n"
+        info = find_mfy(DATA, viloyat, tuman, mahalla)
+        rais = info.xodimlar['mfy_raisi'] if info is not None else BOSH_XODIM
+        if rais.ism:
+            out += f"👤 MFY raisi: {rais.ism}\n"
+            if rais.telefon:
+                out += f"📞 {rais.telefon}\n"
+        out += "\n"
+        keyboard.append([InlineKeyboardButton(f"🏘️ {mahalla}", callback_data=f"MAH|{viloyat}|{tuman}|{mahalla}")])
+    keyboard.append([InlineKeyboardButton("🏠 Bosh sahifa", callback_data="BACK|HOME")])
+    await update.message.reply_text(out, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+
+TELEFON_MATNI = re.compile(r'^\+?[\d\s()\-]{7,20}$')
+
+@instrument_bot_handler('telefon')
+async def phone_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Telefon raqami (matn yoki ulashilgan kontakt) - qaysi MFY xodimiga tegishli ekani (PHONES indeksi)."""
+    message = update.message
+    telefon = message.contact.phone_number if message.contact else (message.text or '').strip()
+    if message.contact is None and not TELEFON_MATNI.match(telefon):
+        await message.reply_text("ℹ️ Qo'ng'iroq qilgan xodimni tekshirish uchun telefon raqamini yuboring "
+                                 "(masalan: +998 90 123 45 67), eng yaqin mahalla uchun - 📍 joylashuvingizni.")
+        return
+    DATA = load_data()
+    found = PHONES.lookup(DATA, telefon)
+    if not found:
+        await message.reply_text(f"❌ {telefon} raqami mahalla xodimlari orasida topilmadi.\n\n"
+                                 "⚠️ Oʻzini mahalla xodimi deb tanishtirgan notanish qoʻngʻiroqlardan ehtiyot boʻling.")
+        return
+
+    out = f"✅ *{telefon}* - mahalla xodimi:\n\n"
+    keyboard = []
+    for viloyat, tuman, mahalla, lavozim, xodim in found:
+        out += f"👤 *{xodim.ism}*"
+        out += " (nofaol)\n" if xodim.holat is Holat.NOFAOL else "\n"
+        out += f"💼 {lavozim.replace('_', ' ').title()}\n"
+        out += f"🏘️ {mahalla}\n📍 {viloyat}, {tuman}\n\n"
+        keyboard.append([InlineKeyboardButton(f"🏘️ {mahalla}", callback_data=f"MAH|{viloyat}|{tuman}|{mahalla}")])
+    await message.reply_text(out, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+
+@instrument_bot_handler('/stats')
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     DATA = load_data()
     stats = calculate_stats(DATA)
@@ -1432,54 +5824,1027 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📍 *Tumanlar:* {stats['total_districts']} ta
 🏘️ *Mahallalar:* {stats['total_neighborhoods']} ta
 👨‍💼 *Xodimlar:* {stats['total_staff']} ta
+👥 *Foydalanuvchilar:* {stats['total_users']} ta
 
 🔄 *Soʻngi yangilanish:* {datetime.now().strftime("%d.%m.%Y %H:%M")}
     """
     await update.message.reply_text(stats_text, parse_mode="Markdown")
 
+class BotHealth:
+    """Shu jarayondagi bot holati: oxirgi getUpdates javobi va update, event loop kechikishi, qayta ishga tushishlar.
+
+    Holat HEALTH_DIR/<nom>.json ga yoziladi - /healthz va /readyz uni istalgan jarayondan o'qiydi.
+    Holatlar: starting -> polling -> (yiqilsa) restarting -> starting ...
+    """
+    # Event loop shu oraliqda "uyg'otiladi"; kech uyg'onish - loopni bloklagan kod
+    PROBE_INTERVAL = 0.5
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.name = None
+        self.state = 'stopped'
+        self.started_at = None
+        self.checked_at = None
+        self.last_poll = None
+        self.last_update = None
+        self.loop_lag = 0.0
+        self.restarts = 0
+        self.last_error = None
+        self.retry_at = None
+        # watch() pollingni to'xtatgan sabab
+        self.stop_reason = None
+
+    def begin(self, name):
+        self.name = name
+        self.state = 'starting'
+        self.started_at = self.checked_at = time.time()
+        self.last_poll = None
+        self.retry_at = None
+        self.stop_reason = None
+        self.write()
+
+    def running(self):
+        self.state = 'polling'
+        self.checked_at = time.time()
+        self.write()
+
+    def polled(self):
+        self.last_poll = time.time()
+
+    def updated(self):
+        self.last_update = time.time()
+
+    def crashed(self, error, backoff):
+        self.state = 'restarting'
+        self.restarts += 1
+        self.last_error = {'error': error, 'time': time.time()}
+        self.retry_at = time.time() + backoff
+        self.write()
+
+    def poll_age(self, now=None):
+        polled = self.last_poll or self.started_at
+        return (now or time.time()) - polled if polled else None
+
+    async def watch(self, application=None):
+        """Loop kechikishini o'lchaydi va holatni HEALTH_INTERVAL da yozadi.
+
+        application berilsa (run_polling), getUpdates BOT_POLL_STALE dan ko'p javob bermasa polling
+        to'xtatiladi - run_bot uni qayta ishga tushiradi.
+        """
+        loop = asyncio.get_running_loop()
+        lag = 0.0
+        written = loop.time()
+        while True:
+            expected = loop.time() + self.PROBE_INTERVAL
+            await asyncio.sleep(self.PROBE_INTERVAL)
+            now = loop.time()
+            lag = max(lag, now - expected)
+            if now - written < HEALTH_INTERVAL:
+                continue
+            self.loop_lag, lag, written = lag, 0.0, now
+            self.checked_at = time.time()
+            self.write()
+            age = self.poll_age()
+            if application is not None and age is not None and age > BOT_POLL_STALE:
+                self.stop_reason = f"getUpdates {age:.0f} s javob bermadi"
+                application.stop_running()
+                return
+
+    def snapshot(self):
+        return {'name': self.name, 'pid': os.getpid(), 'state': self.state, 'started_at': self.started_at,
+                'checked_at': self.checked_at, 'last_poll': self.last_poll, 'last_update': self.last_update,
+                'loop_lag': round(self.loop_lag, 4), 'restarts': self.restarts, 'last_error': self.last_error,
+                'retry_at': self.retry_at}
+
+    def write(self):
+        if self.name is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_json(os.path.join(self.directory, f"{self.name}.json"), self.snapshot(), pretty=False)
+        except OSError as e:
+            print(f"⚠️ Bot holatini yozib bo'lmadi: {e}")
+
+BOT_HEALTH = BotHealth(HEALTH_DIR)
+
+def read_bot_health():
+    """HEALTH_DIR dagi barcha botlar holati (boshqa jarayonlarniki ham)."""
+    try:
+        names = sorted(os.listdir(HEALTH_DIR))
+    except FileNotFoundError:
+        return []
+    entries = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            entries.append(read_json(os.path.join(HEALTH_DIR, name)))
+        except (OSError, ValueError):
+            # Boshqa jarayon ayni paytda yozayotgan bo'lishi mumkin - keyingi so'rovda o'qiladi
+            continue
+    return entries
+
+def clear_bot_health():
+    """Oldingi ishga tushirishdan qolgan holat fayllari (endi yo'q botlar) /readyz ni yiqitmasin."""
+    try:
+        names = os.listdir(HEALTH_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith('.json'):
+            try:
+                os.remove(os.path.join(HEALTH_DIR, name))
+            except OSError:
+                pass
+
 # Botni ishga tushirish
-def run_bot():
-    BOT_TOKEN = os.environ.get('BOT_TOKEN', "7953323094:AAE81rkkc8oAb5tp8W2dTCLJy55NRxlm_rs")
+BOT_APP = None
+# RUN_MODE=all: botni poll qilayotgan thread (/healthz tekshiradi)
+BOT_THREAD = None
+
+def _polling_request():
+    """getUpdates uchun HTTPXRequest: har bir javob BOT_HEALTH.last_poll ni yangilaydi (polling tirikligi)."""
+    class PollingRequest(HTTPXRequest):
+        async def do_request(self, *args, **kwargs):
+            result = await super().do_request(*args, **kwargs)
+            BOT_HEALTH.polled()
+            return result
+
+    return PollingRequest(connection_pool_size=1)
+
+async def _bot_started(app_bot):
+    # run_polling: initialize() dan keyin, polling boshlanishidan oldin
+    app_bot.bot_data['health_task'] = asyncio.get_running_loop().create_task(BOT_HEALTH.watch(app_bot))
+    BOT_HEALTH.running()
+
+async def _bot_stopped(app_bot):
+    task = app_bot.bot_data.pop('health_task', None)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def build_bot_application(token=None):
+    global BOT_APP
+    app_bot = (ApplicationBuilder().token(token or BOT_TOKEN).base_url(TELEGRAM_API_URL)
+               .get_updates_request(_polling_request())
+               .post_init(_bot_started).post_shutdown(_bot_stopped).build())
+    app_bot.add_handler(CommandHandler("start", start))
+    app_bot.add_handler(CommandHandler("help", help_command))
+    app_bot.add_handler(CommandHandler("stats", stats_command))
+    app_bot.add_handler(CallbackQueryHandler(button_handler))
+    app_bot.add_handler(MessageHandler(filters.LOCATION, location_handler))
+    app_bot.add_handler(MessageHandler(filters.CONTACT | (filters.TEXT & ~filters.COMMAND), phone_handler))
+    BOT_APP = app_bot
+    return app_bot
+
+def poll_bot(token=None):
+    global BOT_LOOP
+    # Yangi event loop yaratish (run_polling oxirida uni yopadi)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    
+    app_bot = build_bot_application(token)
+    BOT_LOOP = loop
+
+    print("🤖 Smart Mahallah Bot ishga tushdi...")
     
+    # Botni ishga tushirish
+    # Bot alohida threadda ishlaydi - signal handlerlarni faqat asosiy thread o'rnatadi
+    app_bot.run_polling(stop_signals=None)
+
+def run_bot(token=None, name='bot'):
+    """Botni ishlatadi; yiqilsa (yoki polling osilib qolsa) Supervisor kabi ikki barobar oshib
+    boruvchi kutish bilan qayta ishga tushiradi - thread jim o'lib qolmaydi."""
+    backoff = 1
+    while True:
+        BOT_HEALTH.begin(name)
+        started = time.monotonic()
+        try:
+            poll_bot(token)
+            error = BOT_HEALTH.stop_reason or "polling to'xtadi"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if time.monotonic() - started >= Supervisor.STABLE_AFTER:
+            backoff = 1
+        METRICS.inc('smartmahalla_bot_restarts_total')
+        BOT_HEALTH.crashed(error, backoff)
+        print(f"❌ Bot xatosi: {error}, {backoff} soniyadan keyin qayta ishga tushiriladi")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, Supervisor.MAX_BACKOFF)
+
+# Bitta event loop rejimi (RUN_MODE=async): admin panel ham bot Application loopida ishlaydi.
+# Flask ilovasi ASGI orqali loop threadining o'zida bajariladi - thread almashuvi yo'q,
+# ma'lumotlarga faqat bitta thread tegadi (POST so'rovlar uchun fayl qulfi ham shart emas).
+# View uzoq ishlasa bot ham kutadi: og'ir eksportlar uchun bu rejim mos emas.
+class WSGIToASGI:
+    """WSGI ilovani ASGI (HTTP) interfeysiga moslaydi; ilova event loop threadida chaqiriladi."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        response = []
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+            return chunks.append
+
+        result = self.wsgi_app(self._environ(scope, bytes(body)), start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        status, headers = response
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'REMOTE_ADDR': str(client[0]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'content-length':
+                key = 'HTTP_' + name.upper().replace('-', '_')
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+class AsyncHTTPServer:
+    """asyncio + h11 asosidagi kichik HTTP/1.1 server (keep-alive bilan) - ASGI ilovani chaqiradi.
+
+    h11 httpx bilan birga keladi (python-telegram-bot uni talab qiladi), qo'shimcha paket kerak emas.
+    Tana ilovaga berilishidan oldin xotirada yig'iladi, shuning uchun u o'qilishidan oldin tekshiriladi:
+    allow(scope) rad etgan so'rovga 404, max_body dan katta tanaga (Content-Length yoki yig'ilgani) 413
+    javobi beriladi va ulanish yopiladi.
+    """
+
+    def __init__(self, asgi_app, keepalive, timeout, max_body=WEB_MAX_BODY, allow=None):
+        import h11
+        self.h11 = h11
+        self.asgi_app = asgi_app
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.max_body = max_body
+        self.allow = allow
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._connection, host, port)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _connection(self, reader, writer):
+        h11 = self.h11
+        conn = h11.Connection(h11.SERVER)
+        try:
+            while True:
+                event = conn.next_event()
+                if event is h11.NEED_DATA:
+                    # So'rovlar orasida - keep-alive, so'rov o'rtasida - umumiy timeout
+                    wait = self.keepalive if conn.their_state is h11.IDLE else self.timeout
+                    try:
+                        data = await asyncio.wait_for(reader.read(65536), wait)
+                    except asyncio.TimeoutError:
+                        break
+                    conn.receive_data(data)
+                    continue
+                if isinstance(event, h11.Request):
+                    await self._request(conn, event, reader, writer)
+                    if conn.our_state is not h11.DONE or conn.their_state is not h11.DONE:
+                        break
+                    conn.start_next_cycle()
+                    continue
+                break
+        except (h11.RemoteProtocolError, ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def _reject(self, conn, writer, status, text):
+        # Tana o'qilmagan - javobdan keyin ulanish yopiladi (_connection holatlarni tekshiradi)
+        body = text.encode('utf-8')
+        writer.write(conn.send(self.h11.Response(status_code=status, headers=[
+            ('content-type', 'text/plain; charset=utf-8'), ('content-length', str(len(body))),
+            ('connection', 'close')])))
+        writer.write(conn.send(self.h11.Data(data=body)))
+        writer.write(conn.send(self.h11.EndOfMessage()))
+        await writer.drain()
+
+    async def _request(self, conn, request, reader, writer):
+        h11 = self.h11
+        scope = self._scope(request, writer)
+        if self.allow is not None and not self.allow(scope):
+            return await self._reject(conn, writer, 404, 'Not Found')
+        length = dict(scope['headers']).get(b'content-length', b'0')
+        if not length.isdigit() or int(length) > self.max_body:
+            return await self._reject(conn, writer, 413, 'Payload Too Large')
+        body = bytearray()
+        while True:
+            event = conn.next_event()
+            if event is h11.NEED_DATA:
+                conn.receive_data(await asyncio.wait_for(reader.read(65536), self.timeout))
+            elif isinstance(event, h11.Data):
+                body += event.data
+                # Transfer-Encoding: chunked - uzunlik oldindan ma'lum emas
+                if len(body) > self.max_body:
+                    return await self._reject(conn, writer, 413, 'Payload Too Large')
+            else:
+                break
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                return {'type': 'http.disconnect'}
+            received = True
+            return {'type': 'http.request', 'body': bytes(body), 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                writer.write(conn.send(h11.Response(status_code=message['status'],
+                                                   headers=message.get('headers', []))))
+            elif message['type'] == 'http.response.body':
+                if message.get('body'):
+                    writer.write(conn.send(h11.Data(data=message['body'])))
+                if not message.get('more_body'):
+                    writer.write(conn.send(h11.EndOfMessage()))
+                await writer.drain()
+
+        try:
+            await self.asgi_app(scope, receive, send)
+        except Exception as e:
+            print(f"❌ HTTP so'rov xatosi: {e}")
+            if conn.our_state is h11.SEND_RESPONSE:
+                writer.write(conn.send(h11.Response(status_code=500, headers=[('content-length', '0')])))
+                writer.write(conn.send(h11.EndOfMessage()))
+                await writer.drain()
+
+    @staticmethod
+    def _scope(request, writer):
+        target = request.target.decode('latin-1')
+        path, _, query = target.partition('?')
+        sockname = writer.get_extra_info('sockname') or ('', 0)
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': request.http_version.decode('ascii'),
+            'method': request.method.decode('ascii'),
+            'scheme': 'http',
+            'path': urllib.parse.unquote(path),
+            'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': [(name.lower(), value) for name, value in request.headers],
+            'client': writer.get_extra_info('peername'),
+            'server': sockname[:2],
+        }
+
+# Jonli yangilanishlar (SSE). Bitta nashriyotchi: hodisa bir marta kodlanadi va har bir ulanishning
+# navbatiga qo'yiladi; ulanish - event loopdagi korutina, thread emas.
+LIVE_PATH = '/admin/events'
+
+def _session_from_cookie(header):
+    """Flask sessiyasi Cookie sarlavhasidan (so'rov kontekstisiz) - SSE serveri uchun."""
+    value = parse_cookie(header or '').get(app.config['SESSION_COOKIE_NAME'])
+    serializer = app.session_interface.get_signing_serializer(app)
+    if not value or serializer is None:
+        return {}
     try:
-        # Yangi event loop yaratish
+        return serializer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+class LiveFeed:
+    """Dashboardlar uchun SSE: 'stats' (o'zgargan sonlar) va 'activity' (yangi faoliyat) hodisalari.
+
+    publish() istalgan threaddan chaqiriladi, tarqatish esa bitta event loopda bo'ladi. Hodisalar
+    raqamlanadi (id:); qayta ulangan brauzer Last-Event-ID bo'yicha o'tkazib yuborganlarini tarixdan
+    oladi, tarix yetmasa - to'liq statistika. gunicorn workerlari hodisalarni master jarayonga uzatadi.
+    """
+
+    def __init__(self, history=100, queue_size=256):
+        self.history = deque(maxlen=history)
+        self.queue_size = queue_size
+        self.clients = set()
+        self.seq = 0
+        self.stats = None
+        self.loop = None
+        self.thread = None
+        self.task = None
+        self.pending = None
+        # None - asosiy server bilan bir manzilda (RUN_MODE=async)
+        self.port = None
+        # Web workerda: hodisalar master jarayonga uzatiladi
+        self.forward = None
+        self.events = 0
+        self.dropped = 0
+
+    def publish(self, kind, payload=None):
+        if self.forward is not None:
+            self.forward(kind, payload)
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(self._publish, kind, payload)
+
+    def activity(self, entry):
+        self.publish('activity', entry)
+
+    def stats_changed(self):
+        self.publish('stats')
+
+    def url(self):
+        """Dashboard sahifasi ulanadigan manzil (None - jonli yangilanishlar o'chirilgan)."""
+        if self.loop is None and self.forward is None:
+            return None
+        if self.port is None:
+            return LIVE_PATH
+        host = urllib.parse.urlsplit('//' + request.host).hostname or 'localhost'
+        if ':' in host:
+            host = f'[{host}]'
+        return f"{request.scheme}://{host}:{self.port}{LIVE_PATH}"
+
+    # --- Event loop ichida ---
+
+    def _publish(self, kind, payload):
+        if kind != 'stats':
+            self._emit(kind, payload)
+        # Faoliyat - ma'lumotlar o'zgargani; sonlar qisqa kutishdan keyin bir marta hisoblanadi
+        if self.clients and self.pending is None:
+            self.pending = self.loop.call_later(LIVE_DEBOUNCE, self._refresh_stats)
+
+    def _emit(self, kind, payload):
+        self.seq += 1
+        message = b'id: %d\nevent: %s\ndata: %s\n\n' % (self.seq, kind.encode('ascii'), JSON_CODEC.dumps(payload))
+        self.history.append((self.seq, message))
+        self.events += 1
+        for queue in list(self.clients):
+            self._put(queue, message)
+
+    def _put(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # O'qimayotgan ulanish uziladi - brauzer qayta ulanib, tarixdan davom etadi
+            self.clients.discard(queue)
+            self.dropped += 1
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def _current_stats(self):
+        stats = calculate_stats(load_data())
+        stats['active_admins'] = sum(1 for admin in load_admins().values() if admin.get('is_active', False))
+        return stats
+
+    def _refresh_stats(self):
+        self.pending = None
+        try:
+            current = self._current_stats()
+        except Exception as e:
+            print(f"❌ Jonli statistika xatosi: {e}")
+            return
+        previous, self.stats = self.stats, current
+        delta = {key: value for key, value in current.items() if previous is None or previous.get(key) != value}
+        if delta and previous is not None:
+            self._emit('stats', delta)
+
+    def _backlog(self, last_id):
+        """Last-Event-ID dan keyingi hodisalar; None - tarix yetmaydi (yoki jarayon qayta ishga tushgan)."""
+        try:
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            return None
+        if last_id > self.seq or (self.history and self.history[0][0] > last_id + 1):
+            return None
+        return [message for seq, message in self.history if seq > last_id]
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(LIVE_HEARTBEAT)
+            if self.clients:
+                # Izoh qatori proksilarni ulanishni yopishdan saqlaydi, uzilgan ulanishlar yozishda aniqlanadi;
+                # obunachilar soni va tashqi o'zgarishlar ham shu yerda tekshiriladi
+                for queue in list(self.clients):
+                    self._put(queue, b': ping\n\n')
+                self._publish('stats', None)
+
+    @staticmethod
+    async def _reply(send, status, text):
+        body = text.encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                                (b'content-length', str(len(body)).encode('ascii'))]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        if scope['path'] != LIVE_PATH or scope['method'] != 'GET':
+            return await self._reply(send, 404, 'Not Found')
+        headers = dict(scope['headers'])
+        if not _session_from_cookie(headers.get(b'cookie', b'').decode('latin-1')).get('logged_in'):
+            return await self._reply(send, 401, 'Unauthorized')
+        response_headers = [(b'content-type', b'text/event-stream; charset=utf-8'),
+                            (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+        origin = headers.get(b'origin')
+        host = headers.get(b'host', b'').decode('latin-1')
+        if origin and urllib.parse.urlsplit(origin.decode('latin-1')).hostname == urllib.parse.urlsplit('//' + host).hostname:
+            # Alohida portdagi server: admin panel sahifasidan (boshqa port) cookie bilan ulanishga ruxsat
+            response_headers += [(b'access-control-allow-origin', origin),
+                                 (b'access-control-allow-credentials', b'true'), (b'vary', b'origin')]
+        queue = asyncio.Queue(self.queue_size)
+        backlog = self._backlog(headers.get(b'last-event-id', b'').decode('latin-1'))
+        if backlog is None:
+            # Mavjud tinglovchilar farqni oladi, yangisi - to'liq sonlarni
+            self._refresh_stats()
+            backlog = [b'id: %d\nevent: stats\ndata: %s\n\n' % (self.seq, JSON_CODEC.dumps(self.stats or {}))]
+        self.clients.add(queue)
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers})
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n' + b''.join(backlog), 'more_body': True})
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(queue)
+
+    def mount(self, asgi_app):
+        """RUN_MODE=async: LIVE_PATH shu yerda, qolgan so'rovlar - admin panelga."""
+        async def router(scope, receive, send):
+            if scope['type'] == 'http' and scope['path'] == LIVE_PATH:
+                return await self(scope, receive, send)
+            return await asgi_app(scope, receive, send)
+        return router
+
+    def start(self, port):
+        """Alohida threadda (RUN_MODE=all/admin): barcha SSE ulanishlari shu bitta event loopda."""
+        if self.thread is not None or self.loop is not None:
+            return
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._thread_main, args=(port, ready), daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def start_in_loop(self):
+        """Joriy event loopda (RUN_MODE=async) - ulanishlarni asosiy HTTP server qabul qiladi."""
+        if self.thread is None and self.loop is None:
+            self._attach(asyncio.get_running_loop())
+
+    def _thread_main(self, port, ready):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        
-        app_bot = ApplicationBuilder().token(BOT_TOKEN).build()
-        app_bot.add_handler(CommandHandler("start", start))
-        app_bot.add_handler(CommandHandler("help", help_command))
-        app_bot.add_handler(CommandHandler("stats", stats_command))
-        app_bot.add_handler(CallbackQueryHandler(button_handler))
+        # Bu portda faqat GET LIVE_PATH: boshqa so'rovlar va har qanday tana o'qilmasdan rad etiladi
+        server = AsyncHTTPServer(self, WEB_KEEPALIVE, WEB_TIMEOUT, max_body=0,
+                                 allow=lambda scope: scope['method'] == 'GET' and scope['path'] == LIVE_PATH)
+        try:
+            loop.run_until_complete(server.start('0.0.0.0', port))
+        except OSError as e:
+            print(f"❌ Jonli yangilanishlar serveri ishga tushmadi (port {port}): {e}")
+            ready.set()
+            return
+        self.port = port
+        self._attach(loop)
+        ready.set()
+        loop.run_forever()
 
-        print("🤖 Smart Mahallah Bot ishga tushdi...")
-        
-        # Botni ishga tushirish
-        app_bot.run_polling()
-    except Exception as e:
-        print(f"❌ Bot xatosi: {e}")
+    def _attach(self, loop):
+        self.loop = loop
+        self.task = loop.create_task(self._heartbeat())
+
+LIVE = LiveFeed()
+
+async def serve_single_loop(port):
+    global BOT_LOOP
+    loop = asyncio.get_running_loop()
+    BOT_LOOP = loop
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C KeyboardInterrupt bo'lib keladi
+            pass
+    app_bot = build_bot_application()
+    asgi_app = CHANGES.mount(WSGIToASGI(app))
+    if LIVE_EVENTS:
+        asgi_app = LIVE.mount(asgi_app)
+    server = AsyncHTTPServer(asgi_app, WEB_KEEPALIVE, WEB_TIMEOUT)
+    BOT_HEALTH.begin('bot')
+    async with app_bot:
+        await app_bot.updater.start_polling()
+        await app_bot.start()
+        # Bitta loop: polling osilsa ham jarayon qayta ishga tushirilmaydi - holat faqat /healthz da ko'rinadi
+        health = loop.create_task(BOT_HEALTH.watch())
+        BOT_HEALTH.running()
+        BROADCASTER.start_in_loop()
+        if LIVE_EVENTS:
+            LIVE.start_in_loop()
+        await server.start('0.0.0.0', port)
+        STARTUP.mark('bot va server')
+        STARTUP.report()
+        print(f"🔁 Bitta event loop: bot va admin panel http://localhost:{port}/admin")
+        await stop.wait()
+        print("🛑 To'xtatilmoqda...")
+        await server.stop()
+        health.cancel()
+        await app_bot.updater.stop()
+        await app_bot.stop()
+
+# Supervisor rejimi: admin panel va har bir bot tokeni alohida jarayon.
+# Bir jarayon yiqilsa boshqalari ishlashda davom etadi, yiqilgani esa kutish vaqti
+# ikki barobar oshib boruvchi qayta urinishlar bilan qayta ishga tushiriladi.
+class Supervisor:
+    MAX_BACKOFF = 30
+    # Shuncha ishlagan jarayon yiqilsa, kutish vaqti boshidan hisoblanadi
+    STABLE_AFTER = 60
+
+    def __init__(self, children):
+        # children: [(nom, qo'shimcha env)]
+        self.children = [{'name': name, 'env': env, 'process': None, 'started': 0.0,
+                          'restart_at': 0.0, 'backoff': 1, 'reloading': False} for name, env in children]
+        self.stopping = False
+
+    def _spawn(self, child):
+        env = dict(os.environ, PYTHONUNBUFFERED='1', **child['env'])
+        child['process'] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+        child['started'] = time.monotonic()
+        print(f"▶️ {child['name']} ishga tushdi (pid {child['process'].pid})")
+
+    def _stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def _reload(self, signum=None, frame=None):
+        # gunicorn workerlarni navbat bilan almashtiradi (SIGHUP), admin va bot jarayonlarida SIGHUP
+        # ishlovchisi yo'q - ular to'xtatilib, kutishsiz qayta ishga tushiriladi (yiqilish hisoblanmaydi)
+        for child in self.children:
+            if child['process'] is None:
+                continue
+            if child['env'].get('RUN_MODE') == 'web':
+                child['process'].send_signal(signal.SIGHUP)
+            else:
+                child['reloading'] = True
+                child['process'].terminate()
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._reload)
+        for child in self.children:
+            self._spawn(child)
+        while not self.stopping:
+            time.sleep(0.5)
+            now = time.monotonic()
+            for child in self.children:
+                process = child['process']
+                if process is None:
+                    if now >= child['restart_at']:
+                        self._spawn(child)
+                    continue
+                code = process.poll()
+                if code is None:
+                    continue
+                if child['reloading']:
+                    child['reloading'] = False
+                    child['process'] = None
+                    child['restart_at'] = now
+                    print(f"🔄 {child['name']} qayta yuklanmoqda")
+                    continue
+                if now - child['started'] >= self.STABLE_AFTER:
+                    child['backoff'] = 1
+                print(f"⚠️ {child['name']} to'xtadi (kod {code}), {child['backoff']} soniyadan keyin qayta ishga tushiriladi")
+                child['process'] = None
+                child['restart_at'] = now + child['backoff']
+                child['backoff'] = min(child['backoff'] * 2, self.MAX_BACKOFF)
+        print("🛑 Jarayonlar to'xtatilmoqda...")
+        for child in self.children:
+            if child['process'] is not None:
+                child['process'].terminate()
+        for child in self.children:
+            if child['process'] is not None:
+                try:
+                    child['process'].wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    child['process'].kill()
+
+def run_supervisor():
+    children = [('admin', {'RUN_MODE': 'admin', 'BOT_WORKERS': str(len(BOT_TOKENS))})]
+    for i, token in enumerate(BOT_TOKENS):
+        children.append((f'bot-{i}', {'RUN_MODE': 'bot', 'BOT_WORKER': str(i), 'BOT_TOKEN': token}))
+    print(f"🧭 Supervisor: admin panel + {len(BOT_TOKENS)} ta bot jarayoni")
+    clear_bot_health()
+    Supervisor(children).run()
+
+def run_bot_worker():
+    global SNAPSHOTS
+    SNAPSHOTS = SnapshotReader(SNAPSHOT_DIR, SNAPSHOT_POLL_INTERVAL)
+    bus = LocalBus(IPC_PORT + 1 + BOT_WORKER)
+    bus.on('snapshot', SNAPSHOTS.notify)
+    bus.start()
+    # subscribers.json ning yagona yozuvchisi - admin jarayoni
+    SUBSCRIBERS.forward = lambda v, t, m, user_id: bus.send(
+        IPC_PORT, {'type': 'subscribe', 'path': [v, t, m], 'user_id': user_id})
+    print(f"🤖 Bot jarayoni #{BOT_WORKER} (snapshotlar: {SNAPSHOT_DIR})")
+    start_file_watcher()
+    STARTUP.mark('snapshot')
+    STARTUP.report()
+    run_bot(BOT_TOKEN, f'bot-{BOT_WORKER}')
+
+def _warm_store():
+    """Shardlarni oldindan yuklaydi; STARTUP logi uchun qisqa izoh qaytaradi."""
+    loaded = STORE.warm()
+    binary = STORE.binary
+    if binary is None:
+        return f"{loaded} shard"
+    return f"{loaded} shard, binar nusxadan {binary.hits}, JSON dan {binary.misses}"
+
+def start_snapshot_publisher():
+    global PUBLISHER
+    workers = int(os.environ.get('BOT_WORKERS', len(BOT_TOKENS)))
+    bus = start_master_bus()
+    PUBLISHER = SnapshotPublisher(STORE, SNAPSHOT_DIR, SNAPSHOT_KEEP, bus,
+                                  [IPC_PORT + 1 + i for i in range(workers)])
+    seq = PUBLISHER.publish()
+    print(f"📸 Snapshot #{seq} yozildi, {workers} ta bot jarayoniga xabar beriladi")
+
+class RemotePublisher:
+    """Web worker: snapshot yozishni master jarayondagi SnapshotPublisher ga so'raydi."""
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def request(self):
+        self.bus.send(IPC_PORT, {'type': 'publish'})
+
+MASTER_BUS = None
+METRICS.collect('smartmahalla_ipc_rejected_total', 'counter', "Imzosi mos kelmagan yoki eskirgan IPC xabarlari",
+                lambda: MASTER_BUS.rejected if MASTER_BUS is not None else 0)
+
+def start_master_bus():
+    """Obunalar (botlardan), snapshot va xabarnoma so'rovlarini (web workerlardan) qabul qiluvchi kanal."""
+    global MASTER_BUS
+    if MASTER_BUS is None:
+        MASTER_BUS = LocalBus(IPC_PORT)
+        MASTER_BUS.on('subscribe', lambda message: SUBSCRIBERS.add(*message['path'], message['user_id']))
+        MASTER_BUS.on('publish', lambda message: PUBLISHER.request() if PUBLISHER is not None else None)
+        MASTER_BUS.on('live', lambda message: LIVE.publish(message['kind'], message.get('data')))
+        MASTER_BUS.start()
+    return MASTER_BUS
+
+def init_web_process():
+    """RUN_MODE=web: gunicorn master va workerlar faqat HTTP so'rovlarga xizmat qiladi.
+
+    Fon ishlari (bot, xabarnomalar, snapshotlar, obunachilar fayli) ota jarayonda qoladi -
+    master jarayonda thread bo'lmagani uchun fork xavfsiz.
+    """
+    global IS_WEB_WORKER, PUBLISHER
+    IS_WEB_WORKER = True
+    bus = LocalBus()
+    PUBLISHER = RemotePublisher(bus)
+    # Xabarnomalar datagramma bilan emas, broadcasts.json orqali (WRITE_LOCK ostida) uzatiladi - yo'qolmaydi
+    BROADCASTER.remote = True
+    if LIVE_EVENTS:
+        # SSE ulanishlarini master jarayondagi server qabul qiladi
+        LIVE.port = LIVE_PORT or int(os.environ.get('PORT', 5000)) + 1
+        LIVE.forward = lambda kind, payload: bus.send(IPC_PORT, {'type': 'live', 'kind': kind, 'data': payload})
+
+def _data_files_changed(names):
+    changed = STORE.reload(names)
+    if changed and isinstance(PUBLISHER, SnapshotPublisher):
+        # Tashqi o'zgarish botlarga ham yetib borsin
+        PUBLISHER.request()
+    return changed
+
+def _legacy_data_changed(names):
+    if not os.path.exists(DATA_FILE) or not STORE.import_legacy():
+        return False
+    if isinstance(PUBLISHER, SnapshotPublisher):
+        PUBLISHER.request()
+    return True
+
+def _config_files_changed(names):
+    # admins/settings/activity har murojaatda fayldan o'qiladi; versiya sahifalardagi keshlar uchun oshiriladi
+    print(f"🔄 Tashqaridan o'zgartirildi: {', '.join(sorted(names))}")
+    return True
+
+def _worker_files_changed(names):
+    if os.path.basename(SUBSCRIBERS_FILE) in names:
+        SUBSCRIBERS.refresh()
+    if os.path.basename(BROADCASTS_FILE) in names:
+        BROADCASTER.refresh()
+    return False
+
+def _files_changed():
+    STORE.touch()
+    schedule_keyboard_refresh()
+    LIVE.stats_changed()
+
+def start_file_watcher():
+    """Ma'lumotlar fayllarini kuzatishni boshlaydi (har jarayonda bittadan, gunicorn workerida - forkdan keyin)."""
+    global FILE_WATCHER
+    if not WATCH_FILES or FILE_WATCHER is not None:
+        return FILE_WATCHER
+    watcher = FileWatcher(make_watch_backend(), WATCH_DEBOUNCE, _files_changed)
+    if SNAPSHOTS is not None:
+        # Bot jarayoni shardlarni emas, snapshotni o'qiydi - CURRENT almashtirilishi kifoya.
+        # Obunachilar fayli admin jarayonida yoziladi (boshqa botlarning obunalari, hudud nomlari o'zgarishi)
+        watcher.watch_file(os.path.join(SNAPSHOT_DIR, SNAPSHOT_CURRENT),
+                           lambda names: SNAPSHOTS.notify() or False)
+        watcher.watch_file(SUBSCRIBERS_FILE, _worker_files_changed)
+    else:
+        watcher.watch(STORE.directory, [ShardStore.MANIFEST], _data_files_changed)
+        watcher.watch(STORE.shards_dir, None, _data_files_changed)
+        watcher.watch_file(DATA_FILE, _legacy_data_changed)
+        for path in (ADMINS_FILE, SETTINGS_FILE, ACTIVITY_FILE):
+            watcher.watch_file(path, _config_files_changed)
+        if IS_WEB_WORKER:
+            watcher.watch_file(SUBSCRIBERS_FILE, _worker_files_changed)
+            watcher.watch_file(BROADCASTS_FILE, _worker_files_changed)
+        else:
+            watcher.watch_file(BROADCASTS_FILE, lambda names: BROADCASTER.adopt() or False)
+    FILE_WATCHER = watcher
+    watcher.start()
+    STORE.trusted = SNAPSHOTS is None
+    if not IS_WEB_WORKER:
+        print(f"👀 Fayl kuzatuvchisi: {watcher.backend.name} (debounce {WATCH_DEBOUNCE * 1000:.0f} ms)")
+    return watcher
+
+def run_gunicorn(port):
+    from gunicorn.app.base import BaseApplication
+
+    class AdminPanelServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    global WEB_POOL_THREADS
+    init_web_process()
+    WEB_POOL_THREADS = WEB_THREADS
+    # Shardlar master jarayonda yuklanadi - workerlar forkdan keyin tayyor keshga ega
+    STARTUP.mark("ma'lumotlar", _warm_store())
+    STARTUP.report()
+    AdminPanelServer({
+        'bind': f'0.0.0.0:{port}',
+        'workers': WEB_WORKERS,
+        'threads': WEB_THREADS,
+        'worker_class': 'gthread',
+        'keepalive': WEB_KEEPALIVE,
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'max_requests': WEB_MAX_REQUESTS,
+        'max_requests_jitter': WEB_MAX_REQUESTS // 10,
+        # Kuzatuvchi thread - har bir workerda forkdan keyin (master jarayon threadsiz qoladi)
+        'post_fork': lambda server, worker: start_file_watcher(),
+    }).run()
+
+def serve_gunicorn(port):
+    # gunicorn alohida (yangi) jarayonda: bu jarayondagi bot/xabarnoma threadlari fork qilinmaydi
+    import gunicorn  # noqa: F401 - o'rnatilmagan bo'lsa ImportError shu yerda
+    start_master_bus()
+    print(f"🦄 gunicorn: {WEB_WORKERS} worker x {WEB_THREADS} thread (SIGHUP - workerlarni qayta yuklash)")
+    Supervisor([('web', {'RUN_MODE': 'web', 'PORT': str(port)})]).run()
+
+def serve_waitress(port):
+    from waitress import serve
+    global WEB_POOL_THREADS
+    # waitress bitta jarayonda ishlaydi - WEB_WORKERS hisobga olinmaydi
+    WEB_POOL_THREADS = WEB_THREADS
+    print(f"🍽️ waitress: {WEB_THREADS} thread")
+    serve(app, host='0.0.0.0', port=port, threads=WEB_THREADS, channel_timeout=WEB_TIMEOUT)
+
+def serve_werkzeug(port):
+    print("⚠️ Flask dev serveri - yuklama ostida ishlatish uchun gunicorn yoki waitress o'rnating")
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+
+WEB_SERVERS = {'gunicorn': serve_gunicorn, 'waitress': serve_waitress, 'werkzeug': serve_werkzeug}
+
+def serve_admin_panel(port):
+    """WEB_SERVER bo'yicha server; auto - birinchi o'rnatilgani (gunicorn Windowsda ishlamaydi)."""
+    if WEB_SERVER != 'auto':
+        return WEB_SERVERS[WEB_SERVER](port)
+    for name in ('gunicorn', 'waitress'):
+        if name == 'gunicorn' and fcntl is None:
+            continue
+        try:
+            return WEB_SERVERS[name](port)
+        except ImportError:
+            continue
+    return serve_werkzeug(port)
 
 # Asosiy funksiya
 def main():
+    global BOT_THREAD
+    if RUN_MODE == 'supervisor':
+        run_supervisor()
+        return
+    if RUN_MODE == 'bot':
+        run_bot_worker()
+        return
+    if RUN_MODE == 'web':
+        run_gunicorn(int(os.environ.get('PORT', 5000)))
+        return
+
     # Kerakli papkalarni yaratish
     for folder in ['templates', 'backups', 'exports']:
         if not os.path.exists(folder):
             os.makedirs(folder)
     
     print("🚀 Dasturni ishga tushiramiz...")
+    print(f"🧩 JSON kodek: {JSON_CODEC.name}")
+    
+    # Manifestni ochish (eski data.json bo'lsa - shardlarga bo'linadi, faqat birinchi marta)
+    load_data()
+    STARTUP.mark("ma'lumotlar", _warm_store())
+    start_file_watcher()
+    
+    if RUN_MODE == 'async':
+        # Bot, xabarnomalar va admin panel - bitta event loopda
+        clear_bot_health()
+        asyncio.run(serve_single_loop(int(os.environ.get('PORT', 5000))))
+        return
+    
+    if RUN_MODE == 'admin':
+        # Botlar alohida jarayonlarda - ular uchun snapshot yoziladi
+        start_snapshot_publisher()
+        # Supervisor terminate() qilganda atexit (obunachilarni saqlash) ishlashi uchun
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    else:
+        # Botni alohida threadda ishga tushirish (run_bot yiqilgan botni o'zi qayta ishga tushiradi)
+        clear_bot_health()
+        BOT_THREAD = threading.Thread(target=run_bot, name='bot', daemon=True)
+        BOT_THREAD.start()
     
-    # Botni alohida threadda ishga tushirish
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
+    # Xabarnomalarni yuboruvchi fon thread
+    BROADCASTER.start()
+    
+    port = int(os.environ.get('PORT', 5000))
+    if LIVE_EVENTS:
+        LIVE.start(LIVE_PORT or port + 1)
+        if LIVE.port is not None:
+            print(f"📡 Jonli yangilanishlar (SSE): http://localhost:{LIVE.port}{LIVE_PATH}")
+    STARTUP.mark('fon xizmatlari')
+    STARTUP.report()
     
     print("🌐 Admin panel http://localhost:5000/admin da ishga tushdi")
     print("🔐 Login: smartmahalla, Parol: SmartMahalla1.0v")
-    print("🤖 Bot ishga tushirildi")
+    if RUN_MODE != 'admin':
+        print("🤖 Bot ishga tushirildi")
     print("📊 Ma'lumotlar bazasi yuklandi")
     
-    # Flask serverni ishga tushirish
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    # HTTP serverni ishga tushirish
+    serve_admin_panel(port)
+
+STARTUP.mark('modul')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,299 @@
+# fake_telegram_api.py
+# Mahalliy sinov uchun soxta Telegram Bot API serveri.
+#
+# Ishlatish:
+#   python fake_telegram_api.py --port 8081
+#   TELEGRAM_API_URL=http://localhost:8081/bot python bot_with_admin.py
+#
+# Qo'llab-quvvatlanadi: getMe, getUpdates (long polling), setWebhook/deleteWebhook
+# (webhookka update yuborish), sendMessage, editMessageText, answerCallbackQuery.
+# Updatelar POST /inject orqali (yoki loadtest.py dan to'g'ridan-to'g'ri) beriladi.
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.request
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1000001, "is_bot": True, "first_name": "Smart Mahalla (fake)", "username": "fake_mahalla_bot"}
+
+
+class FakeTelegramState:
+    """Updatelar navbati, yuborilgan xabarlar va limitlar holati."""
+
+    def __init__(self, global_limit=30, chat_limit=1, fail_rate=0.0, blocked_rate=0.0):
+        self.lock = threading.Lock()
+        self.updates_ready = threading.Condition(self.lock)
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.fail_rate = fail_rate
+        self.blocked_rate = blocked_rate
+        self.recent = deque()
+        self.recent_by_chat = defaultdict(deque)
+        self.messages = []
+        self.texts = {}
+        self.counters = defaultdict(int)
+        self.next_message_id = 1
+        self.next_update_id = 1
+        self.updates = deque()
+        self.webhook_url = None
+        self.last_poll = None
+        # loadtest.py javoblarni shu yerdan kuzatadi: fn(method, chat_id, params)
+        self.listeners = []
+
+    # --- Updatelar ---
+
+    def push_update(self, update):
+        with self.lock:
+            update = dict(update, update_id=self.next_update_id)
+            self.next_update_id += 1
+            self.counters['updates_injected'] += 1
+            if self.webhook_url:
+                url = self.webhook_url
+            else:
+                self.updates.append(update)
+                self.updates_ready.notify_all()
+                return update
+        threading.Thread(target=self._deliver_webhook, args=(url, update), daemon=True).start()
+        return update
+
+    def _deliver_webhook(self, url, update):
+        body = json.dumps(update).encode('utf-8')
+        req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(req, timeout=10).read()
+        except Exception:
+            with self.lock:
+                self.counters['webhook_errors'] += 1
+
+    def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.time() + timeout
+        with self.lock:
+            self.last_poll = time.time()
+            while self.updates and self.updates[0]['update_id'] < offset:
+                self.updates.popleft()
+            while not self.updates and time.time() < deadline:
+                self.updates_ready.wait(deadline - time.time())
+                while self.updates and self.updates[0]['update_id'] < offset:
+                    self.updates.popleft()
+            self.last_poll = time.time()
+            self.counters['getUpdates'] += 1
+            return 200, {"ok": True, "result": list(self.updates)[:limit]}
+
+    def set_webhook(self, params):
+        with self.lock:
+            self.webhook_url = params.get('url') or None
+            self.counters['setWebhook'] += 1
+        return 200, {"ok": True, "result": True}
+
+    def delete_webhook(self, params):
+        with self.lock:
+            self.webhook_url = None
+            if params.get('drop_pending_updates'):
+                self.updates.clear()
+        return 200, {"ok": True, "result": True}
+
+    def webhook_info(self):
+        with self.lock:
+            return 200, {"ok": True, "result": {"url": self.webhook_url or "", "has_custom_certificate": False,
+                                                "pending_update_count": len(self.updates)}}
+
+    # --- Bot javoblari ---
+
+    def _rate_limited(self, chat_id, now):
+        # Telegram: ~30 xabar/soniya umumiy, 1 xabar/soniya bitta chatga (0 - limit yo'q)
+        while self.recent and now - self.recent[0] > 1.0:
+            self.recent.popleft()
+        chat_recent = self.recent_by_chat[chat_id]
+        while chat_recent and now - chat_recent[0] > 1.0:
+            chat_recent.popleft()
+        if self.global_limit and len(self.recent) >= self.global_limit:
+            return True
+        if self.chat_limit and len(chat_recent) >= self.chat_limit:
+            return True
+        self.recent.append(now)
+        chat_recent.append(now)
+        return False
+
+    def _notify(self, method, chat_id, params):
+        for listener in list(self.listeners):
+            listener(method, chat_id, params)
+
+    def _limit_or_fail(self, chat_id, now):
+        if self._rate_limited(chat_id, now):
+            self.counters['429'] += 1
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                         "parameters": {"retry_after": 1}}
+        roll = random.random()
+        if roll < self.blocked_rate:
+            self.counters['403'] += 1
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        if roll < self.blocked_rate + self.fail_rate:
+            self.counters['500'] += 1
+            return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+        return None
+
+    def _message(self, message_id, chat_id, now, params):
+        message = {"message_id": message_id, "date": int(now), "chat": {"id": chat_id, "type": "private"},
+                   "from": BOT_USER, "text": params.get('text', '')}
+        if params.get('reply_markup'):
+            message["reply_markup"] = params['reply_markup']
+        return message
+
+    def send_message(self, params):
+        chat_id = int(params.get('chat_id', 0))
+        now = time.time()
+        with self.lock:
+            error = self._limit_or_fail(chat_id, now)
+            if error:
+                return error
+            message_id = self.next_message_id
+            self.next_message_id += 1
+            self.messages.append({"chat_id": chat_id, "text": params.get('text', ''), "time": now})
+            self.texts[(chat_id, message_id)] = (params.get('text', ''), json.dumps(params.get('reply_markup')))
+            self.counters['sendMessage'] += 1
+        self._notify('sendMessage', chat_id, dict(params, message_id=message_id))
+        return 200, {"ok": True, "result": self._message(message_id, chat_id, now, params)}
+
+    def edit_message_text(self, params):
+        chat_id = int(params.get('chat_id', 0))
+        message_id = int(params.get('message_id', 0))
+        now = time.time()
+        content = (params.get('text', ''), json.dumps(params.get('reply_markup')))
+        with self.lock:
+            error = self._limit_or_fail(chat_id, now)
+            if error:
+                return error
+            if self.texts.get((chat_id, message_id)) == content:
+                self.counters['not_modified'] += 1
+                status, payload = 400, {"ok": False, "error_code": 400, "description":
+                                        "Bad Request: message is not modified: specified new message content "
+                                        "and reply markup are exactly the same as a current content and "
+                                        "reply markup of the message"}
+            else:
+                self.texts[(chat_id, message_id)] = content
+                self.counters['editMessageText'] += 1
+                status, payload = 200, {"ok": True, "result": self._message(message_id, chat_id, now, params)}
+        self._notify('editMessageText', chat_id, params)
+        return status, payload
+
+    def answer_callback_query(self, params):
+        with self.lock:
+            self.counters['answerCallbackQuery'] += 1
+        self._notify('answerCallbackQuery', None, params)
+        return 200, {"ok": True, "result": True}
+
+    def stats(self):
+        with self.lock:
+            per_chat = defaultdict(int)
+            for msg in self.messages:
+                per_chat[msg['chat_id']] += 1
+            return {
+                "counters": dict(self.counters),
+                "messages": len(self.messages),
+                "unique_chats": len(per_chat),
+                "duplicates": sum(n - 1 for n in per_chat.values() if n > 1),
+                "pending_updates": len(self.updates),
+                "last_poll": self.last_poll
+            }
+
+
+def _parse_params(handler):
+    length = int(handler.headers.get('Content-Length') or 0)
+    body = handler.rfile.read(length) if length else b''
+    content_type = handler.headers.get('Content-Type', '')
+    if 'application/json' in content_type:
+        return json.loads(body or b'{}')
+    params = {}
+    for key, values in parse_qs(body.decode('utf-8')).items():
+        value = values[-1]
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                return self._reply(200, state.stats())
+            return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+        def do_POST(self):
+            params = _parse_params(self)
+            if self.path == '/inject':
+                updates = params if isinstance(params, list) else [params]
+                return self._reply(200, {"ok": True, "result": [state.push_update(u) for u in updates]})
+            # /bot<TOKEN>/<method>
+            method = self.path.rstrip('/').rsplit('/', 1)[-1]
+            if method == 'getMe':
+                return self._reply(200, {"ok": True, "result": BOT_USER})
+            if method == 'getUpdates':
+                return self._reply(*state.get_updates(params))
+            if method == 'setWebhook':
+                return self._reply(*state.set_webhook(params))
+            if method == 'deleteWebhook':
+                return self._reply(*state.delete_webhook(params))
+            if method == 'getWebhookInfo':
+                return self._reply(*state.webhook_info())
+            if method == 'sendMessage':
+                return self._reply(*state.send_message(params))
+            if method == 'editMessageText':
+                return self._reply(*state.edit_message_text(params))
+            if method == 'answerCallbackQuery':
+                return self._reply(*state.answer_callback_query(params))
+            return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"})
+
+    return Handler
+
+
+def serve(host='127.0.0.1', port=8081, **kwargs):
+    state = FakeTelegramState(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soxta Telegram Bot API serveri")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--global-limit', type=int, default=30, help="umumiy xabar/soniya limiti (0 - yo'q)")
+    parser.add_argument('--chat-limit', type=int, default=1, help="bitta chatga xabar/soniya limiti (0 - yo'q)")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="500 xato ehtimoli")
+    parser.add_argument('--blocked-rate', type=float, default=0.0, help="403 (bloklagan) ehtimoli")
+    args = parser.parse_args()
+
+    server, _ = serve(args.host, args.port, global_limit=args.global_limit, chat_limit=args.chat_limit,
+                      fail_rate=args.fail_rate, blocked_rate=args.blocked_rate)
+    print(f"🧪 Soxta Telegram API http://{args.host}:{args.port}/bot<TOKEN>/ da ishga tushdi")
+    print(f"📊 Statistika: http://{args.host}:{args.port}/stats, updatelar: POST /inject")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# generate_data.py
+# Benchmark va yuklama sinovlari uchun sun'iy (lekin real ko'rinishdagi) ma'lumotlar.
+#
+# Ishlatish:
+#   python generate_data.py --output data.json                 # ~9500 MFY, 14 hudud
+#   python generate_data.py --mfy 50000 --output big.json --subscribers subscribers.json
+#   python generate_data.py --coords 0.9 --output geo.json       # 90% MFYlarda joylashuv
+import argparse
+import base64
+import json
+import random
+from array import array
+from datetime import datetime, timedelta
+
+# (hudud nomi, turi, tumanlar soni) - 14 hudud, ~200 tuman/shahar
+REGIONS = [
+    ("Andijon viloyati", "viloyat", 16),
+    ("Buxoro viloyati", "viloyat", 13),
+    ("Farg'ona viloyati", "viloyat", 19),
+    ("Jizzax viloyati", "viloyat", 13),
+    ("Xorazm viloyati", "viloyat", 13),
+    ("Namangan viloyati", "viloyat", 12),
+    ("Navoiy viloyati", "viloyat", 10),
+    ("Qashqadaryo viloyati", "viloyat", 14),
+    ("Qoraqalpog'iston Respublikasi", "respublika", 17),
+    ("Samarqand viloyati", "viloyat", 16),
+    ("Sirdaryo viloyati", "viloyat", 11),
+    ("Surxondaryo viloyati", "viloyat", 14),
+    ("Toshkent viloyati", "viloyat", 22),
+    ("Toshkent shahri", "shahar", 12),
+]
+
+# Hududlar markazlarining taxminiy koordinatalari (MFY joylashuvlari shular atrofida sochiladi)
+CENTERS = {
+    "Andijon viloyati": (40.78, 72.34), "Buxoro viloyati": (39.77, 64.42), "Farg'ona viloyati": (40.39, 71.78),
+    "Jizzax viloyati": (40.12, 67.84), "Xorazm viloyati": (41.55, 60.63), "Namangan viloyati": (40.99, 71.67),
+    "Navoiy viloyati": (40.10, 65.37), "Qashqadaryo viloyati": (38.86, 65.79),
+    "Qoraqalpog'iston Respublikasi": (42.46, 59.60), "Samarqand viloyati": (39.65, 66.96),
+    "Sirdaryo viloyati": (40.49, 68.78), "Surxondaryo viloyati": (37.22, 67.28),
+    "Toshkent viloyati": (41.00, 69.50), "Toshkent shahri": (41.31, 69.24),
+}
+
+# add_mahalla dagi standart lavozimlar
+POSITIONS = ["hokim", "2-sektor_rahbari", "mfy_raisi", "iib_inspektori", "hokim_yordamchisi", "yoshlar_yetakchisi"]
+
+PLACE_ROOTS = [
+    "Navbahor", "Guliston", "Bog'ishamol", "Mustaqillik", "Do'stlik", "Yangiobod", "Oqtepa", "Qo'rg'ontepa",
+    "Chilonzor", "Olmazor", "Bodomzor", "Tinchlik", "Istiqlol", "Bunyodkor", "Navro'z", "Sharq", "Ziyokor",
+    "Nurafshon", "Oltinko'l", "Qorasuv", "Ko'kterak", "Gulbahor", "Paxtakor", "Mehnatobod", "Bog'bon",
+    "Ipakchi", "Yoshlik", "Obod", "Zarafshon", "Saodat", "Baxt", "Uchqo'rg'on", "Tolzor", "Yangihayot",
+    "Sarbon", "Qumariq", "Oq oltin", "Beshariq", "Mirobod", "Ulug'bek", "Amir Temur", "Alisher Navoiy",
+]
+PLACE_SUFFIXES = ["", "", "", " 1", " 2", "-ota", " qishlog'i", "obod", " ko'chasi", "tepa"]
+
+FIRST_NAMES = [
+    "Aziz", "Bobur", "Dilshod", "Eldor", "Farrux", "G'ayrat", "Hasan", "Ilhom", "Jasur", "Komil", "Laziz",
+    "Murod", "Nodir", "Otabek", "Rustam", "Sardor", "Timur", "Ulug'bek", "Xurshid", "Yusuf", "Zafar",
+    "Dilnoza", "Gulnora", "Malika", "Nigora", "Sevara", "Shahnoza", "Zarina", "Feruza", "Kamola", "Mohira",
+]
+LAST_NAMES = [
+    "Abdullayev", "Karimov", "Rahimov", "Yusupov", "Toshmatov", "Ismoilov", "Qodirov", "Saidov", "Mirzayev",
+    "Nazarov", "Ergashev", "Hamidov", "Sobirov", "Xolmatov", "Jo'rayev", "Umarov", "Aliyev", "Rasulov",
+]
+
+# Lotin -> Kirill (nomlarning bir qismi kirillcha bo'ladi)
+_CYRILLIC = [
+    ("o'", "ў"), ("O'", "Ў"), ("g'", "ғ"), ("G'", "Ғ"), ("sh", "ш"), ("Sh", "Ш"), ("ch", "ч"), ("Ch", "Ч"),
+    ("yo", "ё"), ("Yo", "Ё"), ("yu", "ю"), ("Yu", "Ю"), ("ya", "я"), ("Ya", "Я"),
+]
+_CYRILLIC_LETTERS = dict(zip("abdefghijklmnopqrstuvxyzABDEFGHIJKLMNOPQRSTUVXYZ'",
+                             "абдефгҳижклмнопқрстувхйзАБДЕФГҲИЖКЛМНОПҚРСТУВХЙЗъ"))
+
+
+def to_cyrillic(text):
+    for latin, cyr in _CYRILLIC:
+        text = text.replace(latin, cyr)
+    return ''.join(_CYRILLIC_LETTERS.get(ch, ch) for ch in text)
+
+
+def _unique(name, used):
+    candidate, n = name, 2
+    while candidate in used:
+        candidate = f"{name} {n}"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def _staff(rng, fill_rate, placeholders):
+    xodimlar = {}
+    for lavozim in POSITIONS:
+        if rng.random() < fill_rate:
+            ism = f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}"
+            xodimlar[lavozim] = {
+                "ism": ism,
+                "telefon": f"+998{rng.choice(['90', '91', '93', '94', '97', '99', '88', '33'])}{rng.randint(1000000, 9999999)}",
+                "email": f"{ism.split()[1].lower().replace(chr(39), '')}{rng.randint(1, 999)}@mahalla.uz" if rng.random() < 0.4 else "",
+                "holat": "faol" if rng.random() < 0.95 else "nofaol"
+            }
+        elif placeholders:
+            # Eski format: bo'sh lavozimlar ham yoziladi (migratsiyani sinash uchun)
+            xodimlar[lavozim] = {"ism": "", "telefon": "", "email": "", "holat": "faol"}
+    return xodimlar
+
+
+def generate(mfy_total=9500, seed=42, fill_rate=0.7, cyrillic_rate=0.15, placeholders=False, coord_rate=0.0):
+    rng = random.Random(seed)
+    # Koordinatalar alohida generatordan - coord_rate qolgan ma'lumotlarni o'zgartirmaydi
+    geo = random.Random(seed + 2)
+    district_total = sum(count for _, _, count in REGIONS)
+    base = datetime(2024, 1, 1)
+    # MFYlar soni tumanlar bo'yicha notekis taqsimlanadi, jami esa mfy_total ga teng
+    weights = [max(0.2, rng.gauss(1.0, 0.35)) for _ in range(district_total)]
+    scale = mfy_total / sum(weights)
+    counts = iter(max(1, round(w * scale)) for w in weights)
+    data = {}
+    for viloyat, viloyat_turi, tuman_soni in REGIONS:
+        tumanlar = {}
+        used_tumanlar = set()
+        for i in range(tuman_soni):
+            shahar = rng.random() < 0.2 or viloyat_turi == "shahar"
+            root = rng.choice(PLACE_ROOTS)
+            tuman_nomi = _unique(f"{root} {'shahri' if shahar else 'tumani'}", used_tumanlar)
+            center_lat, center_lon = CENTERS[viloyat]
+            spread = 0.05 if viloyat_turi == "shahar" else 0.4
+            tuman_lat, tuman_lon = geo.gauss(center_lat, spread), geo.gauss(center_lon, spread)
+            mfy_soni = next(counts)
+            mfylar = {}
+            used_mfylar = set()
+            for _ in range(mfy_soni):
+                name = f"{rng.choice(PLACE_ROOTS)}{rng.choice(PLACE_SUFFIXES)} MFY"
+                if rng.random() < cyrillic_rate:
+                    name = to_cyrillic(name)
+                mfy_nomi = _unique(name, used_mfylar)
+                mfylar[mfy_nomi] = {
+                    "xodimlar": _staff(rng, fill_rate, placeholders),
+                    "yaratilgan_vaqt": (base + timedelta(minutes=rng.randint(0, 60 * 24 * 600))).isoformat(),
+                    "holat": "faol" if rng.random() < 0.93 else "nofaol"
+                }
+                if geo.random() < coord_rate:
+                    mfylar[mfy_nomi]["joylashuv"] = {"lat": round(geo.gauss(tuman_lat, 0.03), 6),
+                                                     "lon": round(geo.gauss(tuman_lon, 0.03), 6)}
+            tumanlar[tuman_nomi] = {"type": "shahar" if shahar else "tuman", "mfylar": mfylar}
+        data[viloyat] = {"type": viloyat_turi, "tumanlar": tumanlar}
+    return data
+
+
+def generate_subscribers(data, users, seed=42, mode='exact'):
+    """subscribers.json (SubscriberRegistry formati) - har bir foydalanuvchi 1-3 ta MFYga obuna."""
+    rng = random.Random(seed + 1)
+    paths = [(v, t, m) for v, region in data.items()
+             for t, district in region['tumanlar'].items()
+             for m in district['mfylar']]
+    tree = {}
+    for user_id in range(100000000, 100000000 + users):
+        for v, t, m in rng.sample(paths, k=min(len(paths), rng.randint(1, 3))):
+            tree.setdefault(v, {}).setdefault(t, {}).setdefault(m, set()).add(user_id)
+    encoded = {}
+    for v, tumanlar in tree.items():
+        for t, mfylar in tumanlar.items():
+            for m, ids in mfylar.items():
+                arr = array('q', sorted(ids))
+                encoded.setdefault(v, {}).setdefault(t, {})[m] = base64.b64encode(arr.tobytes()).decode('ascii')
+    return {"mode": mode, "mfylar": encoded}
+
+
+def summary(data):
+    districts = sum(len(r['tumanlar']) for r in data.values())
+    mfys = sum(len(d['mfylar']) for r in data.values() for d in r['tumanlar'].values())
+    return {"regions": len(data), "districts": districts, "mfys": mfys, "staff_slots": mfys * len(POSITIONS)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sun'iy Smart Mahalla ma'lumotlari generatori")
+    parser.add_argument('--output', default='data.json')
+    parser.add_argument('--mfy', type=int, default=9500, help="taxminiy MFYlar soni")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fill-rate', type=float, default=0.7, help="to'ldirilgan lavozimlar ulushi")
+    parser.add_argument('--placeholders', action='store_true', help="bo'sh lavozimlarni ham yozish (eski format)")
+    parser.add_argument('--coords', type=float, default=0.0, help="koordinatali MFYlar ulushi (0..1)")
+    parser.add_argument('--subscribers', help="subscribers.json ham yaratish (fayl yo'li)")
+    parser.add_argument('--users', type=int, default=50000, help="obunachilar soni (--subscribers bilan)")
+    args = parser.parse_args()
+
+    data = generate(args.mfy, args.seed, args.fill_rate, placeholders=args.placeholders, coord_rate=args.coords)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"✅ {args.output}: {summary(data)}")
+
+    if args.subscribers:
+        with open(args.subscribers, 'w', encoding='utf-8') as f:
+            json.dump(generate_subscribers(data, args.users, args.seed), f)
+        print(f"✅ {args.subscribers}: {args.users} ta foydalanuvchi")
+
+
+if __name__ == "__main__":
+    main()
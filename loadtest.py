@@ -0,0 +1,405 @@
+# loadtest.py
+# Mahalliy yuklama sinovi: soxta Telegram API + bot_with_admin.py jarayoni.
+#
+# Bir vaqtning o'zida minglab bot foydalanuvchilari (/start -> VIL -> TUM -> MAH -> BACK)
+# va admin panelga yozuvchi operatorlar simulyatsiya qilinadi. Natija: throughput,
+# p50/p99 kechikish va xatolar ulushi (bot va admin panel alohida).
+#
+# Ishlatish:
+#   python loadtest.py --users 2000 --admins 5 --duration 60
+#   python loadtest.py --users 500 --mfy 2000 --output loadtest.json
+#   python loadtest.py --target http://127.0.0.1:5000 --fake-port 8081   # ishlab turgan ilovaga
+#   python loadtest.py --edit-stress --admins 16 --users 0 --admin-think 0   # yo'qolgan tahrirlar sinovi
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+import fake_telegram_api
+import generate_data
+
+ADMIN_LOGIN = os.environ.get('LOADTEST_ADMIN_LOGIN', 'smartmahalla')
+ADMIN_PASSWORD = os.environ.get('LOADTEST_ADMIN_PASSWORD', 'SmartMahalla1.0v')
+
+
+class Recorder:
+    """Kategoriya bo'yicha kechikishlar va xatolar."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.samples = defaultdict(list)
+
+    def ok(self, kind, seconds):
+        self.latencies[kind].append(seconds)
+
+    def fail(self, kind, reason=None):
+        self.errors[kind] += 1
+        if reason and len(self.samples[kind]) < 3:
+            self.samples[kind].append(reason)
+
+    def report(self, duration):
+        result = {}
+        for kind in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[kind])
+            total = len(values) + self.errors[kind]
+            result[kind] = {
+                'requests': total,
+                'throughput_rps': round(len(values) / duration, 2),
+                'p50_ms': round(statistics.median(values) * 1000, 2) if values else None,
+                'p99_ms': round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 2) if values else None,
+                'errors': self.errors[kind],
+                'error_rate': round(self.errors[kind] / total, 4) if total else 0.0,
+                'error_samples': self.samples[kind],
+            }
+        return result
+
+
+class ResponseWaiter:
+    """Soxta API ga kelgan bot javoblarini (chat_id bo'yicha) kutayotgan foydalanuvchilarga uzatadi."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.waiting = {}
+
+    def expect(self, chat_id, method):
+        future = self.loop.create_future()
+        self.waiting[chat_id] = (method, future)
+        return future
+
+    def on_response(self, method, chat_id, params):
+        # Fake server threadidan chaqiriladi
+        self.loop.call_soon_threadsafe(self._resolve, method, chat_id, params)
+
+    def _resolve(self, method, chat_id, params):
+        entry = self.waiting.get(chat_id)
+        if entry and entry[0] == method and not entry[1].done():
+            del self.waiting[chat_id]
+            entry[1].set_result(params)
+
+
+def _paths(data):
+    return [(v, t, m) for v, region in data.items()
+            for t, district in region['tumanlar'].items()
+            for m in district['mfylar']]
+
+
+async def bot_user(chat_id, state, waiter, recorder, paths, stop_at, think, timeout):
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+    chat = {"id": chat_id, "type": "private"}
+    await asyncio.sleep(random.uniform(0, think * 2))
+    while time.time() < stop_at:
+        # /start -> yangi xabar, keyin shu xabar tahrirlanadi
+        future = waiter.expect(chat_id, 'sendMessage')
+        started = time.perf_counter()
+        state.push_update({"message": {"message_id": random.randint(1, 10 ** 9), "date": int(time.time()),
+                                       "chat": chat, "from": user, "text": "/start",
+                                       "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}})
+        try:
+            sent = await asyncio.wait_for(future, timeout)
+            recorder.ok('bot /start', time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            waiter.waiting.pop(chat_id, None)
+            recorder.fail('bot /start', 'timeout')
+            continue
+        message = {"message_id": sent['message_id'], "date": int(time.time()), "chat": chat,
+                   "from": fake_telegram_api.BOT_USER, "text": "..."}
+
+        v, t, m = random.choice(paths)
+        for kind, payload in (('VIL', f'VIL|{v}'), ('TUM', f'TUM|{v}|{t}'), ('MAH', f'MAH|{v}|{t}|{m}'),
+                              ('BACK', 'BACK|HOME')):
+            await asyncio.sleep(random.expovariate(1 / think) if think else 0)
+            if time.time() >= stop_at:
+                return
+            future = waiter.expect(chat_id, 'editMessageText')
+            started = time.perf_counter()
+            state.push_update({"callback_query": {"id": f"{chat_id}-{time.time_ns()}", "from": user,
+                                                  "chat_instance": str(chat_id), "data": payload,
+                                                  "message": message}})
+            try:
+                await asyncio.wait_for(future, timeout)
+                recorder.ok(f'bot {kind}', time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                waiter.waiting.pop(chat_id, None)
+                recorder.fail(f'bot {kind}', 'timeout')
+                break
+
+
+async def admin_writer(index, base_url, recorder, paths, stop_at, think, timeout):
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, follow_redirects=False) as client:
+        response = await client.post('/admin/login', data={'username': ADMIN_LOGIN, 'password': ADMIN_PASSWORD})
+        if response.status_code != 302:
+            recorder.fail('admin login')
+            return
+        n = 0
+        while time.time() < stop_at:
+            v, t, m = random.choice(paths)
+            n += 1
+            operations = [
+                ('admin add_xodim', 'POST', '/admin/add_xodim',
+                 {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': m, 'lavozim': 'yoshlar_yetakchisi',
+                  'ism': f'Yuklama Xodim {index}-{n}', 'telefon': f'+99877{index:02d}{n % 100000:05d}'}),
+                ('admin update_xodim', 'POST', '/admin/update_xodim',
+                 {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': m, 'lavozim_old': 'yoshlar_yetakchisi',
+                  'lavozim': 'yoshlar_yetakchisi', 'ism': f'Yuklama Xodim {index}-{n}b',
+                  'telefon': f'+99878{index:02d}{n % 100000:05d}', 'holat': 'faol'}),
+                ('admin toggle_mahalla_status', 'POST', '/admin/toggle_mahalla_status',
+                 {'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': m, 'new_status': 'faol'}),
+                ('admin get_mahallalar', 'GET', '/admin/get_mahallalar', {'viloyat': v, 'tuman': t}),
+                ('admin get_xodimlar', 'GET', '/admin/get_xodimlar', {'viloyat': v, 'tuman': t, 'mahalla': m}),
+            ]
+            for kind, method, path, payload in operations:
+                started = time.perf_counter()
+                try:
+                    if method == 'POST':
+                        response = await client.post(path, json=payload)
+                    else:
+                        response = await client.get(path, params=payload)
+                    body = response.json() if response.headers.get('content-type', '').startswith('application/json') else None
+                    if response.status_code >= 400:
+                        recorder.fail(kind, f"HTTP {response.status_code}")
+                    elif isinstance(body, dict) and body.get('success') is False:
+                        recorder.fail(kind, body.get('message'))
+                    else:
+                        recorder.ok(kind, time.perf_counter() - started)
+                except (httpx.HTTPError, ValueError) as e:
+                    recorder.fail(kind, repr(e))
+                await asyncio.sleep(random.expovariate(1 / think) if think else 0)
+                if time.time() >= stop_at:
+                    return
+
+
+STRESS_LAVOZIM = 'yoshlar_yetakchisi'
+
+
+def _stress_value(xodim):
+    ism = (xodim or {}).get('ism') or ''
+    return int(ism.rsplit(' ', 1)[1]) if ism.startswith('Stress ') else 0
+
+
+async def edit_stress(index, base_url, recorder, targets, hot, stop_at, think, timeout, applied):
+    """O'qish -> +1 -> versiya bilan yozish. Har bir operator o'z MFYsini va hamma uchun umumiy (hot)
+    MFYni tahrirlaydi; 409 - kutilgan natija (qayta o'qib urinadi). applied[path] - qabul qilingan yozuvlar."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, follow_redirects=False) as client:
+        response = await client.post('/admin/login', data={'username': ADMIN_LOGIN, 'password': ADMIN_PASSWORD})
+        if response.status_code != 302:
+            recorder.fail('admin login')
+            return
+        own = targets[index % len(targets)]
+        while time.time() < stop_at:
+            path = hot if random.random() < 0.5 else own
+            kind = 'admin stress hot' if path == hot else 'admin stress own'
+            v, t, m = path
+            started = time.perf_counter()
+            try:
+                current = (await client.get('/admin/get_xodimlar', params={'viloyat': v, 'tuman': t, 'mahalla': m})).json()
+                xodim = current.get(STRESS_LAVOZIM) or {}
+                response = await client.post('/admin/update_xodim', json={
+                    'viloyat_nomi': v, 'tuman_nomi': t, 'mahalla_nomi': m, 'lavozim_old': STRESS_LAVOZIM,
+                    'lavozim': STRESS_LAVOZIM, 'ism': f'Stress {_stress_value(xodim) + 1}',
+                    'telefon': f'+99879{index:02d}{random.randint(0, 99999):05d}', 'holat': 'faol',
+                    'versiya': xodim.get('versiya', 0)})
+                body = response.json()
+                if response.status_code == 409:
+                    recorder.ok('admin stress conflict (409)', time.perf_counter() - started)
+                elif body.get('success'):
+                    applied[path] += 1
+                    recorder.ok(kind, time.perf_counter() - started)
+                else:
+                    recorder.fail(kind, body.get('message'))
+            except (httpx.HTTPError, ValueError) as e:
+                recorder.fail(kind, repr(e))
+            await asyncio.sleep(random.expovariate(1 / think) if think else 0)
+
+
+async def verify_stress(base_url, timeout, initial, applied):
+    """Yakuniy qiymat = boshlang'ich + qabul qilingan yozuvlar; farq - yo'qolgan tahrirlar."""
+    lost = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, follow_redirects=False) as client:
+        await client.post('/admin/login', data={'username': ADMIN_LOGIN, 'password': ADMIN_PASSWORD})
+        for (v, t, m), start in initial.items():
+            current = (await client.get('/admin/get_xodimlar', params={'viloyat': v, 'tuman': t, 'mahalla': m})).json()
+            final = _stress_value(current.get(STRESS_LAVOZIM))
+            if final != start + applied[(v, t, m)]:
+                lost[f'{v} / {t} / {m}'] = start + applied[(v, t, m)] - final
+    return lost
+
+
+async def _stress_initial(base_url, timeout, paths):
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, follow_redirects=False) as client:
+        await client.post('/admin/login', data={'username': ADMIN_LOGIN, 'password': ADMIN_PASSWORD})
+        initial = {}
+        for v, t, m in paths:
+            current = (await client.get('/admin/get_xodimlar', params={'viloyat': v, 'tuman': t, 'mahalla': m})).json()
+            initial[(v, t, m)] = _stress_value(current.get(STRESS_LAVOZIM))
+        return initial
+
+
+def _stress_targets(paths, admins, seed):
+    # Operatorlarning yarmi bitta viloyatda (bitta shard - navbat bilan), qolgani turli viloyatlarda (parallel)
+    rng = random.Random(seed)
+    by_region = defaultdict(list)
+    for path in paths:
+        by_region[path[0]].append(path)
+    regions = sorted(by_region)
+    busy = rng.sample(by_region[regions[0]], k=min(len(by_region[regions[0]]), admins // 2 + 2))
+    hot, targets = busy[0], busy[1:]
+    while len(targets) < admins:
+        targets.append(rng.choice(by_region[regions[1 + len(targets) % (len(regions) - 1)]]))
+    return hot, targets[:admins]
+
+
+def _spawn_app(workdir, api_url, port):
+    env = dict(os.environ, TELEGRAM_API_URL=api_url, PORT=str(port), PYTHONUNBUFFERED='1')
+    log = open(os.path.join(workdir, 'app.log'), 'w')
+    return subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'bot_with_admin.py')],
+                            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def _wait_ready(base_url, state, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(base_url + '/metrics', timeout=1)
+            if state.last_poll:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    return False
+
+
+async def run(args, state, base_url, data):
+    loop = asyncio.get_running_loop()
+    waiter = ResponseWaiter(loop)
+    state.listeners.append(waiter.on_response)
+    recorder = Recorder()
+    paths = _paths(data)
+    stop_at = time.time() + args.duration
+    started = time.time()
+    tasks = [bot_user(1000 + i, state, waiter, recorder, paths, stop_at, args.think, args.timeout)
+             for i in range(args.users)]
+    if args.edit_stress:
+        hot, targets = _stress_targets(paths, args.admins, args.seed)
+        initial = await _stress_initial(base_url, args.timeout, [hot] + targets)
+        applied = defaultdict(int)
+        stop_at = time.time() + args.duration
+        tasks += [edit_stress(i, base_url, recorder, targets, hot, stop_at, args.admin_think, args.timeout, applied)
+                  for i in range(args.admins)]
+    else:
+        tasks += [admin_writer(i, base_url, recorder, paths, stop_at, args.admin_think, args.timeout)
+                  for i in range(args.admins)]
+    await asyncio.gather(*tasks)
+    elapsed = time.time() - started
+    if args.edit_stress:
+        lost = await verify_stress(base_url, args.timeout, initial, applied)
+        recorder.stress = {'writes': sum(applied.values()), 'entities': len(initial), 'lost_updates': lost}
+    return recorder, elapsed
+
+
+def _summary(results, prefix):
+    rows = {k: v for k, v in results.items() if k.startswith(prefix)}
+    ok = sum(r['requests'] - r['errors'] for r in rows.values())
+    errors = sum(r['errors'] for r in rows.values())
+    return ok, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Mahalla yuklama sinovi")
+    parser.add_argument('--users', type=int, default=1000, help="bir vaqtdagi bot foydalanuvchilari")
+    parser.add_argument('--admins', type=int, default=3, help="bir vaqtdagi admin operatorlar")
+    parser.add_argument('--duration', type=float, default=30, help="sinov davomiyligi (soniya)")
+    parser.add_argument('--think', type=float, default=1.0, help="foydalanuvchi bosishlari orasidagi o'rtacha pauza")
+    parser.add_argument('--admin-think', type=float, default=0.5, help="admin amallari orasidagi o'rtacha pauza")
+    parser.add_argument('--timeout', type=float, default=15)
+    parser.add_argument('--mfy', type=int, default=9500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fake-port', type=int, default=8081)
+    parser.add_argument('--app-port', type=int, default=5055)
+    parser.add_argument('--target', help="ishlab turgan admin panel URL (ilova ishga tushirilmaydi)")
+    parser.add_argument('--telegram-limits', action='store_true', help="soxta API da 30/s va 1/s limitlarini yoqish")
+    parser.add_argument('--edit-stress', action='store_true',
+                        help="admin operatorlar bir xil yozuvlarni versiya bilan tahrirlaydi, oxirida yo'qolgan tahrirlar tekshiriladi")
+    parser.add_argument('--output', help="JSON hisobot fayli")
+    args = parser.parse_args()
+
+    limits = {'global_limit': 30, 'chat_limit': 1} if args.telegram_limits else {'global_limit': 0, 'chat_limit': 0}
+    server, state = fake_telegram_api.serve('127.0.0.1', args.fake_port, **limits)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f'http://127.0.0.1:{args.fake_port}/bot'
+
+    process = None
+    if args.target:
+        base_url = args.target.rstrip('/')
+        data_path = os.environ.get('LOADTEST_DATA', 'data.json')
+        with open(data_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    else:
+        workdir = tempfile.mkdtemp(prefix='smartmahalla-load-')
+        data = generate_data.generate(args.mfy, args.seed)
+        with open(os.path.join(workdir, 'data.json'), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"📁 {workdir}: {generate_data.summary(data)}")
+        base_url = f'http://127.0.0.1:{args.app_port}'
+        process = _spawn_app(workdir, api_url, args.app_port)
+
+    try:
+        print("⏳ Ilova va bot tayyor bo'lishini kutamiz...")
+        if not _wait_ready(base_url, state):
+            print("❌ Ilova ishga tushmadi (app.log ni tekshiring)")
+            sys.exit(1)
+        print(f"🚀 {args.users} ta foydalanuvchi, {args.admins} ta admin, {args.duration:.0f} soniya")
+        recorder, elapsed = asyncio.run(run(args, state, base_url, data))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        server.shutdown()
+
+    results = recorder.report(elapsed)
+    print(f"\n{'turi':<30} {'so`rov':>8} {'rps':>8} {'p50 ms':>9} {'p99 ms':>9} {'xato':>7}")
+    for kind, r in results.items():
+        p50 = f"{r['p50_ms']:.1f}" if r['p50_ms'] is not None else '-'
+        p99 = f"{r['p99_ms']:.1f}" if r['p99_ms'] is not None else '-'
+        print(f"{kind:<30} {r['requests']:>8} {r['throughput_rps']:>8.1f} {p50:>9} {p99:>9} {r['error_rate'] * 100:>6.2f}%")
+    for prefix, title in (('bot ', 'Bot'), ('admin ', 'Admin panel')):
+        ok, errors = _summary(results, prefix)
+        print(f"📊 {title}: {ok / elapsed:.1f} so'rov/s, {errors} ta xato")
+    for kind, r in results.items():
+        for sample in r['error_samples']:
+            print(f"   ⚠️ {kind}: {sample}")
+    print(f"🧪 Soxta API: {state.stats()['counters']}")
+    stress = getattr(recorder, 'stress', None)
+    if stress is not None:
+        if stress['lost_updates']:
+            print(f"❌ Yo'qolgan tahrirlar: {stress['lost_updates']}")
+        else:
+            print(f"✅ {stress['writes']} ta tahrir ({stress['entities']} ta yozuv) - yo'qolgan tahrir yo'q")
+
+    if args.output:
+        report = {'meta': {'users': args.users, 'admins': args.admins, 'duration': round(elapsed, 2),
+                           'mfy': args.mfy, 'telegram_limits': args.telegram_limits, 'target': base_url},
+                  'results': results, 'fake_api': state.stats(), 'edit_stress': getattr(recorder, 'stress', None)}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Hisobot: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# replica.py
+# O'zgarishlar lentasi o'quvchisi: admin paneldagi ma'lumotlarning mahalliy nusxasi (data.json formatida).
+#
+# Avval /api/changes/snapshot dan to'liq holat va uning raqami olinadi, keyin /api/changes?since=N
+# bilan faqat o'zgarishlar tortib turiladi. Lenta yetmasa (410) yoki ma'lumotlar tashqaridan almashtirilsa
+# (reset hodisasi) - snapshot qaytadan olinadi.
+#
+# Ishlatish (serverda CHANGES_TOKEN=... o'rnatilgan bo'lishi kerak):
+#   python replica.py --url http://127.0.0.1:5000 --token SECRET --output replica.json
+#   python replica.py --url http://127.0.0.1:5000 --token SECRET --once     # yetib olib, chiqish
+import argparse
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+# Yozuv yo'li darajalari (hodisa kalitlari) va har bir darajadagi ichki ro'yxat
+LEVELS = ('viloyat', 'tuman', 'mahalla', 'lavozim')
+CHILDREN = ('tumanlar', 'mfylar', 'xodimlar', None)
+
+
+class Resync(Exception):
+    """Lenta davom ettirib bo'lmaydi - snapshot qaytadan olinadi."""
+
+
+class FeedClient:
+    def __init__(self, url, token=None, timeout=25):
+        self.url = url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def _get(self, path, http_timeout):
+        req = urllib.request.Request(self.url + path, headers={'Accept-Encoding': 'identity'})
+        if self.token:
+            req.add_header('Authorization', f'Bearer {self.token}')
+        try:
+            with urllib.request.urlopen(req, timeout=http_timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 410:
+                raise Resync() from e
+            raise
+
+    def snapshot(self):
+        body = self._get('/api/changes/snapshot', 120)
+        return body['seq'], body['data']
+
+    def changes(self, since, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        body = self._get(f'/api/changes?since={since}&timeout={timeout}', timeout + 30)
+        return body['seq'], body['changes'], body.get('more', False)
+
+
+def _path(event):
+    return [event[level] for level in LEVELS if level in event]
+
+
+def _container(data, path, create=False):
+    """path dagi yozuvning ichki ro'yxati ({nomi: yozuv}); path=[] - viloyatlar. Topilmasa None."""
+    node = data
+    for depth, key in enumerate(path):
+        child = node.get(key)
+        if child is None:
+            if not create:
+                return None
+            child = node[key] = {}
+        node = child.setdefault(CHILDREN[depth], {})
+    return node
+
+
+def apply(data, event):
+    """Bitta hodisani nusxaga qo'llash."""
+    op = event['op']
+    if op == 'reset':
+        raise Resync()
+    path = _path(event)
+    parent = _container(data, path[:-1], create=(op == 'upsert'))
+    key = path[-1]
+    if op == 'delete':
+        if parent is not None:
+            parent.pop(key, None)
+    elif op == 'move':
+        if parent is not None and key in parent:
+            node = parent.pop(key)
+            target = _container(data, _path(event['to'])[:-1], create=True)
+            target[_path(event['to'])[-1]] = node
+    elif op == 'upsert':
+        # Hodisada yozuvning o'z maydonlari - ichki ro'yxat nusxadagidan qoladi
+        node = dict(event['data'])
+        child = CHILDREN[len(path) - 1]
+        if child is not None:
+            node[child] = (parent.get(key) or {}).get(child, {})
+        parent[key] = node
+
+
+def save(path, seq, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    print(f"💾 {path}: seq={seq}, {len(data)} ta viloyat")
+
+
+def sync(client, once=False, output=None):
+    """Snapshot + lenta. once=True - oxirgi hodisagacha yetib olib (seq, data) qaytaradi."""
+    while True:
+        seq, data = client.snapshot()
+        print(f"📥 Snapshot: seq={seq}, {len(data)} ta viloyat")
+        if output:
+            save(output, seq, data)
+        try:
+            while True:
+                seq_new, changes, more = client.changes(seq, timeout=0 if once else None)
+                for event in changes:
+                    apply(data, event)
+                if changes and output and not more:
+                    save(output, seq_new, data)
+                seq = seq_new
+                if once and not more:
+                    return seq, data
+        except Resync:
+            print("🔄 Lenta uzildi - snapshot qaytadan olinadi")
+            time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="O'zgarishlar lentasi bo'yicha mahalliy nusxa")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--token', default=os.environ.get('CHANGES_TOKEN'), help="serverdagi CHANGES_TOKEN")
+    parser.add_argument('--output', help="nusxa yoziladigan fayl (data.json formatida)")
+    parser.add_argument('--timeout', type=int, default=25, help="long-poll kutish vaqti (soniya)")
+    parser.add_argument('--once', action='store_true', help="oxirgi hodisagacha yetib olib chiqish")
+    args = parser.parse_args()
+
+    client = FeedClient(args.url, args.token, args.timeout)
+    try:
+        seq, data = sync(client, args.once, args.output)
+        print(f"✅ seq={seq}, {len(data)} ta viloyat")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()